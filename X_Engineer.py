@@ -1,417 +1,4444 @@
 import os
-import requests
+import sys
+import csv
+import ast
+import abc
+import argparse
 import json
+import math
+import mmap
+import base64
+import hashlib
 import time
 import re
+import ssl
+import random
+import asyncio
+import contextlib
+import functools
+import contextvars
+import difflib
+import filecmp
+import collections
+import shutil
+import tempfile
+import threading
+import weakref
+import multiprocessing
+import signal
+import socket
+import socketserver
+import uuid
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from urllib.parse import urlsplit, unquote
+from urllib.request import getproxies_environment, proxy_bypass_environment
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from email.utils import parsedate_to_datetime
 
-def call_grok_api(messages):
+# Optional parsers for validating generated TOML (Python 3.11+) and YAML (PyYAML) files
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# Maximum number of plan steps sent to the API concurrently by execute_plan.
+# Set X_ENGINEER_MAX_WORKERS=1 to run the plan strictly one step at a time.
+MAX_WORKERS = int(os.environ.get('X_ENGINEER_MAX_WORKERS', '4'))
+
+# Validation rules applied instead of the interactive confirmations in batch mode.
+BATCH_MAX_FILES = 500
+BATCH_MAX_STEPS = 300
+# Goal ids of a goals file name the project directories: one safe path component each.
+GOAL_ID_PATTERN = re.compile(r'[A-Za-z0-9_][\w.-]{0,127}')
+
+# Project files are shown to the AI as context if they are text: no NUL bytes and valid UTF-8 in
+# their first BINARY_SNIFF_BYTES bytes. Files above CONTEXT_MAX_FILE_BYTES are mapped into memory and
+# only their first and last CONTEXT_MAX_FILE_BYTES / 2 bytes are used.
+BINARY_SNIFF_BYTES = 8192
+CONTEXT_MAX_FILE_BYTES = int(os.environ.get('X_ENGINEER_CONTEXT_FILE_BYTES', str(64 * 1024)))
+# Directories never used as context: version control data, caches and installed dependencies.
+CONTEXT_SKIP_DIRECTORIES = frozenset((
+    '.git', '.hg', '.svn', '__pycache__', '.mypy_cache', '.pytest_cache', 'node_modules', '.venv', 'venv'
+))
+# Approximate number of tokens of project files included in a content prompt.
+# 0 includes every file in full.
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('X_ENGINEER_CONTEXT_TOKENS', '8000'))
+# Files scoring below this relevance are shown as a summary (signatures and docstrings only).
+FULL_CONTEXT_MIN_SCORE = 2.0
+# Words ignored by the lexical relevance score.
+STOP_WORDS = frozenset((
+    'the', 'and', 'for', 'with', 'that', 'this', 'from', 'into', 'in', 'to', 'of', 'a', 'an', 'is',
+    'it', 'on', 'as', 'be', 'by', 'or', 'are', 'add', 'write', 'implement', 'update', 'create',
+    'file', 'class', 'function', 'def', 'self', 'return', 'import', 'none', 'true', 'false', 'py'
+))
+
+API_KEY = os.environ.get('XAI_API_KEY', 'YOUR_API_KEY')  # Replace with your actual API key
+API_URL = 'https://api.x.ai/v1/chat/completions'
+MODEL = 'grok-beta'
+# Backend the API calls are sent to (see BACKENDS): 'openai' for the OpenAI-compatible endpoint
+# API_URL, 'local' for an offline stand-in answering with placeholder content, for tests and dry runs.
+BACKEND = os.environ.get('X_ENGINEER_BACKEND', 'openai')
+# Seconds the local backend waits before each answer, to simulate the model.
+LOCAL_BACKEND_LATENCY = float(os.environ.get('X_ENGINEER_LOCAL_LATENCY', '0'))
+# Every call has a route that selects its model: 'structure' and 'plan' for the first two calls,
+# 'small' for boilerplate files and 'large' for all other files. X_ENGINEER_MODELS maps routes
+# to cheaper and faster models, e.g. 'structure=grok-2-mini,small=grok-2-mini'; other routes use MODEL.
+MODEL_ROUTE_NAMES = ('structure', 'plan', 'small', 'large')
+MODEL_ROUTES = dict(route.split('=', 1) for route in os.environ.get('X_ENGINEER_MODELS', '').replace(' ', '').split(',') if '=' in route)
+# Files generated on the 'small' route: package markers, dependency lists, configuration and documentation.
+SMALL_FILE_NAMES = frozenset((
+    '__init__.py', '__main__.py', 'requirements.txt', '.gitignore', '.dockerignore', '.env.example',
+    'LICENSE', 'MANIFEST.in', 'setup.cfg', 'py.typed', 'Dockerfile', 'Makefile'
+))
+SMALL_FILE_EXTENSIONS = ('.md', '.rst', '.txt', '.cfg', '.ini', '.toml', '.yaml', '.yml', '.json', '.env')
+# Maximum number of pooled keep-alive connections, which is also the number of
+# requests in flight at the same time.
+HTTP_MAX_CONNECTIONS = 8
+# Seconds allowed for opening a connection and for a whole request respectively.
+HTTP_CONNECT_TIMEOUT = 10
+HTTP_TIMEOUT = 300
+# CA certificates for verifying HTTPS servers, as a file or a directory, in place of the system
+# ones. Proxies are taken from HTTP_PROXY, HTTPS_PROXY and NO_PROXY; only http:// proxies are supported.
+HTTP_CA_BUNDLE = (os.environ.get('X_ENGINEER_CA_BUNDLE') or os.environ.get('REQUESTS_CA_BUNDLE')
+                  or os.environ.get('CURL_CA_BUNDLE') or None)
+# Maximum number of API requests and tokens per minute across all threads and goals; 0 means unlimited.
+API_REQUESTS_PER_MINUTE = int(os.environ.get('X_ENGINEER_RPM', '0'))
+API_TOKENS_PER_MINUTE = int(os.environ.get('X_ENGINEER_TPM', '0'))
+# Retries of rate-limited (429), failing (5xx) and timed out requests, with jittered
+# exponential backoff between API_BACKOFF_BASE and API_BACKOFF_MAX seconds.
+API_MAX_RETRIES = 5
+API_BACKOFF_BASE = 1.0
+API_BACKOFF_MAX = 60.0
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# On-disk cache of API responses, keyed by a hash of the model, messages and parameters.
+# X_ENGINEER_CACHE selects the mode: 'on' reads and writes the cache, 'off' bypasses it and
+# 'replay' answers only from the cache and fails instead of calling the API.
+CACHE_MODE = os.environ.get('X_ENGINEER_CACHE', 'on')
+CACHE_DIR = os.environ.get('X_ENGINEER_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'x_engineer'))
+# Least recently used entries are evicted beyond this total size, and entries older than
+# CACHE_MAX_AGE seconds are discarded.
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+CACHE_MAX_AGE = 30 * 24 * 3600
+
+# Stream completions token by token and write file content to disk as it arrives.
+STREAMING = os.environ.get('X_ENGINEER_STREAM', '0') == '1'
+# Seconds between two progress reports of a streamed file.
+STREAM_PROGRESS_INTERVAL = 1.0
+
+# Maximum number of files generated by a single API call. execute_plan groups the steps writing
+# text files in the same directory; 1 generates every file with its own call.
+GENERATION_BATCH_FILES = int(os.environ.get('X_ENGINEER_BATCH_FILES', '1'))
+
+# create_directories creates the files of larger structures from a thread pool. This pays off
+# on network and other slow file systems; on a local disk a single thread is about as fast.
+MATERIALIZE_PARALLEL_FILES = 2000
+
+# Steps updating an existing file of at least PATCH_MIN_BYTES ask the AI for search/replace edits
+# instead of the whole file. The file is only regenerated in full if the edits do not apply.
+PATCH_UPDATES = os.environ.get('X_ENGINEER_PATCH', '1') == '1'
+PATCH_MIN_BYTES = 1024
+# Minimum similarity (difflib ratio) of the lines an edit replaces when they do not match exactly.
+PATCH_FUZZY_THRESHOLD = 0.85
+# Verbs (in any tense) marking a step as changing an existing file rather than writing it anew;
+# words that merely start with one, such as "address", "editor" or "fixtures", do not count.
+PATCH_STEP_PATTERN = re.compile(
+    r'\b(?:updat(?:e|es|ed|ing)|add(?:s|ed|ing)?|modif(?:y|ies|ied|ying)|edit(?:s|ed|ing)?|fix(?:es|ed|ing)?'
+    r'|extend(?:s|ed|ing)?|chang(?:e|es|ed|ing)|refactor(?:s|ed|ing)?|improv(?:e|es|ed|ing)|append(?:s|ed|ing)?)\b',
+    re.IGNORECASE
+)
+
+# While the user confirms the structure and the plan, the plan and up to PREFETCH_MAX_FILES files
+# likely to be written first are generated in the background (see SpeculativePrefetch). Off by
+# default: the calls are spent even if the user rejects the structure or the plan.
+PREFETCH = os.environ.get('X_ENGINEER_PREFETCH', '0') == '1'
+PREFETCH_MAX_FILES = 8
+# Names of the files prefetched: READMEs, package markers and entry points.
+PREFETCH_FILE_NAMES = frozenset((
+    'README.md', 'README.rst', 'README.txt', 'README', '__init__.py', '__main__.py',
+    'main.py', 'app.py', 'index.js', 'main.js', 'index.ts', 'main.ts'
+))
+
+# Files written by a step are checked in a process pool: Python files must compile and their
+# imports of project modules must resolve, JSON, TOML and YAML files must parse. A file that fails
+# is regenerated with the errors in the prompt, up to VALIDATION_MAX_REPAIRS times.
+VALIDATION = os.environ.get('X_ENGINEER_VALIDATE', '1') == '1'
+VALIDATION_MAX_REPAIRS = int(os.environ.get('X_ENGINEER_REPAIRS', '1'))
+VALIDATION_WORKERS = min(4, os.cpu_count() or 1)
+VALIDATED_EXTENSIONS = ('.py', '.json', '.toml', '.yaml', '.yml')
+
+# Service mode (--serve): a long-running process accepting generation jobs over a local HTTP API
+# on 'HOST:PORT' or on a Unix socket given as 'unix:PATH'. SERVICE_JOBS jobs run at the same time.
+SERVICE_ADDRESS = os.environ.get('X_ENGINEER_SERVICE', '127.0.0.1:8765')
+SERVICE_JOBS = int(os.environ.get('X_ENGINEER_SERVICE_JOBS', '2'))
+# Finished jobs kept for status queries; the oldest are forgotten, with their logs and metrics.
+SERVICE_MAX_FINISHED_JOBS = 200
+# Seconds a streamed job log waits for new output before checking the job again.
+SERVICE_LOG_POLL = 1.0
+
+class AsyncHTTPClient:
+    """
+    A minimal asyncio HTTP/1.1 client that keeps a pool of keep-alive connections to a single host.
+
+    Connections are reused across requests, so only the first requests pay for the TCP and
+    TLS handshakes. The pool size also caps the number of concurrent requests. The proxy of the
+    environment (see proxy_for_url) is used for the host unless NO_PROXY excludes it: plain HTTP
+    requests are sent to it in absolute form, HTTPS requests through a CONNECT tunnel.
+    """
+
+    def __init__(self, url, max_connections=HTTP_MAX_CONNECTIONS, connect_timeout=HTTP_CONNECT_TIMEOUT, timeout=HTTP_TIMEOUT):
+        """
+        Parameters:
+            url (str): Any URL on the host to connect to; only the scheme, host and port are used.
+            max_connections (int): Maximum number of open connections.
+            connect_timeout (float): Seconds allowed for opening a connection.
+            timeout (float): Seconds allowed for a whole request, including reading the body.
+        """
+        parts = urlsplit(url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        default_port = 443 if parts.scheme == 'https' else 80
+        self.port = parts.port or default_port
+        # IPv6 addresses are bracketed and non-default ports included, as in the URL
+        self.host_header = f'[{self.host}]' if ':' in self.host else self.host
+        if self.port != default_port:
+            self.host_header += f':{self.port}'
+        self.ssl_context = None
+        if parts.scheme == 'https':
+            if HTTP_CA_BUNDLE and os.path.isdir(HTTP_CA_BUNDLE):
+                self.ssl_context = ssl.create_default_context(capath=HTTP_CA_BUNDLE)
+            else:
+                self.ssl_context = ssl.create_default_context(cafile=HTTP_CA_BUNDLE)
+        self.proxy = proxy_for_url(url)
+        self.proxy_headers = {}
+        if self.proxy is not None and self.proxy.username:
+            credentials = f'{unquote(self.proxy.username)}:{unquote(self.proxy.password or "")}'
+            self.proxy_headers['Proxy-Authorization'] = 'Basic ' + base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.slots = asyncio.Semaphore(max(1, max_connections))
+        self.idle = []
+
+    async def open_connection(self):
+        try:
+            return await asyncio.wait_for(self.connect(), self.connect_timeout)
+        except (OSError, asyncio.IncompleteReadError) as e:
+            raise GrokAPIError(None, f"connection to {self.host} failed - {e}")
+
+    async def connect(self):
+        if self.proxy is None:
+            return await asyncio.open_connection(self.host, self.port, ssl=self.ssl_context)
+        reader, writer = await asyncio.open_connection(self.proxy.hostname, self.proxy.port or 80)
+        if self.ssl_context is None:
+            return reader, writer
+        try:
+            await self.open_tunnel(reader, writer)
+        except BaseException:
+            writer.close()
+            raise
+        return reader, writer
+
+    async def open_tunnel(self, reader, writer):
+        """
+        Asks the proxy for a tunnel to the host and starts TLS on it.
+        """
+        target = f'[{self.host}]:{self.port}' if ':' in self.host else f'{self.host}:{self.port}'
+        lines = [f'CONNECT {target} HTTP/1.1', f'Host: {target}']
+        lines.extend(f'{name}: {value}' for name, value in self.proxy_headers.items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        await writer.drain()
+        status_line = (await reader.readuntil(b'\r\n')).decode('latin-1')
+        while (await reader.readuntil(b'\r\n')) != b'\r\n':
+            pass
+        status = status_line.split(' ', 2)[1] if status_line.count(' ') else ''
+        if status != '200':
+            raise GrokAPIError(int(status) if status.isdigit() else None, f"proxy refused the tunnel to {target}: {status_line.strip()}")
+        if not hasattr(writer, 'start_tls'):
+            raise GrokAPIError(None, "HTTPS through a proxy requires Python 3.11 or later")
+        await writer.start_tls(self.ssl_context, server_hostname=self.host)
+
+    async def send_on_pool(self, method, path, body, headers):
+        """
+        Sends a request on an idle pooled connection or a new one and reads the response head.
+
+        Returns:
+            tuple: The reader, the writer, the status code, the response headers and whether
+                the connection can be reused once the body has been read.
+        """
+        while True:
+            reused = bool(self.idle)
+            reader, writer = self.idle.pop() if reused else await self.open_connection()
+            try:
+                status, response_headers, keep_alive = await self.send(reader, writer, method, path, body, headers)
+                return reader, writer, status, response_headers, keep_alive
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                writer.close()
+                # The server may have closed an idle connection; retry once on a fresh one
+                if reused:
+                    continue
+                raise GrokAPIError(None, f"connection to {self.host} failed - {e}")
+            except BaseException:
+                writer.close()
+                raise
+
+    async def stream(self, method, path, body=b'', headers=None):
+        """
+        Sends a request over a pooled connection and yields the response as it arrives.
+
+        The first item yielded is a (status, headers) tuple; every following item is a chunk
+        of the body (bytes). The timeout applies to each read rather than the whole response.
+
+        Parameters:
+            method (str): The HTTP method.
+            path (str): The request path including the query string.
+            body (bytes): The request body.
+            headers (dict): Additional request headers.
+        """
+        async with self.slots:
+            reader, writer, status, response_headers, keep_alive = await asyncio.wait_for(
+                self.send_on_pool(method, path, body, headers or {}), self.timeout
+            )
+            complete = False
+            try:
+                yield status, response_headers
+                chunks = self.read_chunks(reader, response_headers)
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                    except StopAsyncIteration:
+                        break
+                    yield chunk
+                complete = True
+            finally:
+                # A connection abandoned in the middle of a body cannot be reused
+                if complete and keep_alive:
+                    self.idle.append((reader, writer))
+                else:
+                    writer.close()
+
+    async def send(self, reader, writer, method, path, body, headers):
+        if self.proxy is not None and self.ssl_context is None:
+            # Plain HTTP through a proxy: the request names the whole URL
+            path = f'{self.scheme}://{self.host_header}{path}'
+            headers = {**self.proxy_headers, **headers}
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host_header}', f'Content-Length: {len(body)}', 'Connection: keep-alive']
+        lines.extend(f'{name}: {value}' for name, value in headers.items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+        status_line = await reader.readuntil(b'\r\n')
+        version, status = status_line.decode('latin-1').split(' ', 2)[:2]
+        response_headers = {}
+        while True:
+            line = (await reader.readuntil(b'\r\n')).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+        connection = response_headers.get('connection', '').lower()
+        keep_alive = connection != 'close' and (version != 'HTTP/1.0' or connection == 'keep-alive')
+        if 'chunked' not in response_headers.get('transfer-encoding', '').lower() and 'content-length' not in response_headers:
+            # Without a length the body ends when the server closes the connection
+            keep_alive = False
+        return int(status), response_headers, keep_alive
+
+    async def read_chunks(self, reader, headers):
+        """
+        Yields the body of a response as it arrives, decoding chunked transfer encoding.
+        """
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                if size == 0:
+                    # Skip trailers up to the final empty line
+                    while (await reader.readuntil(b'\r\n')) != b'\r\n':
+                        pass
+                    return
+                yield await reader.readexactly(size)
+                await reader.readexactly(2)
+        elif 'content-length' in headers:
+            remaining = int(headers['content-length'])
+            while remaining:
+                chunk = await reader.read(min(remaining, 65536))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b'', remaining)
+                remaining -= len(chunk)
+                yield chunk
+        else:
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    return
+                yield chunk
+
+    async def close(self):
+        """
+        Closes every idle connection in the pool.
+        """
+        while self.idle:
+            reader, writer = self.idle.pop()
+            writer.close()
+
+def proxy_for_url(url):
+    """
+    Returns the proxy of the environment for a URL: HTTPS_PROXY or HTTP_PROXY (also in lower
+    case) by the scheme of the URL, unless the host is listed in NO_PROXY.
+
+    Parameters:
+        url (str): The URL.
+
+    Returns:
+        urllib.parse.SplitResult: The parsed proxy URL, or None for a direct connection.
+    """
+    parts = urlsplit(url)
+    proxies = getproxies_environment()
+    proxy = proxies.get(parts.scheme)
+    if not proxy or proxy_bypass_environment(parts.hostname, proxies):
+        return None
+    if '://' not in proxy:
+        proxy = 'http://' + proxy
+    proxy_parts = urlsplit(proxy)
+    if proxy_parts.scheme != 'http':
+        raise Exception(f"Error: unsupported proxy {proxy}: only http:// proxies are supported")
+    return proxy_parts
+
+class RateLimiter:
+    """
+    A token bucket shared by every thread and event loop.
+
+    Callers reserve a token and sleep for the returned delay, so waiting requests queue up in
+    order without holding a lock while they sleep.
+    """
+
+    def __init__(self, per_minute):
+        """
+        Parameters:
+            per_minute (float): Sustained rate; the bucket holds at most this many tokens.
+        """
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount=1):
+        """
+        Takes tokens from the bucket, going into debt if it is empty.
+
+        Parameters:
+            amount (float): The number of tokens to take.
+
+        Returns:
+            float: Seconds to wait before the tokens are actually available.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+class AdaptiveConcurrencyLimit:
+    """
+    Caps the number of API requests in flight, across all threads and event loops.
+
+    The cap is halved when the API answers 429 (at most once per second) and grows by one
+    after as many successful requests as the current cap, up to the configured maximum.
+    """
+
+    def __init__(self, maximum):
+        """
+        Parameters:
+            maximum (int): The largest allowed cap, and the initial one.
+        """
+        self.maximum = max(1, maximum)
+        self.limit = self.maximum
+        self.in_flight = 0
+        self.successes = 0
+        self.last_decrease = 0.0
+        self.waiters = collections.deque()
+        self.lock = threading.Lock()
+
+    async def acquire(self):
+        """
+        Waits for a free request slot.
+        """
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            if self.in_flight < self.limit and not self.waiters:
+                self.in_flight += 1
+                return
+            future = loop.create_future()
+            self.waiters.append((loop, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self.lock:
+                if (loop, future) in self.waiters:
+                    self.waiters.remove((loop, future))
+                    raise
+            # The slot was granted just before the cancellation; give it back
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        """
+        Frees a request slot.
+        """
+        with self.lock:
+            self.in_flight -= 1
+            self.wake()
+
+    def wake(self):
+        # Called with the lock held: hand free slots to waiters in arrival order
+        while self.waiters and self.in_flight < self.limit:
+            loop, future = self.waiters.popleft()
+            self.in_flight += 1
+            loop.call_soon_threadsafe(self.grant, future)
+
+    def grant(self, future):
+        if future.done():
+            # The waiter was cancelled; pass the slot on
+            self.release()
+        else:
+            future.set_result(None)
+
+    def record(self, throttled):
+        """
+        Adapts the cap to the outcome of a request.
+
+        Parameters:
+            throttled (bool): Whether the API answered 429.
+        """
+        with self.lock:
+            if throttled:
+                now = time.monotonic()
+                if now - self.last_decrease >= 1.0:
+                    self.limit = max(1, self.limit // 2)
+                    self.last_decrease = now
+                self.successes = 0
+            else:
+                self.successes += 1
+                if self.successes >= self.limit and self.limit < self.maximum:
+                    self.limit += 1
+                    self.successes = 0
+                    self.wake()
+
+class GrokAPIError(Exception):
+    """
+    An error response, or a failure to get a response, from the API.
+    """
+
+    def __init__(self, status, text, retry_after=None):
+        """
+        Parameters:
+            status (int): The HTTP status, or None if no response was received.
+            text (str): The response body or the error description.
+            retry_after (float): Seconds the server asked to wait before retrying, if any.
+        """
+        super().__init__(f"Error: {status} - {text}" if status is not None else f"Error: {text}")
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        return self.status is None or self.status in RETRY_STATUSES
+
+def parse_retry_after(headers):
+    """
+    Reads the Retry-After header of a response.
+
+    Parameters:
+        headers (dict): The response headers with lower-case names.
+
+    Returns:
+        float: Seconds to wait, or None if the header is missing or invalid.
+    """
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+# Tags attached to the metrics of the API calls made in the current context, e.g. the phase.
+CALL_TAGS = contextvars.ContextVar('x_engineer_call_tags', default={})
+
+@contextlib.contextmanager
+def call_tags(**tags):
+    """
+    Tags the API calls made inside the block, e.g. call_tags(phase='plan').
+
+    Parameters:
+        **tags: The tags to add to the current ones.
+    """
+    token = CALL_TAGS.set({**CALL_TAGS.get(), **tags})
+    try:
+        yield
+    finally:
+        CALL_TAGS.reset(token)
+
+def set_call_tag(name, value):
+    """
+    Sets a tag for the rest of the current call_tags block.
+
+    Parameters:
+        name (str): The tag name.
+        value: The tag value.
+    """
+    CALL_TAGS.set({**CALL_TAGS.get(), name: value})
+
+class MetricsRecorder:
+    """
+    Collects one record per API call: wall time, time to first token, token counts, context size and tags.
+    """
+
+    FIELDS = ('run', 'phase', 'model', 'started', 'wall_time', 'ttft', 'prompt_tokens', 'completion_tokens',
+              'context_bytes', 'prefix_ratio', 'cached_tokens', 'cached', 'streamed', 'retries', 'status', 'error')
+
+    def __init__(self):
+        self.records = []
+        self.stages = {}
+        self.active = threading.local()
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Adds the time spent in the block to a local processing stage such as 'context',
+        'parsing', 'file_io' or 'validation'. Nested blocks of the same stage are counted once.
+
+        Parameters:
+            name (str): The stage name.
+        """
+        active = self.active.__dict__
+        if active.get(name):
+            yield
+            return
+        active[name] = True
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            active[name] = False
+            with self.lock:
+                calls, seconds = self.stages.get(name, (0, 0.0))
+                self.stages[name] = (calls + 1, seconds + elapsed)
+
+    def stage_times(self):
+        """
+        Returns the time spent in each local processing stage, summed over all threads.
+
+        Returns:
+            dict: A mapping from stage name to (number of blocks, seconds).
+        """
+        with self.lock:
+            return dict(self.stages)
+
+    def reset(self):
+        """
+        Discards all records and stage times.
+        """
+        with self.lock:
+            self.records = []
+            self.stages = {}
+
+    def record(self, **fields):
+        """
+        Records an API call. The current call tags fill in 'run', 'phase', 'context_bytes' and 'prefix_ratio'.
+
+        Parameters:
+            **fields: Values for the FIELDS of the record.
+        """
+        tags = CALL_TAGS.get()
+        record = {name: None for name in self.FIELDS}
+        record.update(run=tags.get('run'), phase=tags.get('phase', 'other'), context_bytes=tags.get('context_bytes'),
+                      prefix_ratio=tags.get('prefix_ratio'))
+        record.update(fields)
+        with self.lock:
+            self.records.append(record)
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.records)
+
+    def forget(self, runs):
+        """
+        Discards the records of the given runs.
+
+        Parameters:
+            runs (set): The 'run' tags of the records to discard.
+        """
+        with self.lock:
+            self.records = [record for record in self.records if record['run'] not in runs]
+
+    def export(self, path):
+        """
+        Writes the records to a .csv file, or to a JSON file for any other extension.
+
+        Parameters:
+            path (str): The output file.
+        """
+        records = self.snapshot()
+        if path.lower().endswith('.csv'):
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=self.FIELDS)
+                writer.writeheader()
+                writer.writerows(records)
+        else:
+            write_file_atomic(path, json.dumps(records, indent=4))
+
+    def summary(self, top=5):
+        """
+        Summarizes the records: totals per phase and per model, the slowest steps and the biggest prompts.
+
+        Parameters:
+            top (int): Number of entries in the slowest and biggest lists.
+
+        Returns:
+            list: The summary lines.
+        """
+        records = self.snapshot()
+        if not records:
+            return []
+        lines = []
+        cached = sum(1 for record in records if record['cached'])
+        lines.append(f"API calls: {len(records)} ({cached} from cache), "
+                     f"{sum(record['wall_time'] or 0 for record in records):.1f}s total, "
+                     f"{sum(record['prompt_tokens'] or 0 for record in records)} prompt tokens, "
+                     f"{sum(record['completion_tokens'] or 0 for record in records)} completion tokens")
+        measured = [record for record in records if record['prefix_ratio'] is not None]
+        if measured:
+            size = sum(record['prompt_tokens'] or 1 for record in measured)
+            shared = sum(record['prefix_ratio'] * (record['prompt_tokens'] or 1) for record in measured)
+            provider_cached = sum(record['cached_tokens'] or 0 for record in records)
+            lines.append(f"Prompt prefixes shared with earlier prompts: {shared / size:.0%} of the prompts"
+                         + (f", {provider_cached} prompt tokens cached by the provider" if provider_cached else ''))
+        phases = {}
+        for record in records:
+            name = 'step' if str(record['phase']).startswith('step ') else record['phase']
+            calls, seconds = phases.get(name, (0, 0.0))
+            phases[name] = (calls + 1, seconds + (record['wall_time'] or 0))
+        for name, (calls, seconds) in phases.items():
+            lines.append(f"  {name}: {calls} call(s), {seconds:.1f}s")
+        models = {}
+        for record in records:
+            calls, seconds = models.get(record['model'], (0, 0.0))
+            models[record['model']] = (calls + 1, seconds + (record['wall_time'] or 0))
+        if len(models) > 1:
+            for name, (calls, seconds) in models.items():
+                lines.append(f"  model {name}: {calls} call(s), {seconds:.1f}s")
+        for name, (calls, seconds) in sorted(self.stage_times().items()):
+            lines.append(f"  local {name}: {seconds:.3f}s")
+        lines.append("Slowest calls:")
+        for record in sorted(records, key=lambda record: -(record['wall_time'] or 0))[:top]:
+            ttft = f", first token after {record['ttft']:.2f}s" if record['ttft'] is not None else ''
+            lines.append(f"  {record['phase']}: {record['wall_time']:.2f}s{ttft}")
+        lines.append("Biggest prompts:")
+        for record in sorted(records, key=lambda record: -(record['prompt_tokens'] or record['context_bytes'] or 0))[:top]:
+            lines.append(f"  {record['phase']}: {record['prompt_tokens'] or '?'} prompt tokens, "
+                         f"{record['context_bytes'] or 0} bytes of project context")
+        return lines
+
+METRICS = MetricsRecorder()
+
+# Number of recent prompts with the same system message a new prompt is compared with.
+PREFIX_TRACKED_PROMPTS = 16
+
+class PromptPrefixTracker:
+    """
+    Estimates how much of each prompt a provider-side prompt cache can reuse: the share of the
+    prompt that it has in common with the start of one of the recent prompts with the same system message.
+    """
+
+    def __init__(self, size=PREFIX_TRACKED_PROMPTS):
+        """
+        Parameters:
+            size (int): Number of recent prompts kept per system message.
+        """
+        self.size = size
+        self.recent = {}
+        self.lock = threading.Lock()
+
+    def observe(self, messages):
+        """
+        Records a prompt and measures its prefix shared with the recent prompts.
+
+        Parameters:
+            messages (list): A list of message dictionaries for the API.
+
+        Returns:
+            float: The shared share of the prompt's characters, from 0 to 1.
+        """
+        prompt = json.dumps(messages)
+        system = messages[0].get('content', '') if messages else ''
+        with self.lock:
+            recent = self.recent.setdefault(system, collections.deque(maxlen=self.size))
+            earlier = list(recent)
+            recent.append(prompt)
+        shared = max((common_prefix_length(prompt, other) for other in earlier), default=0)
+        return shared / len(prompt) if prompt else 0.0
+
+PROMPT_PREFIXES = PromptPrefixTracker()
+
+def common_prefix_length(first, second):
+    """
+    Returns the length of the longest common prefix of two strings.
+
+    Parameters:
+        first (str): The first string.
+        second (str): The second string.
+
+    Returns:
+        int: The number of leading characters the strings have in common.
+    """
+    low, high = 0, min(len(first), len(second))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if first[:middle] == second[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+def cached_prompt_tokens(usage):
+    """
+    Returns the number of prompt tokens the provider served from its prompt cache, if reported.
+
+    Parameters:
+        usage (dict): The usage of a response.
+
+    Returns:
+        int: The number of cached prompt tokens, or None.
+    """
+    return (usage.get('prompt_tokens_details') or {}).get('cached_tokens')
+
+_rate_limiters = {}
+_concurrency_limit = None
+
+def get_rate_limiter(name, per_minute):
+    with _http_clients_lock:
+        limiter = _rate_limiters.get(name)
+        if limiter is None or limiter.capacity != per_minute:
+            limiter = _rate_limiters[name] = RateLimiter(per_minute)
+        return limiter
+
+def get_concurrency_limit():
+    """
+    Returns the shared adaptive concurrency limit, created with HTTP_MAX_CONNECTIONS as its maximum.
+
+    Returns:
+        AdaptiveConcurrencyLimit: The limit.
+    """
+    global _concurrency_limit
+    with _http_clients_lock:
+        if _concurrency_limit is None:
+            _concurrency_limit = AdaptiveConcurrencyLimit(HTTP_MAX_CONNECTIONS)
+        return _concurrency_limit
+
+async def wait_for_rate_limit(tokens=0):
+    """
+    Waits until the global request and token rate limits allow another request.
+
+    Parameters:
+        tokens (int): The estimated number of tokens the request will use.
+    """
+    delay = 0.0
+    if API_REQUESTS_PER_MINUTE > 0:
+        delay = max(delay, get_rate_limiter('requests', API_REQUESTS_PER_MINUTE).reserve(1))
+    if API_TOKENS_PER_MINUTE > 0 and tokens:
+        delay = max(delay, get_rate_limiter('tokens', API_TOKENS_PER_MINUTE).reserve(tokens))
+    if delay:
+        await asyncio.sleep(delay)
+
+def charge_tokens(tokens):
+    """
+    Corrects the token rate limit once the actual usage of a request is known.
+
+    Parameters:
+        tokens (int): Tokens used beyond the estimate (negative to give tokens back).
+    """
+    if API_TOKENS_PER_MINUTE > 0 and tokens:
+        get_rate_limiter('tokens', API_TOKENS_PER_MINUTE).reserve(tokens)
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Computes the delay before a retry: full-jitter exponential backoff, but never shorter than Retry-After.
+
+    Parameters:
+        attempt (int): The number of the retry, starting at 0.
+        retry_after (float): Seconds the server asked to wait, if any.
+
+    Returns:
+        float: Seconds to wait.
+    """
+    delay = random.uniform(0, min(API_BACKOFF_MAX, API_BACKOFF_BASE * 2 ** attempt))
+    return max(delay, retry_after or 0.0)
+
+async def with_retries(attempt, stats=None):
+    """
+    Runs an API request, retrying it on retryable errors and timeouts.
+
+    Parameters:
+        attempt (callable): A coroutine function making one attempt of the request.
+        stats (dict): If given, its 'retries' entry is set to the number of retries made.
+
+    Returns:
+        The result of the first successful attempt.
+    """
+    for retry in range(API_MAX_RETRIES + 1):
+        if stats is not None:
+            stats['retries'] = retry
+        try:
+            return await attempt()
+        except GrokAPIError as e:
+            if not e.retryable or retry == API_MAX_RETRIES:
+                raise
+            delay = backoff_delay(retry, e.retry_after)
+            print(f"API request failed ({e}); retrying in {delay:.1f}s")
+        except asyncio.TimeoutError:
+            if retry == API_MAX_RETRIES:
+                raise GrokAPIError(None, "request timed out")
+            delay = backoff_delay(retry)
+            print(f"API request timed out; retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+_http_clients = weakref.WeakKeyDictionary()
+_http_clients_lock = threading.Lock()
+_sync_loop = None
+
+def get_http_client(url=None):
+    """
+    Returns the pooled HTTP client of the running event loop for an endpoint, creating it on first use.
+
+    Parameters:
+        url (str): The endpoint; API_URL if not given.
+
+    Returns:
+        AsyncHTTPClient: The client for the endpoint.
+    """
+    url = url or API_URL
+    loop = asyncio.get_running_loop()
+    with _http_clients_lock:
+        clients = _http_clients.setdefault(loop, {})
+        client = clients.get(url)
+        if client is None:
+            client = clients[url] = AsyncHTTPClient(url, HTTP_MAX_CONNECTIONS, HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT)
+        return client
+
+def configure_client(url=None, api_key=None, model=None, max_connections=None, connect_timeout=None, timeout=None):
+    """
+    Changes the API settings. Existing connection pools are dropped and rebuilt on the next call.
+
+    Parameters:
+        url (str): The chat completions endpoint, e.g. a local stub server for testing.
+        api_key (str): The API key.
+        model (str): The model name.
+        max_connections (int): Maximum number of pooled connections and concurrent requests.
+        connect_timeout (float): Seconds allowed for opening a connection.
+        timeout (float): Seconds allowed for a whole request.
+    """
+    global API_URL, API_KEY, MODEL, HTTP_MAX_CONNECTIONS, HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT, _concurrency_limit
+    API_URL = url or API_URL
+    API_KEY = api_key or API_KEY
+    MODEL = model or MODEL
+    HTTP_MAX_CONNECTIONS = max_connections or HTTP_MAX_CONNECTIONS
+    HTTP_CONNECT_TIMEOUT = connect_timeout or HTTP_CONNECT_TIMEOUT
+    HTTP_TIMEOUT = timeout or HTTP_TIMEOUT
+    with _http_clients_lock:
+        clients = list(_http_clients.items())
+        _http_clients.clear()
+        _concurrency_limit = None
+    for loop, loop_clients in clients:
+        for client in loop_clients.values():
+            if loop.is_running():
+                asyncio.run_coroutine_threadsafe(client.close(), loop)
+            elif not loop.is_closed():
+                loop.run_until_complete(client.close())
+
+def run_sync(coroutine):
+    """
+    Runs a coroutine on a shared background event loop and waits for its result.
+    All synchronous callers, from any thread, share that loop and its connection pool.
+
+    Parameters:
+        coroutine: The coroutine to run.
+
+    Returns:
+        The result of the coroutine.
+    """
+    return run_in_background(coroutine).result()
+
+def run_in_background(coroutine):
+    """
+    Starts a coroutine on the shared background event loop without waiting for it.
+
+    Parameters:
+        coroutine: The coroutine to run.
+
+    Returns:
+        concurrent.futures.Future: The future of the result; cancelling it cancels the coroutine.
+    """
+    global _sync_loop
+    with _http_clients_lock:
+        if _sync_loop is None:
+            _sync_loop = asyncio.new_event_loop()
+            threading.Thread(target=_sync_loop.run_forever, name='x-engineer-http', daemon=True).start()
+    tags = CALL_TAGS.get()
+
+    async def in_caller_context():
+        # Carry the caller's metric tags over to the loop thread
+        CALL_TAGS.set(tags)
+        return await coroutine
+
+    return asyncio.run_coroutine_threadsafe(in_caller_context(), _sync_loop)
+
+class ResponseCache:
+    """
+    A content-addressed on-disk cache of API responses with LRU eviction.
+
+    Each entry is a JSON file named after the sha256 of the request. Reading an entry updates
+    its modification time, which is used as the recency for eviction.
+    """
+
+    def __init__(self, directory, max_bytes=CACHE_MAX_BYTES, max_age=CACHE_MAX_AGE):
+        """
+        Parameters:
+            directory (str): The cache directory.
+            max_bytes (int): Maximum total size of the cache files.
+            max_age (float): Maximum age of an entry in seconds.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        # Size written since the last eviction; eviction scans the directory only now and then
+        self.written = 0
+
+    @staticmethod
+    def key(request):
+        """
+        Computes the cache key of a request.
+
+        Parameters:
+            request (dict): The request data; the streaming options do not affect the key.
+
+        Returns:
+            str: The hex sha256 of the canonical JSON of the request.
+        """
+        request = {name: value for name, value in request.items() if name not in ('stream', 'stream_options')}
+        return hashlib.sha256(json.dumps(request, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.json')
+
+    def get(self, key):
+        """
+        Looks up a cached response.
+
+        Parameters:
+            key (str): The cache key.
+
+        Returns:
+            dict: The cached API response, or None on a miss. Unreadable and malformed entries,
+                e.g. truncated or written by another version, count as misses and are overwritten by put.
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            created, response = entry['created'], entry['response']
+            if not isinstance(response['choices'][0]['message']['content'], str):
+                return None
+            expired = time.time() - created > self.max_age
+        except (OSError, ValueError, LookupError, TypeError):
+            return None
+        if expired:
+            self.remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return response
+
+    def put(self, key, response):
+        """
+        Stores an API response.
+
+        Parameters:
+            key (str): The cache key.
+            response (dict): The API response.
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps({'created': time.time(), 'response': response})
+        write_file_atomic(path, data)
+        with self.lock:
+            self.written += len(data)
+            due = self.written > self.max_bytes // 16
+            if due:
+                self.written = 0
+        if due:
+            self.evict()
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """
+        Removes expired entries, then the least recently used ones until the cache fits in max_bytes.
+        """
+        entries = []
+        now = time.time()
+        for root, dirs, files in os.walk(self.directory):
+            for filename in files:
+                if not filename.endswith('.json'):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if now - stat.st_mtime > self.max_age:
+                    self.remove(path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self.remove(path)
+            total -= size
+
+_response_cache = None
+
+def get_response_cache():
+    """
+    Returns the shared response cache, creating it on first use.
+
+    Returns:
+        ResponseCache: The cache in CACHE_DIR.
+    """
+    global _response_cache
+    with _http_clients_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(CACHE_DIR, CACHE_MAX_BYTES, CACHE_MAX_AGE)
+        return _response_cache
+
+def configure_cache(mode=None, directory=None, max_bytes=None, max_age=None):
+    """
+    Changes the response cache settings.
+
+    Parameters:
+        mode (str): 'on', 'off' (bypass the cache) or 'replay' (offline, cache only).
+        directory (str): The cache directory.
+        max_bytes (int): Maximum total size of the cache.
+        max_age (float): Maximum age of an entry in seconds.
+    """
+    global CACHE_MODE, CACHE_DIR, CACHE_MAX_BYTES, CACHE_MAX_AGE, _response_cache
+    if mode not in (None, 'on', 'off', 'replay'):
+        raise ValueError(f"Unknown cache mode: {mode}")
+    CACHE_MODE = mode or CACHE_MODE
+    CACHE_DIR = directory or CACHE_DIR
+    CACHE_MAX_BYTES = max_bytes or CACHE_MAX_BYTES
+    CACHE_MAX_AGE = max_age or CACHE_MAX_AGE
+    with _http_clients_lock:
+        _response_cache = None
+
+class ModelBackend(abc.ABC):
+    """
+    Base class of the backends answering the chat completion requests of async_call_grok_api and
+    async_stream_grok_api. A request is a payload in the OpenAI format with 'messages', 'model'
+    and 'stream', and so are the answers. Subclasses implement complete and stream.
+    """
+
+    name = None
+    # Whether the answers of the backend are stored in and served from the response cache.
+    cacheable = True
+
+    @abc.abstractmethod
+    async def complete(self, data, stats):
+        """
+        Sends a request and waits for the whole answer.
+
+        Parameters:
+            data (dict): The request payload.
+            stats (dict): Its 'retries' entry is set to the number of retries made, and its
+                'first_byte' entry to the time.perf_counter() value when the answer started.
+
+        Returns:
+            dict: The response, with the content in choices[0].message and the token counts in usage.
+        """
+
+    @abc.abstractmethod
+    def stream(self, data, stats):
+        """
+        Sends a request with streaming enabled. Implemented as an async generator.
+
+        Parameters:
+            data (dict): The request payload.
+            stats (dict): Its 'retries' entry is set to the number of retries made.
+
+        Yields:
+            dict: The completion chunks, with a piece of the content in choices[0].delta and,
+            in the last one, the token counts in usage.
+        """
+
+class OpenAICompatibleBackend(ModelBackend):
+    """
+    An OpenAI-compatible chat completions endpoint, such as the xAI API, reached through the
+    pooled HTTP client of the running loop with the shared rate limits, concurrency limit and retries.
+    """
+
+    name = 'openai'
+
+    def __init__(self, url=None, api_key=None):
+        """
+        Parameters:
+            url (str): The chat completions endpoint; API_URL if not given.
+            api_key (str): The API key; API_KEY if not given.
+        """
+        self.url = url
+        self.api_key = api_key
+
+    def target(self, stream):
+        """
+        Returns the endpoint of a request, its path and its headers.
+
+        Parameters:
+            stream (bool): Whether the request streams the answer.
+
+        Returns:
+            tuple: The URL, the request path and the headers.
+        """
+        url = self.url or API_URL
+        parts = urlsplit(url)
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {self.api_key or API_KEY}'
+        }
+        if stream:
+            headers['Accept'] = 'text/event-stream'
+        return url, parts.path + (f'?{parts.query}' if parts.query else ''), headers
+
+    async def complete(self, data, stats):
+        url, path, headers = self.target(False)
+        body = json.dumps(data).encode('utf-8')
+        estimated_tokens = estimate_tokens(json.dumps(data['messages']))
+
+        async def attempt():
+            await wait_for_rate_limit(estimated_tokens)
+            limit = get_concurrency_limit()
+            await limit.acquire()
+            try:
+                response = get_http_client(url).stream('POST', path, body, headers)
+                try:
+                    status, response_headers = await response.__anext__()
+                    stats['first_byte'] = time.perf_counter()
+                    response_body = b''.join([chunk async for chunk in response])
+                finally:
+                    await response.aclose()
+            finally:
+                limit.release()
+            limit.record(status == 429)
+            if status != 200:
+                raise GrokAPIError(status, response_body.decode('utf-8', 'replace'), parse_retry_after(response_headers))
+            return json.loads(response_body)
+
+        result = await with_retries(attempt, stats)
+        charge_tokens((result.get('usage') or {}).get('total_tokens', estimated_tokens) - estimated_tokens)
+        return result
+
+    async def stream(self, data, stats):
+        url, path, headers = self.target(True)
+        body = json.dumps(data).encode('utf-8')
+        estimated_tokens = estimate_tokens(json.dumps(data['messages']))
+        limit = get_concurrency_limit()
+
+        async def attempt():
+            # Only opening the stream is retried; the slot is held until the stream is consumed
+            await wait_for_rate_limit(estimated_tokens)
+            await limit.acquire()
+            try:
+                response = get_http_client(url).stream('POST', path, body, headers)
+                status, response_headers = await response.__anext__()
+                limit.record(status == 429)
+                if status != 200:
+                    error_body = b''.join([chunk async for chunk in response])
+                    raise GrokAPIError(status, error_body.decode('utf-8', 'replace'), parse_retry_after(response_headers))
+                return response
+            except BaseException:
+                limit.release()
+                raise
+
+        response = await with_retries(attempt, stats)
+        usage = {}
+        completion_size = 0
+        try:
+            async for event in iter_sse_events(response):
+                usage = event.get('usage') or usage
+                for choice in event.get('choices') or ():
+                    completion_size += len((choice.get('delta') or {}).get('content') or '')
+                yield event
+        finally:
+            await response.aclose()
+            limit.release()
+            charge_tokens(usage.get('total_tokens', estimated_tokens + completion_size // 4) - estimated_tokens)
+
+class LocalBackend(ModelBackend):
+    """
+    An offline stand-in for the model, for tests and dry runs without an API key. It recognizes
+    the prompts of X_Engineer and answers them in the expected format: a small project structure,
+    one plan step per file, and placeholder files that pass validate_file. Subclasses answer with
+    other projects by overriding structure, plan and content, as the mock server of benchmark.py does.
+    """
+
+    name = 'local'
+    cacheable = False
+
+    def __init__(self, latency=None):
+        """
+        Parameters:
+            latency (float): Seconds each answer is delayed by, to simulate the model; LOCAL_BACKEND_LATENCY if not given.
+        """
+        self.latency = LOCAL_BACKEND_LATENCY if latency is None else latency
+
+    def answer(self, messages):
+        """
+        Returns the answer to a prompt.
+
+        Parameters:
+            messages (list): The messages of the request.
+
+        Returns:
+            str: The content of the answer.
+        """
+        system, user = messages[0]['content'], messages[-1]['content']
+        if 'detailed plan' in system:
+            text = user.split('Project Directory Structure:\n', 1)[-1]
+            return self.plan(json.JSONDecoder().raw_decode(text)[0])
+        if 'directory structure' in system:
+            return '```\n' + json.dumps(self.structure(quoted_text(user, 'Goal:\n') or 'project'), indent=4) + '\n```'
+        if '### FILE:' in system:
+            files = re.findall(r'^\d+\. File "([^"]+)": (.*)$', user, re.MULTILINE)
+            return ''.join(f'### FILE: {path}\n```\n{self.content(path, step)}```\n\n' for path, step in files)
+        step = quoted_text(user, 'following step:\n\n') or ''
+        if 'SEARCH' in system:
+            path = re.search(r'Please change the file (.+?) for the following step', user).group(1)
+            content = self.content(path, step)
+            # Data files cannot take an appended line; no edits makes the step rewrite the file
+            return f'<<<<<<< SEARCH\n=======\n{content}>>>>>>> REPLACE\n' if content != '{}\n' else 'No changes.'
+        if 'does not pass validation' in system:
+            path = re.search(r'Current content of (.+?):\n', user).group(1)
+        else:
+            names = FILE_NAME_PATTERN.findall(step)
+            path = names[0] if names else ''
+        return '```\n' + self.content(path, step) + '```'
+
+    def structure(self, goal):
+        """
+        Returns the project structure for a goal.
+
+        Parameters:
+            goal (str): The user's goal description.
+
+        Returns:
+            dict: The project structure, with a top-level directory named after the goal.
+        """
+        name = re.sub(r'\W+', '_', ' '.join(goal.lower().split()[:3])).strip('_') or 'project'
+        return {name: {'README.md': {}, 'requirements.txt': {}, 'main.py': {},
+                       'app': {'__init__.py': {}, 'core.py': {}}}}
+
+    def plan(self, structure):
+        """
+        Returns the plan for a project structure: one step per file.
+
+        Parameters:
+            structure (dict): The project structure given in the prompt.
+
+        Returns:
+            str: A numbered plan.
+        """
+        if len(structure) == 1 and isinstance(next(iter(structure.values())), dict):
+            structure = next(iter(structure.values()))
+        return '\n'.join(f'{number}. Write the content of {path.replace(os.sep, "/")}'
+                         for number, path in enumerate(as_tree(structure).files(), 1))
+
+    def content(self, path, step):
+        """
+        Returns the content of a file written by a step.
+
+        Parameters:
+            path (str): The path of the file.
+            step (str): The step writing the file.
+
+        Returns:
+            str: The content, ending with a newline.
+        """
+        return placeholder_content(path, step)
+
+    def usage(self, data, text):
+        prompt_tokens = estimate_tokens(json.dumps(data['messages']))
+        completion_tokens = estimate_tokens(text)
+        return {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens}
+
+    async def complete(self, data, stats):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        stats['first_byte'] = time.perf_counter()
+        text = self.answer(data['messages'])
+        return {'choices': [{'message': {'role': 'assistant', 'content': text}}], 'usage': self.usage(data, text)}
+
+    async def stream(self, data, stats):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        text = self.answer(data['messages'])
+        for i in range(0, len(text), 64):
+            yield {'choices': [{'delta': {'content': text[i:i + 64]}}]}
+        yield {'choices': [], 'usage': self.usage(data, text)}
+
+def quoted_text(text, label):
+    """
+    Returns the quoted text following a label in a prompt, e.g. the goal after 'Goal:\\n'.
+
+    Parameters:
+        text (str): The prompt.
+        label (str): The text preceding the opening quote.
+
+    Returns:
+        str: The text between the quotes, or None if the label is not found.
+    """
+    match = re.search(re.escape(label) + r'"(.*?)"\n', text, re.DOTALL)
+    return match.group(1) if match else None
+
+def placeholder_content(path, step):
+    """
+    Returns placeholder content for a file of the local backend: a comment naming the step
+    where the file type has comments, or an empty document for data files.
+
+    Parameters:
+        path (str): The path of the file.
+        step (str): The step writing the file.
+
+    Returns:
+        str: The content, ending with a newline.
+    """
+    step = ' '.join(step.split())
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.json', '.yaml', '.yml'):
+        return '{}\n'
+    if extension in ('.py', '.toml', '.cfg', '.ini', '.sh') or os.path.basename(path) == 'requirements.txt':
+        return f'# {step}\n'
+    if extension in ('.js', '.ts', '.java', '.c', '.h', '.cpp', '.go', '.rs'):
+        return f'// {step}\n'
+    return f'{step}\n'
+
+# Backends selectable by name with X_ENGINEER_BACKEND, --backend or configure_backend.
+BACKENDS = {
+    'openai': OpenAICompatibleBackend,
+    'local': LocalBackend
+}
+
+_backend = None
+
+def create_backend(name):
+    """
+    Creates a backend from its name in BACKENDS.
+
+    Parameters:
+        name (str): The backend name.
+
+    Returns:
+        ModelBackend: The backend, with its default settings.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend: {name}")
+    return BACKENDS[name]()
+
+def get_backend():
+    """
+    Returns the backend API calls are sent to, created from BACKEND on first use.
+
+    Returns:
+        ModelBackend: The backend.
+    """
+    global _backend
+    with _http_clients_lock:
+        if _backend is None:
+            _backend = create_backend(BACKEND)
+        return _backend
+
+def configure_backend(backend=None, routes=None):
+    """
+    Changes the backend and the models the routes are sent to.
+
+    Parameters:
+        backend (str or ModelBackend): A name in BACKENDS, or a backend instance.
+        routes (dict): A mapping from the names in MODEL_ROUTE_NAMES to models, replacing MODEL_ROUTES.
+    """
+    global BACKEND, MODEL_ROUTES, _backend
+    unknown = set(routes or ()) - set(MODEL_ROUTE_NAMES)
+    if unknown:
+        raise ValueError(f"Unknown model route: {', '.join(sorted(unknown))}")
+    if isinstance(backend, str):
+        BACKEND, backend = backend, create_backend(backend)
+    with _http_clients_lock:
+        if backend is not None:
+            _backend = backend
+        if routes is not None:
+            MODEL_ROUTES = dict(routes)
+
+def parse_model_routes(values):
+    """
+    Parses model routes given as 'route=model' strings.
+
+    Parameters:
+        values (list): The strings.
+
+    Returns:
+        dict: A mapping from route to model.
+    """
+    routes = {}
+    for value in values:
+        route, separator, model = value.partition('=')
+        if not separator or not model.strip():
+            raise ValueError(f"Invalid model route (expected ROUTE=MODEL): {value}")
+        routes[route.strip()] = model.strip()
+    return routes
+
+def model_for_route(route):
+    """
+    Returns the model a route is sent to.
+
+    Parameters:
+        route (str): One of MODEL_ROUTE_NAMES, or None.
+
+    Returns:
+        str: The model of the route if one is configured, MODEL otherwise.
+    """
+    return MODEL_ROUTES.get(route) or MODEL
+
+def route_for_files(paths):
+    """
+    Returns the route of a call writing the given files: 'small' if all of them are boilerplate
+    (see SMALL_FILE_NAMES and SMALL_FILE_EXTENSIONS), 'large' otherwise.
+
+    Parameters:
+        paths (list): The paths of the files, relative to the project folder.
+
+    Returns:
+        str: The route.
+    """
+    paths = [path for path in paths if path]
+    small = paths and all(os.path.basename(path) in SMALL_FILE_NAMES or path.lower().endswith(SMALL_FILE_EXTENSIONS)
+                          for path in paths)
+    return 'small' if small else 'large'
+
+async def async_call_grok_api(messages, route=None):
+    """
+    Sends the given messages to the backend, over the pooled connection of the running loop for
+    the OpenAI-compatible backend. Responses are served from and stored in the response cache
+    according to CACHE_MODE, and every call is recorded in METRICS.
+
+    Parameters:
+        messages (list): A list of message dictionaries for the API.
+        route (str): The kind of call (see MODEL_ROUTE_NAMES), which selects the model.
+
+    Returns:
+        str: The content of the response from the model.
+    """
+    backend = get_backend()
+    model = model_for_route(route)
+    data = {
+        'messages': messages,
+        'model': model,
+        'stream': False,
+        'temperature': 0
+    }
+    started = time.time()
+    start = time.perf_counter()
+    set_call_tag('prefix_ratio', PROMPT_PREFIXES.observe(messages))
+    cache = get_response_cache() if CACHE_MODE != 'off' and backend.cacheable else None
+    if cache is not None:
+        key = cache.key(data)
+        result = cache.get(key)
+        if result is not None:
+            usage = result.get('usage') or {}
+            METRICS.record(model=model, started=started, wall_time=time.perf_counter() - start, cached=True,
+                           prompt_tokens=usage.get('prompt_tokens'), completion_tokens=usage.get('completion_tokens'),
+                           streamed=False, retries=0, status='ok')
+            return result['choices'][0]['message']['content']
+        if CACHE_MODE == 'replay':
+            METRICS.record(model=model, started=started, wall_time=time.perf_counter() - start, cached=False,
+                           streamed=False, retries=0, status='error', error='not cached')
+            raise Exception(f"Error: no cached response for request {key} in replay mode")
+    stats = {'retries': 0, 'first_byte': None}
+    try:
+        result = await backend.complete(data, stats)
+    except BaseException as e:
+        ttft = stats['first_byte'] - start if stats['first_byte'] is not None else None
+        METRICS.record(model=model, started=started, wall_time=time.perf_counter() - start, ttft=ttft,
+                       cached=False, streamed=False, retries=stats['retries'], status='error', error=str(e))
+        raise
+    ttft = stats['first_byte'] - start if stats['first_byte'] is not None else None
+    usage = result.get('usage') or {}
+    METRICS.record(model=model, started=started, wall_time=time.perf_counter() - start, ttft=ttft,
+                   prompt_tokens=usage.get('prompt_tokens'), completion_tokens=usage.get('completion_tokens'),
+                   cached_tokens=cached_prompt_tokens(usage), cached=False, streamed=False, retries=stats['retries'], status='ok')
+    if cache is not None:
+        cache.put(key, result)
+    return result['choices'][0]['message']['content']
+
+def call_grok_api(messages, route=None):
+    """
+    Sends the given messages to the backend.
+
+    Parameters:
+        messages (list): A list of message dictionaries for the API.
+        route (str): The kind of call (see MODEL_ROUTE_NAMES), which selects the model.
+
+    Returns:
+        str: The content of the response from the model.
+    """
+    return run_sync(async_call_grok_api(messages, route))
+
+async def iter_sse_events(chunks):
+    """
+    Parses server-sent events from a stream of body chunks.
+
+    Parameters:
+        chunks: An async iterable of bytes.
+
+    Yields:
+        dict: The JSON payload of every 'data:' event, up to the final '[DONE]'.
+    """
+    buffer = b''
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            line = line.strip()
+            if not line.startswith(b'data:'):
+                continue
+            payload = line[5:].strip()
+            if payload == b'[DONE]':
+                return
+            yield json.loads(payload)
+
+async def async_stream_grok_api(messages, route=None):
+    """
+    Sends the given messages to the backend with streaming enabled and yields the completion as
+    it is generated.
+
+    A cached response is yielded in one piece. When the cache is enabled the streamed text is
+    also collected so that it can be stored once the stream is complete. Every call is
+    recorded in METRICS.
+
+    Parameters:
+        messages (list): A list of message dictionaries for the API.
+        route (str): The kind of call (see MODEL_ROUTE_NAMES), which selects the model.
+
+    Yields:
+        str: Pieces of the content of the response from the model.
+    """
+    backend = get_backend()
+    model = model_for_route(route)
+    data = {
+        'messages': messages,
+        'model': model,
+        'stream': True,
+        'stream_options': {'include_usage': True},
+        'temperature': 0
+    }
+    started = time.time()
+    start = time.perf_counter()
+    set_call_tag('prefix_ratio', PROMPT_PREFIXES.observe(messages))
+    cache = get_response_cache() if CACHE_MODE != 'off' and backend.cacheable else None
+    if cache is not None:
+        key = cache.key(data)
+        result = cache.get(key)
+        if result is not None:
+            usage = result.get('usage') or {}
+            METRICS.record(model=model, started=started, wall_time=time.perf_counter() - start, cached=True,
+                           ttft=time.perf_counter() - start, prompt_tokens=usage.get('prompt_tokens'),
+                           completion_tokens=usage.get('completion_tokens'), streamed=True, retries=0, status='ok')
+            yield result['choices'][0]['message']['content']
+            return
+        if CACHE_MODE == 'replay':
+            METRICS.record(model=model, started=started, wall_time=time.perf_counter() - start, cached=False,
+                           streamed=True, retries=0, status='error', error='not cached')
+            raise Exception(f"Error: no cached response for request {key} in replay mode")
+    stats = {'retries': 0, 'first_byte': None}
+    usage = {}
+    ttft = None
+    error = None
+    collected = [] if cache is not None else None
+    events = backend.stream(data, stats)
+    try:
+        async for event in events:
+            usage = event.get('usage') or usage
+            choices = event.get('choices') or [{}]
+            piece = (choices[0].get('delta') or {}).get('content')
+            if piece:
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                if collected is not None:
+                    collected.append(piece)
+                yield piece
+    except BaseException as e:
+        error = str(e) or type(e).__name__
+        raise
+    finally:
+        await events.aclose()
+        METRICS.record(model=model, started=started, wall_time=time.perf_counter() - start, ttft=ttft,
+                       prompt_tokens=usage.get('prompt_tokens'), completion_tokens=usage.get('completion_tokens'),
+                       cached_tokens=cached_prompt_tokens(usage), cached=False, streamed=True, retries=stats['retries'],
+                       status='error' if error else 'ok', error=error)
+    if collected is not None:
+        cache.put(key, {'choices': [{'message': {'role': 'assistant', 'content': ''.join(collected)}}], 'usage': usage})
+
+def build_structure_messages(goal):
+    """
+    Builds the messages asking the AI for the project directory structure.
+
+    Parameters:
+        goal (str): The user's goal description.
+
+    Returns:
+        list: A list of message dictionaries for the API.
+    """
+    example_structure = {
+        "snake_game": {
+            "README.md": {},
+            "requirements.txt": {},
+            "main.py": {},
+            "game": {
+                "__init__.py": {},
+                "snake.py": {},
+                "food.py": {},
+                "game_manager.py": {}
+            },
+            "assets": {
+                "images": {
+                    "snake.png": {},
+                    "food.png": {}
+                },
+                "sounds": {
+                    "eat.wav": {},
+                    "game_over.wav": {}
+                }
+            },
+            "save_system": {
+                "__init__.py": {},
+                "save_manager.py": {}
+            },
+            "utils": {
+                "__init__.py": {},
+                "helpers.py": {}
+            }
+        }
+    }
+
+    system_message = {
+        'role': 'system',
+        'content': (
+            'You are an AI assistant specializing in software development. '
+            'Your task is to provide the project directory structure based on the user\'s goal. '
+            'Please return the directory structure in JSON format, where folders are represented as objects, and files are empty objects. '
+            'Do not include any explanations or additional text before or after the JSON. '
+            'Only output the pure JSON content. '
+            'Here is an example:\n\n'
+            '```\n' + json.dumps(example_structure, indent=4) + '\n```'
+        )
+    }
+    user_message = {
+        'role': 'user',
+        'content': (
+            f'Based on the following goal, please provide the project directory structure. '
+            f'Please return the structure in JSON format similar to the example. '
+            f'Only output the JSON structure without any additional explanations or text.\n\n'
+            f'Goal:\n"{goal}"\n\n'
+            'Please enclose the JSON content within triple backticks (```).'
+        )
+    }
+    return [system_message, user_message]
+
+def determine_project_structure(goal):
+    """
+    Determines the project directory structure based on the user's goal.
+
+    Parameters:
+        goal (str): The user's goal description.
+
+    Returns:
+        dict: A dictionary representing the project structure.
+    """
+    with call_tags(phase='structure'):
+        response = call_grok_api(build_structure_messages(goal), route='structure')
+    print("AI's response:")
+    print(response)
+    with METRICS.stage('parsing'):
+        project_structure = parse_project_structure(response)
+    return project_structure
+
+async def async_determine_project_structure(goal):
+    """
+    Asynchronous version of determine_project_structure.
+
+    Parameters:
+        goal (str): The user's goal description.
+
+    Returns:
+        dict: A dictionary representing the project structure.
+    """
+    with call_tags(phase='structure'):
+        response = await async_call_grok_api(build_structure_messages(goal), route='structure')
+    print("AI's response:")
+    print(response)
+    with METRICS.stage('parsing'):
+        project_structure = parse_project_structure(response)
+    return project_structure
+
+def parse_project_structure(response):
+    """
+    Parses the project directory structure from the AI's response.
+
+    Parameters:
+        response (str): The response from the AI.
+
+    Returns:
+        dict: A dictionary representing the project structure.
+    """
+    try:
+        # Extract JSON content between triple backticks
+        json_matches = re.findall(r'```(.*?)```', response, re.DOTALL)
+        if json_matches:
+            json_content = json_matches[0].strip()
+            structure = json.loads(json_content)
+            return structure
+        else:
+            print("No JSON content found in AI's response.")
+            print("AI's response:")
+            print(response)
+            return {}
+    except json.JSONDecodeError as e:
+        print(f"Error parsing project structure: {e}")
+        print("AI's response:")
+        print(response)
+        return {}
+
+# Names of files that usually have no extension. Other names without an extension whose entry
+# in the structure is empty are taken as empty directories.
+EXTENSIONLESS_FILES = frozenset((
+    'makefile', 'dockerfile', 'containerfile', 'procfile', 'gemfile', 'rakefile', 'vagrantfile',
+    'jenkinsfile', 'pipfile', 'brewfile', 'caddyfile', 'license', 'licence', 'copying', 'notice',
+    'authors', 'readme', 'changelog', 'contributing', 'codeowners', 'manifest'
+))
+
+class StructureNode:
+    """
+    A file or directory of a ProjectTree.
+    """
+    __slots__ = ('name', 'path', 'is_dir', 'children')
+
+    def __init__(self, name, path, is_dir):
+        """
+        Parameters:
+            name (str): The sanitized name of the file or directory.
+            path (str): The path relative to the root of the tree.
+            is_dir (bool): Whether the node is a directory.
+        """
+        self.name = name
+        self.path = path
+        self.is_dir = is_dir
+        self.children = {} if is_dir else None
+
+def is_directory_entry(name, value):
+    """
+    Decides whether an entry of a structure returned by the AI is a directory.
+
+    Parameters:
+        name (str): The name of the entry.
+        value: The value of the entry; the AI is asked for empty objects as files.
+
+    Returns:
+        bool: True for a non-empty object or a list of names, a name ending in a slash, or an
+            empty entry whose name has no extension, is no dotfile and is no known extensionless
+            file such as Makefile.
+    """
+    if isinstance(value, list) or (isinstance(value, dict) and value) or name.endswith(('/', '\\')):
+        return True
+    if value is not None and not isinstance(value, dict):
+        return False
+    return '.' not in name and name.lower() not in EXTENSIONLESS_FILES
+
+class ProjectTree:
+    """
+    A project directory structure as a tree of files and directories.
+
+    Built once from the nested dictionaries of the AI's response, with the kind of every entry
+    decided by is_directory_entry. The tree is built and walked without recursion; file names and
+    paths are looked up in the PathIndex built from it (see build_filename_to_path_mapping).
+    """
+
+    def __init__(self, structure):
+        """
+        Parameters:
+            structure (dict): The nested dictionaries describing the structure.
+        """
+        self.root = StructureNode('', '', True)
+        pending = [(self.root, structure)]
+        while pending:
+            parent, entries = pending.pop()
+            if isinstance(entries, list):
+                # A directory given as a list of names, or of objects
+                merged = {}
+                for item in entries:
+                    if isinstance(item, dict):
+                        merged.update(item)
+                    elif isinstance(item, str):
+                        merged[item] = {}
+                entries = merged
+            if not isinstance(entries, dict):
+                continue
+            for name, value in entries.items():
+                # Names such as "src/app.py" stand for nested entries; ".." is dropped
+                parts = [sanitize_filename(part) for part in re.split(r'[/\\]+', str(name))]
+                parts = [part for part in parts if part not in ('', '.', '..')]
+                node = parent
+                for depth, part in enumerate(parts):
+                    is_dir = depth < len(parts) - 1 or is_directory_entry(str(name), value)
+                    child = node.children.get(part)
+                    if child is None or child.is_dir != is_dir:
+                        child = StructureNode(part, os.path.join(node.path, part) if node.path else part, is_dir)
+                        node.children[part] = child
+                    node = child
+                if parts and node.is_dir:
+                    pending.append((node, value))
+
+    def walk(self):
+        """
+        Yields every node of the tree depth first, in the order of the structure.
+
+        Returns:
+            generator: (StructureNode, depth) tuples; top-level entries have depth 0.
+        """
+        pending = [(child, 0) for child in reversed(list(self.root.children.values()))]
+        while pending:
+            node, depth = pending.pop()
+            yield node, depth
+            if node.is_dir:
+                pending.extend((child, depth + 1) for child in reversed(list(node.children.values())))
+
+    def files(self):
+        """
+        Returns:
+            list: The relative paths of all files, in the order of the structure.
+        """
+        return [node.path for node, _ in self.walk() if not node.is_dir]
+
+    def directories(self):
+        """
+        Returns:
+            list: The relative paths of all directories, parents before their children.
+        """
+        return [node.path for node, _ in self.walk() if node.is_dir]
+
+def as_tree(structure):
+    """
+    Returns a structure as a ProjectTree, building one from nested dictionaries.
+
+    Parameters:
+        structure (dict or ProjectTree): The project directory structure.
+
+    Returns:
+        ProjectTree: The tree.
+    """
+    return structure if isinstance(structure, ProjectTree) else ProjectTree(structure)
+
+def format_structure(structure, indent=0):
+    """
+    Formats the project structure into a string.
+
+    Parameters:
+        structure (dict or ProjectTree): The project directory structure.
+        indent (int): Indentation level of the top-level entries.
+
+    Returns:
+        str: A formatted string representing the structure.
+    """
+    lines = []
+    for node, depth in as_tree(structure).walk():
+        lines.append('    ' * (indent + depth) + node.name + ('/' if node.is_dir else ''))
+    return '\n'.join(lines)
+
+def provide_example_subtasks(goal):
+    """
+    Provides an example list of reasonable subtasks based on the goal.
+
+    Parameters:
+        goal (str): The user's goal description.
+
+    Returns:
+        str: An example of reasonable subtasks.
+    """
+    example_subtasks = (
+        "Example of a full list of subtasks for a snake game with a save system:\n\n"
+        "1. Set up the project directory structure.\n"
+        "2. Initialize a Git repository.\n"
+        "3. Create a virtual environment and install necessary packages.\n"
+        "4. Write the main game loop in main.py.\n"
+        "5. Implement the Snake class in snake.py.\n"
+        "6. Implement the Food class in food.py.\n"
+        "7. Implement the GameManager class in game_manager.py to handle game states.\n"
+        "8. Implement the SaveManager class in save_manager.py for saving and loading game states.\n"
+        "9. Write helper functions in helpers.py.\n"
+        "10. Add sound effects and images to the assets folder.\n"
+        "11. Update README.md with installation and usage instructions.\n"
+        "12. Write unit tests for the key components.\n"
+        "13. Clean up code and remove any unnecessary files.\n\n"
+        "Please ensure each subtask is concise and fits on a single line."
+    )
+    return example_subtasks
+
+def build_plan_messages(goal, project_structure):
+    """
+    Builds the messages asking the AI for a detailed plan.
+
+    Parameters:
+        goal (str): The user's goal description.
+        project_structure (dict): The project directory structure.
+
+    Returns:
+        list: A list of message dictionaries for the API.
+    """
+    example_subtasks = provide_example_subtasks(goal)
+    system_message = {
+        'role': 'system',
+        'content': (
+            'You are an AI assistant specializing in software development. '
+            'Your task is to provide a detailed plan for the software project, including all operations in the project folder, such as file and folder operations. '
+            'When providing the plan, ensure that each subtask is concise and fits on a single line. '
+            'Do not split a single subtask into multiple lines.\n\n'
+            'Here is an example of the expected format for a snake game with a save system:\n\n' +
+            example_subtasks +
+            'Please follow this format closely when providing the plan.'
+        )
+    }
+    user_message = {
+        'role': 'user',
+        'content': (
+            f'Based on the following goal and project directory structure, please provide a detailed plan, including all operations in the project folder. '
+            f'Ensure that the plan is as detailed as possible and includes only necessary files and steps relevant to the goal.\n\n'
+            f'Goal:\n"{goal}"\n\n'
+            f'Project Directory Structure:\n{json.dumps(project_structure, indent=4)}\n\n'
+            'Please ensure each subtask is concise and fits on a single line. '
+            'Do not split a single subtask into multiple lines.\n\n'
+            'Provide the detailed plan in a numbered list.'
+        )
+    }
+    return [system_message, user_message]
+
+def decompose_goal(goal, project_structure):
+    """
+    Decomposes the user's goal into a detailed plan using the AI model.
+
+    Parameters:
+        goal (str): The user's goal description.
+        project_structure (dict): The project directory structure.
+
+    Returns:
+        list: A list of plan steps extracted from the model's response.
+    """
+    with call_tags(phase='plan'):
+        response = call_grok_api(build_plan_messages(goal, project_structure), route='plan')
+    with METRICS.stage('parsing'):
+        plan = parse_subtasks(response)
+    return plan
+
+async def async_decompose_goal(goal, project_structure):
+    """
+    Asynchronous version of decompose_goal.
+
+    Parameters:
+        goal (str): The user's goal description.
+        project_structure (dict): The project directory structure.
+
+    Returns:
+        list: A list of plan steps extracted from the model's response.
+    """
+    with call_tags(phase='plan'):
+        response = await async_call_grok_api(build_plan_messages(goal, project_structure), route='plan')
+    with METRICS.stage('parsing'):
+        plan = parse_subtasks(response)
+    return plan
+
+def parse_subtasks(response):
+    """
+    Parses the subtasks or plan steps from the AI's response.
+
+    Parameters:
+        response (str): The response from the AI.
+
+    Returns:
+        list: A list of parsed steps.
+    """
+    steps = []
+    lines = response.strip().split('\n')
+    for line in lines:
+        task = parse_plan_line(line)
+        if task is not None:
+            steps.append(task)
+    return steps
+
+def parse_plan_line(line):
+    """
+    Parses one line of a plan.
+
+    Parameters:
+        line (str): The line.
+
+    Returns:
+        str: The step without its numbering, or None for a blank line.
+    """
+    if not line.strip():
+        return None
+    # Remove numbering if present
+    task = line.strip()
+    match = re.match(r'^\d+(\.\d+)*\.?\s*(.*)', task)
+    if match:
+        task = match.group(2).strip()
+    return task
+
+class PlanStreamParser:
+    """
+    Parses the steps of a plan from a streamed response, passing each step on as soon as its
+    line is complete. The steps are exactly those parse_subtasks returns for the whole response.
+    """
+
+    def __init__(self, on_step):
+        """
+        Parameters:
+            on_step (callable): Called with every step, in plan order.
+        """
+        self.on_step = on_step
+        self.pending = ''
+        self.steps = []
+
+    def feed(self, text):
+        """
+        Parameters:
+            text (str): The next piece of the response.
+        """
+        lines = (self.pending + text).split('\n')
+        self.pending = lines.pop()
+        for line in lines:
+            self.add_line(line)
+
+    def finish(self):
+        """
+        Parses the last line.
+
+        Returns:
+            list: All steps of the plan.
+        """
+        self.add_line(self.pending)
+        self.pending = ''
+        return self.steps
+
+    def add_line(self, line):
+        step = parse_plan_line(line)
+        if step is not None:
+            self.steps.append(step)
+            self.on_step(step)
+
+def build_filename_to_path_mapping(structure, current_path=''):
+    """
+    Builds a mapping from the file names and relative paths of the project structure to their paths.
+
+    Parameters:
+        structure (dict or ProjectTree): The project directory structure.
+        current_path (str): The path of the structure relative to the project folder.
+
+    Returns:
+        PathIndex: A mapping from filenames and relative paths to their paths.
+    """
+    return PathIndex(os.path.join(current_path, path) for path in as_tree(structure).files())
+
+class PathIndex(dict):
+    """
+    A mapping from the file names and relative paths of a project to their paths, with a suffix
+    index for resolving the names mentioned in steps.
+
+    Every file is indexed under each trailing run of its lower-cased path components, so
+    "src/app.py", "app.py" and "SRC/App.py" all resolve to src/app.py. A file name shared by
+    several directories resolves to the file whose directories the step mentions.
+    Parsed steps are cached (see parse_step).
+    """
+
+    def __init__(self, paths=()):
+        """
+        Parameters:
+            paths (iterable): The relative paths of the project files.
+        """
+        super().__init__()
+        self.paths = []
+        self.suffixes = {}
+        self.intents = {}
+        for path in paths:
+            self.add(path)
+
+    def add(self, path):
+        """
+        Adds a file.
+
+        Parameters:
+            path (str): The path of the file relative to the project folder.
+        """
+        path = os.path.normpath(path)
+        if self.get(path) == path:
+            return
+        self.paths.append(path)
+        self.setdefault(os.path.basename(path), path)
+        self[path] = path
+        parts = tuple(part.lower() for part in path.split(os.sep))
+        for start in range(len(parts)):
+            self.suffixes.setdefault(parts[start:], []).append(path)
+        self.intents.clear()
+
+    def resolve(self, name, words=()):
+        """
+        Resolves a file name or path mentioned in a step to a project file.
+
+        Parameters:
+            name (str): The file name or path, possibly with leading directories outside the project.
+            words (set): Lower-case words of the step, used to choose between files with the same name.
+
+        Returns:
+            str: The normalized relative path of the file, or None if it is not part of the project.
+        """
+        parts = [part.lower() for part in re.split(r'[/\\]+', sanitize_filename(name)) if part not in ('', '.')]
+        for start in range(len(parts)):
+            paths = self.suffixes.get(tuple(parts[start:]))
+            if paths:
+                if len(paths) == 1:
+                    return paths[0]
+                hints = set(words) | set(parts[:start])
+                return max(paths, key=lambda path: sum(part.lower() in hints for part in path.split(os.sep)[:-1]))
+        return None
+
+def get_path_index(filename_to_path):
+    """
+    Returns the PathIndex of a filename mapping, building one for plain dictionaries.
+
+    Parameters:
+        filename_to_path (dict): A mapping from filenames to their paths.
+
+    Returns:
+        PathIndex: The index.
+    """
+    if isinstance(filename_to_path, PathIndex):
+        return filename_to_path
+    return PathIndex(filename_to_path.values())
+
+class StepIntent:
+    """
+    What a step does and which project files it touches.
+    """
+    __slots__ = ('kind', 'filename', 'target', 'references')
+
+    def __init__(self, kind, filename, target, references):
+        """
+        Parameters:
+            kind (str): 'write', 'delete' or 'other'.
+            filename (str): The file name the step operates on, as written in the step, or None.
+            target (str): The normalized relative path of that file, or None.
+            references (set): The normalized relative paths of every project file the step mentions.
+        """
+        self.kind = kind
+        self.filename = filename
+        self.target = target
+        self.references = references
+
+# Scans a step once for the words marking it as writing or deleting a file, the prepositions
+# that usually precede the file it writes ("in main.py", "to utils.py"), and path-like tokens.
+STEP_PATTERN = re.compile(
+    r'(?<![\w./\\-])(?:'
+    r'(?P<write>(?:re|over)?writ(?:e|es|ing|ten)|implement\w*|add(?:s|ed|ing)?|updat(?:e|es|ed|ing)|(?:re)?creat(?:e|es|ed|ing))'
+    r'|(?P<delete>delet(?:e|es|ed|ing|ion))'
+    r'|(?P<preposition>in|to|into)'
+    r')(?![\w./\\-])'
+    r'|(?P<token>[\w./\\-]+)',
+    re.IGNORECASE
+)
+# File names with an extension, and dotfiles, outside the known project files.
+FILE_NAME_PATTERN = re.compile(r'\.[A-Za-z][\w-]*|[\w-]+(?:\.[\w-]+)*\.[A-Za-z]\w*')
+
+def parse_step(step, filename_to_path=None):
+    """
+    Parses what a step does and which project files it touches, in a single pass over the step.
+
+    The file a step operates on is the first file that directly follows "in", "to" or "into",
+    else the first file mentioned. Project files are resolved with the PathIndex (so "config.py"
+    in "Add config.py to pkg2" is pkg2/config.py); other names count as files if they have
+    an extension or are dotfiles.
+
+    Parameters:
+        step (str): The step description.
+        filename_to_path (dict): A mapping from filenames to their paths; without it only the
+            kind and the file name of the step are found.
+
+    Returns:
+        StepIntent: The parsed step.
+    """
+    index = get_path_index(filename_to_path) if filename_to_path is not None else None
+    if index is not None:
+        intent = index.intents.get(step)
+        if intent is not None:
+            return intent
+    write = delete = after_preposition = False
+    tokens = []
+    words = set()
+    for match in STEP_PATTERN.finditer(re.sub(r'[`*"]', '', step)):
+        kind = match.lastgroup
+        if kind == 'write':
+            write = True
+        elif kind == 'delete':
+            delete = True
+        elif kind == 'token':
+            token = match.group().rstrip('.,;:')
+            if token:
+                tokens.append((token, after_preposition))
+                words.add(token.lower())
+        after_preposition = kind == 'preposition'
+
+    filename = target = best = None
+    references = set()
+    for token, after_preposition in tokens:
+        path = index.resolve(token, words) if index is not None else None
+        if path is not None:
+            references.add(path)
+        elif not FILE_NAME_PATTERN.fullmatch(re.split(r'[/\\]', token)[-1]) or token.lower() in ('e.g', 'i.e'):
+            continue
+        rank = 0 if after_preposition else 1
+        if best is None or rank < best:
+            best, filename, target = rank, token, path or os.path.normpath(sanitize_filename(token))
+    intent = StepIntent('write' if write else 'delete' if delete else 'other', filename, target, references)
+    if index is not None:
+        index.intents[step] = intent
+    return intent
+
+def find_step_target(step, filename_to_path):
+    """
+    Finds the file a step writes to or deletes.
+
+    Parameters:
+        step (str): The step description.
+        filename_to_path (dict): A mapping from filenames to their paths.
+
+    Returns:
+        str: The normalized relative path of the target file, or None for steps that touch no file.
+    """
+    intent = parse_step(step, filename_to_path)
+    return intent.target if intent.kind != 'other' else None
+
+def find_step_references(step, filename_to_path):
+    """
+    Finds the known project files mentioned anywhere in a step.
+
+    Parameters:
+        step (str): The step description.
+        filename_to_path (dict): A mapping from filenames to their paths.
+
+    Returns:
+        set: The normalized relative paths of the mentioned files.
+    """
+    return set(parse_step(step, filename_to_path).references)
+
+def find_explicit_dependencies(step):
+    """
+    Finds explicit ordering hints such as "after step 3" or "once steps 4 and 5 are done".
+
+    Parameters:
+        step (str): The step description.
+
+    Returns:
+        set: The zero-based indices of the steps this step must wait for.
+    """
+    dependencies = set()
+    pattern = r'\b(?:after|following|once|depends on|requires)\s+(?:step|task)s?\s+#?(\d+(?:\s*(?:,|and|&)\s*#?\d+)*)'
+    for match in re.finditer(pattern, step.lower()):
+        for number in re.findall(r'\d+', match.group(1)):
+            dependencies.add(int(number) - 1)
+    return dependencies
+
+def group_generation_steps(plan, filename_to_path, max_files=GENERATION_BATCH_FILES, exclude=()):
+    """
+    Groups the steps writing text files in the same directory, so that each group can be generated
+    with a single API call (see run_step_group).
+
+    A step joins the group of an earlier step only if running it at that earlier point changes
+    nothing: no step in between writes or deletes a file it targets or mentions, or mentions
+    the file it writes. Steps with explicit dependencies ("after step N") are never grouped.
+
+    Parameters:
+        plan (list): The plan steps.
+        filename_to_path (dict): A mapping from filenames to their paths.
+        max_files (int): Maximum number of steps in a group; 1 disables grouping.
+        exclude (set): Indices of steps that must not be grouped, e.g. steps finished in a previous run.
+
+    Returns:
+        list: Lists of plan indices, one per group, ordered by their first index.
+    """
+    if max_files <= 1:
+        return [[index] for index in range(len(plan))]
+    targets = [find_step_target(step, filename_to_path) for step in plan]
+    references = [find_step_references(step, filename_to_path) for step in plan]
+    groups = []
+    open_groups = {}
+    for index, step in enumerate(plan):
+        target = targets[index]
+        if (index in exclude or not target or parse_step(step, filename_to_path).kind != 'write' or is_non_text_file(target)
+                or find_explicit_dependencies(step)):
+            groups.append([index])
+            continue
+        group = open_groups.get(os.path.dirname(target))
+        if group is not None and len(group) < max_files and all(targets[member] != target for member in group):
+            members = set(group)
+            if not any(
+                (targets[other] and (targets[other] == target or targets[other] in references[index]))
+                or target in references[other]
+                for other in range(group[0] + 1, index) if other not in members
+            ):
+                group.append(index)
+                continue
+        group = [index]
+        groups.append(group)
+        open_groups[os.path.dirname(target)] = group
+    return groups
+
+class StepScheduler:
+    """
+    Runs plan steps on a thread pool while respecting the dependencies between them.
+
+    A step waits for every earlier step that targets the same file, for the latest earlier
+    step writing any project file it mentions, and for steps it explicitly names
+    ("after step N"). Steps are added one at a time or as groups that run as a single unit
+    (see group_generation_steps); logs are printed in the order the units were added.
+    """
+
+    def __init__(self, run_step, filename_to_path, max_workers=MAX_WORKERS):
+        """
+        Parameters:
+            run_step (callable): Called with the plan indices and descriptions of the steps of a
+                unit (two lists), returns the unit's log lines.
+            filename_to_path (dict): A mapping from filenames to their paths.
+            max_workers (int): Maximum number of units running at the same time.
+        """
+        self.run_step = run_step
+        self.filename_to_path = filename_to_path
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        self.lock = threading.Lock()
+        self.all_done = threading.Condition(self.lock)
+        self.steps = []
+        self.indices = []
+        self.unit_of = {}
+        self.contexts = []
+        self.results = []
+        self.finished = []
+        self.waiting_on = []
+        self.dependents = []
+        self.last_writer = {}
+        self.readers = {}
+        self.next_to_emit = 0
+
+    def dependencies_for(self, step, position, index):
+        """
+        Computes the earlier units a step of a new unit depends on.
+
+        Parameters:
+            step (str): The step description.
+            position (int): The position of the step in the plan.
+            index (int): The index of the new unit.
+
+        Returns:
+            set: The indices of the units that must finish first.
+        """
+        dependencies = {self.unit_of[i] for i in find_explicit_dependencies(step) if i < position and i in self.unit_of}
+        target = find_step_target(step, self.filename_to_path)
+        references = find_step_references(step, self.filename_to_path) - {target}
+        # Read after write: wait for the latest writer of every file the step mentions
+        for path in references:
+            if path in self.last_writer:
+                dependencies.add(self.last_writer[path])
+            self.readers.setdefault(path, set()).add(index)
+        if target:
+            # Write after write and write after read: wait for the previous writer of the
+            # target and for every step that mentioned it since that write
+            if target in self.last_writer:
+                dependencies.add(self.last_writer[target])
+            dependencies.update(self.readers.pop(target, set()))
+            self.last_writer[target] = index
+        dependencies.discard(index)
+        return dependencies
+
+    def add(self, steps, indices=None):
+        """
+        Adds a step, or a group of steps run as one unit, and starts it as soon as its dependencies have finished.
+
+        Parameters:
+            steps (str or list): The step description, or the descriptions of the steps of a group.
+            indices (list): The plan indices of the steps; defaults to the next indices of the plan.
+
+        Returns:
+            int: The index of the unit.
+        """
+        if isinstance(steps, str):
+            steps = [steps]
+        if indices is None:
+            indices = list(range(len(self.unit_of), len(self.unit_of) + len(steps)))
+        with self.lock:
+            index = len(self.steps)
+            dependencies = set()
+            for position, step in zip(indices, steps):
+                dependencies |= self.dependencies_for(step, position, index)
+                self.unit_of[position] = index
+            self.steps.append(list(steps))
+            self.indices.append(list(indices))
+            # Steps run in the context of the caller that added them, e.g. with its metric tags
+            self.contexts.append(contextvars.copy_context())
+            self.results.append(None)
+            self.finished.append(False)
+            self.dependents.append([])
+            pending = [i for i in dependencies if not self.finished[i]]
+            self.waiting_on.append(len(pending))
+            for i in pending:
+                self.dependents[i].append(index)
+        if not pending:
+            self.submit(index)
+        return index
+
+    def submit(self, index):
+        future = self.executor.submit(self.contexts[index].run, self.run_step, self.indices[index], self.steps[index])
+        future.add_done_callback(lambda f: self.step_finished(index, f))
+
+    def step_finished(self, index, future):
+        try:
+            logs = future.result()
+        except Exception as e:
+            logs = []
+            for step in self.steps[index]:
+                logs += [f"Executing step: {step}", f"Failed to execute step: {e}"]
+        ready = []
+        with self.lock:
+            try:
+                self.results[index] = logs
+                self.finished[index] = True
+                for dependent in self.dependents[index]:
+                    self.waiting_on[dependent] -= 1
+                    if self.waiting_on[dependent] == 0:
+                        ready.append(dependent)
+                # Print the logs of every step that is finished and has no unfinished step before it
+                while self.next_to_emit < len(self.steps) and self.finished[self.next_to_emit]:
+                    emit_index = self.next_to_emit
+                    self.next_to_emit += 1
+                    # Printed with the call tags of the caller, e.g. for the job logs of the service mode
+                    with call_tags(**self.contexts[emit_index].get(CALL_TAGS, {})):
+                        for i, log in enumerate(self.results[emit_index]):
+                            print(f"\n{log}" if i == 0 else log)
+            finally:
+                self.finished[index] = True
+                self.all_done.notify_all()
+        # Submitted outside the lock: a future that is already done runs its callback immediately
+        for dependent in ready:
+            self.submit(dependent)
+
+    def close(self):
+        """
+        Waits for every added step to finish.
+
+        Returns:
+            list: The combined execution logs of all steps in plan order.
+        """
+        try:
+            with self.lock:
+                while not all(self.finished):
+                    self.all_done.wait()
+        except BaseException:
+            # Interrupted (e.g. Ctrl-C): drop the steps that have not started yet
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        self.executor.shutdown()
+        logs = []
+        for result in self.results:
+            logs.extend(result)
+        return logs
+
+def execute_plan(plan, project_folder, project_structure, filename_to_path, goal, max_workers=MAX_WORKERS, journal=None,
+                 prefetched=None):
+    """
+    Executes the plan, running independent steps concurrently. With GENERATION_BATCH_FILES above 1,
+    steps writing files in the same directory are generated together with one API call each.
+
+    Parameters:
+        plan (list): The plan steps.
+        project_folder (str): The path to the project folder.
+        project_structure (dict): The project directory structure.
+        filename_to_path (dict): A mapping from filenames to their paths.
+        goal (str): The user's overall goal.
+        max_workers (int): Maximum number of steps executed at the same time.
+        journal (RunJournal): If given, steps it records as finished are skipped and the
+            outcome of every executed step is recorded in it.
+        prefetched (dict): File contents generated ahead of the run, mapping plan indices to
+            (relative path, content) as returned by SpeculativePrefetch.commit.
+
+    Returns:
+        list: The execution logs of all steps in plan order.
+    """
+    run = plan_step_runner(project_folder, project_structure, filename_to_path, goal, journal, prefetched)
+    skipped = {index for index in range(len(plan))
+               if journal is not None and (journal.is_finished(index) or not journal.is_approved(index))}
+    units = group_generation_steps(plan, filename_to_path, GENERATION_BATCH_FILES, skipped | set(prefetched or ()))
+    if max_workers <= 1:
+        logs = []
+        for indices in units:
+            logs.extend(run(indices, [plan[index] for index in indices], verbose=True))
+        return logs
+    scheduler = StepScheduler(run, filename_to_path, max_workers)
+    for indices in units:
+        scheduler.add([plan[index] for index in indices], indices)
+    return scheduler.close()
+
+def plan_step_runner(project_folder, project_structure, filename_to_path, goal, journal=None, prefetched=None):
+    """
+    Returns the function execute_plan uses to run a step, or a group of steps, of the plan.
+
+    Parameters:
+        project_folder (str): The path to the project folder.
+        project_structure (dict): The project directory structure.
+        filename_to_path (dict): A mapping from filenames to their paths.
+        goal (str): The user's overall goal.
+        journal (RunJournal): If given, steps it records as finished are skipped and the
+            outcome of every executed step is recorded in it.
+        prefetched (dict): File contents generated ahead of the run, by plan index; these steps
+            write their content without calling the API.
+
+    Returns:
+        callable: Called with the plan indices and the descriptions of the steps (two lists)
+            and whether to print progress, returns the log lines of the steps.
+    """
+    def run(indices, steps, verbose=False):
+        if len(steps) > 1:
+            with call_tags(phase='steps ' + ','.join(str(index + 1) for index in indices)):
+                results = run_step_group(steps, project_folder, project_structure, filename_to_path, goal, verbose)
+                logs = []
+                for index, step, (step_logs, ok, outputs) in zip(indices, steps, results):
+                    step_logs, ok, outputs = validate(step, step_logs, ok, outputs, verbose)
+                    if journal is not None:
+                        journal.record_step(index, ok, outputs)
+                    logs.extend(step_logs)
+            return logs
+        index, step = indices[0], steps[0]
+        if journal is not None and journal.is_finished(index):
+            logs = [f"Executing step: {step}", "Skipped step finished in a previous run."]
+            if verbose:
+                print(f"\n{logs[0]}\n{logs[1]}")
+            return logs
+        if journal is not None and not journal.is_approved(index):
+            logs = [f"Executing step: {step}", "Skipped step not approved by the auto-approve policy."]
+            if verbose:
+                print(f"\n{logs[0]}\n{logs[1]}")
+            return logs
+        with call_tags(phase=f'step {index + 1}'):
+            if prefetched and index in prefetched:
+                relative_path, content = prefetched[index]
+                logs, ok, outputs = write_generated_file(step, project_folder, relative_path, content,
+                                                         "Generated while the plan was being confirmed", verbose)
+            else:
+                logs, ok, outputs = run_step(step, project_folder, project_structure, filename_to_path, goal, verbose)
+            logs, ok, outputs = validate(step, logs, ok, outputs, verbose)
+        if journal is not None:
+            journal.record_step(index, ok, outputs)
+        return logs
+
+    def validate(step, logs, ok, outputs, verbose):
+        # Check the files the step wrote, regenerating those that do not validate
+        if not ok or not VALIDATION:
+            return logs, ok, outputs
+        extra, ok, outputs = validate_step_files(step, outputs, project_folder, goal, filename_to_path, verbose)
+        return logs + extra, ok, outputs
+
+    return run
+
+def auto_approve_step(step, filename_to_path, policy='safe'):
+    """
+    Decides whether a step of a streamed plan may run without confirmation.
+
+    Parameters:
+        step (str): The step description.
+        filename_to_path (dict): A mapping from filenames to their paths.
+        policy (str): 'all' approves every step. 'safe' approves steps writing files of the
+            project structure and steps that touch no file, but no deletions and no writes to
+            files outside the structure.
+
+    Returns:
+        bool: True if the step may run.
+    """
+    if policy == 'all':
+        return True
+    intent = parse_step(step, filename_to_path)
+    if intent.kind == 'delete':
+        return False
+    if intent.kind == 'write' and intent.target is not None:
+        return intent.target in get_path_index(filename_to_path)
+    return True
+
+def execute_plan_pipelined(goal, project_structure, project_folder, adjusted_structure, filename_to_path,
+                           max_workers=MAX_WORKERS, journal=None, policy='safe'):
+    """
+    Streams the plan from the AI and starts every step as soon as its line has arrived, so that
+    planning overlaps with generating the files. Instead of the plan confirmation, each step is
+    checked with auto_approve_step; rejected steps are skipped and recorded as not approved in the
+    journal, which also records when the whole plan has arrived.
+    Steps are not grouped for batched generation, since the rest of the plan is not known yet.
+
+    Parameters:
+        goal (str): The user's overall goal.
+        project_structure (dict): The project directory structure, including the top-level directory.
+        project_folder (str): The path to the project folder.
+        adjusted_structure (ProjectTree): The structure below the project folder.
+        filename_to_path (dict): A mapping from filenames to their paths.
+        max_workers (int): Maximum number of steps executed at the same time.
+        journal (RunJournal): If given, every step is added to it as it arrives and its outcome recorded.
+        policy (str): The auto-approve policy, 'safe' or 'all'.
+
+    Returns:
+        tuple: The plan (list) and the execution logs of all steps in plan order (list).
+    """
+    runner = plan_step_runner(project_folder, adjusted_structure, filename_to_path, goal, journal)
+    rejected = set()
+
+    def run(indices, steps, verbose=False):
+        if indices[0] in rejected:
+            return [f"Executing step: {steps[0]}", "Skipped step not approved by the auto-approve policy."]
+        return runner(indices, steps, verbose)
+
+    scheduler = StepScheduler(run, filename_to_path, max(1, max_workers))
+
+    def on_step(step):
+        index = len(parser.steps) - 1
+        if not auto_approve_step(step, filename_to_path, policy):
+            rejected.add(index)
+        if journal is not None:
+            journal.add_step(step, index not in rejected)
+        print(f"{index + 1}. {step}" + (" (not approved, skipped)" if index in rejected else ''))
+        scheduler.add(step, [index])
+
+    async def stream_plan():
+        with call_tags(phase='plan'):
+            async for piece in async_stream_grok_api(build_plan_messages(goal, project_structure), route='plan'):
+                with METRICS.stage('parsing'):
+                    parser.feed(piece)
+        with METRICS.stage('parsing'):
+            parser.finish()
+
+    parser = PlanStreamParser(on_step)
+    if journal is not None:
+        journal.set_approval_policy(policy)
+    try:
+        run_sync(stream_plan())
+        if journal is not None:
+            journal.complete_plan()
+    finally:
+        logs = scheduler.close()
+    return parser.steps, logs
+
+def prefetch_candidates(plan, filename_to_path, max_files=PREFETCH_MAX_FILES):
+    """
+    Picks the steps worth generating before the plan is confirmed: steps writing a README, package
+    marker or entry point (PREFETCH_FILE_NAMES) that StepScheduler starts right away because they
+    depend on no earlier step, so their prompts see nothing but the placeholder files.
+
+    Parameters:
+        plan (list): The plan steps.
+        filename_to_path (dict): A mapping from filenames to their paths.
+        max_files (int): Maximum number of steps picked.
+
+    Returns:
+        list: The plan index and the relative path of the target of each picked step.
+    """
+    candidates = []
+    written = set()
+    mentioned = set()
+    for index, step in enumerate(plan):
+        intent = parse_step(step, filename_to_path)
+        target = intent.target
+        references = find_step_references(step, filename_to_path) - {target}
+        if (len(candidates) < max_files and intent.kind == 'write' and target
+                and os.path.basename(target) in PREFETCH_FILE_NAMES and not is_non_text_file(target)
+                and target not in written and target not in mentioned and not references & written
+                and not find_explicit_dependencies(step)):
+            candidates.append((index, target))
+        if target:
+            written.add(target)
+        mentioned |= references
+    return candidates
+
+class SpeculativePrefetch:
+    """
+    Generates the plan and the first files of a project in the background while the user is
+    still confirming the structure and the plan.
+
+    The files are generated against a staging copy of the project structure, so that their
+    prompts see the same placeholder files as in the real run. commit() hands them over once the
+    plan is accepted, provided the project folder still matches the staging copy; discard()
+    cancels the outstanding calls and removes the staging copy.
+    """
+
+    def __init__(self, goal, project_structure):
+        """
+        Starts the prefetch.
+
+        Parameters:
+            goal (str): The user's goal description.
+            project_structure (dict): The project directory structure, with one top-level directory.
+        """
+        self.goal = goal
+        self.project_structure = project_structure
+        self.plan_steps = None
+        self.plan_ready = threading.Event()
+        # Plan index -> (relative path, content)
+        self.contents = {}
+        top_level_dir = next(iter(project_structure))
+        self.staging_dir = tempfile.mkdtemp(prefix='x_engineer_prefetch_')
+        self.staging_folder = os.path.join(self.staging_dir, sanitize_filename(top_level_dir))
+        tree = ProjectTree(project_structure[top_level_dir])
+        create_directories(self.staging_folder, tree, verbose=False)
+        self.filename_to_path = build_filename_to_path_mapping(tree)
+        self.future = run_in_background(self.run())
+
+    async def run(self):
+        try:
+            self.plan_steps = await async_decompose_goal(self.goal, self.project_structure)
+        finally:
+            self.plan_ready.set()
+
+        async def fetch(index, relative_path):
+            with call_tags(phase='prefetch'):
+                content = await async_get_content_from_ai(self.plan_steps[index], self.staging_folder, self.goal, relative_path)
+            self.contents[index] = (relative_path, content)
+
+        # A file that fails is simply generated again by its step
+        candidates = prefetch_candidates(self.plan_steps, self.filename_to_path)
+        await asyncio.gather(*(fetch(index, relative_path) for index, relative_path in candidates), return_exceptions=True)
+
+    def plan(self):
+        """
+        Waits for the plan.
+
+        Returns:
+            list: The plan steps, as returned by decompose_goal.
+        """
+        self.plan_ready.wait()
+        if self.plan_steps is None:
+            # Raise the error of the plan request
+            self.future.result()
+        return self.plan_steps
+
+    def commit(self, project_folder):
+        """
+        Waits for the files still being generated and hands them over to the run of the accepted plan.
+
+        Parameters:
+            project_folder (str): The path to the project folder, with its structure created.
+
+        Returns:
+            dict: A mapping from plan indices to (relative path, content), for execute_plan. Empty if
+                the project files differ from the staging copy, e.g. because the folder already existed.
+        """
+        try:
+            self.future.result()
+            if not self.contents:
+                return {}
+            index = get_context_index(project_folder)
+            index.refresh()
+            if index.files() != get_context_index(self.staging_folder).files():
+                return {}
+            return dict(self.contents)
+        finally:
+            self.discard()
+
+    def discard(self):
+        """
+        Cancels the outstanding calls and removes the staging copy.
+        """
+        self.future.cancel()
+        forget_context_index(self.staging_folder)
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+def execute_step(step, project_folder, project_structure, filename_to_path, goal, verbose=True):
+    """
+    Executes a single step.
+
+    Parameters:
+        step (str): The step description.
+        project_folder (str): The path to the project folder.
+        project_structure (dict): The project directory structure.
+        filename_to_path (dict): A mapping from filenames to their paths.
+        goal (str): The user's overall goal.
+        verbose (bool): Print progress while the step runs.
+
+    Returns:
+        list: A log of execution details for this step.
+    """
+    return run_step(step, project_folder, project_structure, filename_to_path, goal, verbose)[0]
+
+def run_step(step, project_folder, project_structure, filename_to_path, goal, verbose=True):
+    """
+    Executes a single step and reports its outcome.
+
+    Parameters:
+        step (str): The step description.
+        project_folder (str): The path to the project folder.
+        project_structure (dict): The project directory structure.
+        filename_to_path (dict): A mapping from filenames to their paths.
+        goal (str): The user's overall goal.
+        verbose (bool): Print progress while the step runs. execute_plan turns this off
+            for concurrent steps and prints their logs in plan order instead.
+
+    Returns:
+        tuple: The log of execution details (list), whether the step succeeded (bool) and
+            the files it produced (dict mapping relative paths to their sha256, or None for deleted files).
+    """
+    logs = []
+    outputs = {}
+
+    def log(message, printed=None):
+        logs.append(message)
+        if verbose:
+            print(printed or message)
+
+    if verbose:
+        print()
+    log(f"Executing step: {step}")
+
+    # Determine if we need to get content from AI
+    intent = parse_step(step, filename_to_path)
+    kind = intent.kind
+    if kind == 'write':
+        filename_from_step = intent.filename
+        if filename_from_step and is_non_text_file(filename_from_step):
+            # Handle non-text files
+            relative_path = intent.target
+            placeholder_filename = f"{os.path.basename(relative_path)}.replacement"
+            full_path = os.path.normpath(os.path.join(project_folder, os.path.dirname(relative_path), placeholder_filename))
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            write_file_atomic(full_path, f"Placeholder for {filename_from_step}")
+            outputs[os.path.relpath(full_path, project_folder)] = file_sha256(full_path)
+            log(f"Created placeholder for non-text file: {full_path}", f"Created placeholder file for non-text file: {full_path}")
+        else:
+            # We need to get content from the AI
+            try:
+                if not filename_from_step:
+                    log("No filename specified in step.")
+                    return logs, True, outputs
+                # Get the correct relative path
+                relative_path = intent.target
+                full_path = os.path.normpath(os.path.join(project_folder, relative_path))
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                original = read_patch_target(step, full_path)
+                content = None
+                if original is not None:
+                    content = get_edited_content_from_ai(step, project_folder, goal, relative_path, original)
+                    if content is None:
+                        log("The edits did not apply, regenerating the whole file.")
+                if content is not None:
+                    write_file_atomic(full_path, content)
+                    get_context_index(project_folder).record(relative_path, content)
+                    log("Applied edits to the existing file.")
+                elif STREAMING:
+                    # The context index picks the streamed file up on its next refresh
+                    size = stream_content_to_file(
+                        step, project_folder, goal, relative_path, full_path,
+                        lambda written: print(f"  {relative_path}: {written} bytes received...")
+                    )
+                    log(f"Streamed {size} bytes")
+                else:
+                    content = get_content_from_ai(step, project_folder, goal, relative_path)
+                    write_file_atomic(full_path, content)
+                    get_context_index(project_folder).record(relative_path, content)
+                outputs[os.path.normpath(relative_path)] = file_sha256(full_path)
+                log(f"Wrote content to {full_path}")
+            except Exception as e:
+                log(f"Failed to execute step: {e}")
+                return logs, False, outputs
+    elif kind == 'delete':
+        # Handle delete operations
+        filename_from_step = intent.filename
+        if filename_from_step:
+            # Get the correct relative path
+            relative_path = intent.target
+            full_path = os.path.normpath(os.path.join(project_folder, relative_path))
+            if os.path.exists(full_path):
+                os.remove(full_path)
+                get_context_index(project_folder).forget(relative_path)
+                outputs[os.path.normpath(relative_path)] = None
+                log(f"Deleted file: {full_path}")
+            else:
+                log(f"File {full_path} does not exist.")
+        else:
+            log("No filename specified in step.")
+    else:
+        # Other steps
+        log(f"Executed step directly: {step}", f"Directly executing step: {step}")
+    return logs, True, outputs
+
+def run_step_group(steps, project_folder, project_structure, filename_to_path, goal, verbose=True):
+    """
+    Executes several steps writing text files with a single API call.
+
+    Files missing from the response, or all of them if the call fails, are generated one
+    step at a time with run_step, as are updates of existing files (see read_patch_target).
+
+    Parameters:
+        steps (list): The step descriptions, as grouped by group_generation_steps.
+        project_folder (str): The path to the project folder.
+        project_structure (dict): The project directory structure.
+        filename_to_path (dict): A mapping from filenames to their paths.
+        goal (str): The user's overall goal.
+        verbose (bool): Print progress while the steps run.
+
+    Returns:
+        list: The (logs, ok, outputs) tuple of every step, as returned by run_step.
+    """
+    relative_paths = [parse_step(step, filename_to_path).target for step in steps]
+    # Updates of existing files are applied as edits by run_step instead
+    generated = [
+        (step, relative_path) for step, relative_path in zip(steps, relative_paths)
+        if read_patch_target(step, os.path.join(project_folder, relative_path)) is None
+    ]
+    contents = {}
+    if len(generated) > 1:
+        try:
+            contents = get_files_from_ai([step for step, _ in generated], project_folder, goal, [path for _, path in generated])
+        except Exception as e:
+            if verbose:
+                print(f"\nFailed to generate {len(generated)} files at once, generating them one at a time: {e}")
+    note = f"Generated together with {len(contents) - 1} other file(s)"
+
+    results = []
+    for step, relative_path in zip(steps, relative_paths):
+        if relative_path not in contents:
+            results.append(run_step(step, project_folder, project_structure, filename_to_path, goal, verbose))
+        else:
+            results.append(write_generated_file(step, project_folder, relative_path, contents[relative_path], note, verbose))
+    return results
+
+def write_generated_file(step, project_folder, relative_path, content, note, verbose=True):
+    """
+    Completes a step whose file content was generated ahead of it, e.g. together with other files.
+
+    Parameters:
+        step (str): The step description.
+        project_folder (str): The path to the project folder.
+        relative_path (str): The path of the file the step writes, relative to the project folder.
+        content (str): The generated content.
+        note (str): A log line saying how the content was generated.
+        verbose (bool): Print the log of the step.
+
+    Returns:
+        tuple: The (logs, ok, outputs) of the step, as returned by run_step.
+    """
+    full_path = os.path.normpath(os.path.join(project_folder, relative_path))
+    logs = [f"Executing step: {step}"]
+    try:
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        write_file_atomic(full_path, content)
+        get_context_index(project_folder).record(relative_path, content)
+        logs += [note, f"Wrote content to {full_path}"]
+        result = (logs, True, {relative_path: file_sha256(full_path)})
+    except Exception as e:
+        logs.append(f"Failed to execute step: {e}")
+        result = (logs, False, {})
+    if verbose:
+        print(f"\n{logs[0]}")
+        for line in logs[1:]:
+            print(line)
+    return result
+
+_validation_pool = None
+_validation_pool_lock = threading.Lock()
+
+def get_validation_pool():
+    """
+    Returns the process pool the written files are validated in, starting it on first use.
+
+    Returns:
+        ProcessPoolExecutor: The pool shared by every step.
+    """
+    global _validation_pool
+    with _validation_pool_lock:
+        if _validation_pool is None:
+            # Spawned rather than forked: the parent runs the HTTP loop and step threads
+            _validation_pool = ProcessPoolExecutor(max_workers=VALIDATION_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _validation_pool
+
+def validate_file(rel_path, content, known_paths):
+    """
+    Checks a generated file: Python files must compile and their imports of project modules must
+    resolve, JSON, TOML and YAML files must parse. Runs in the validation process pool.
+
+    Parameters:
+        rel_path (str): The path of the file relative to the project folder.
+        content (str): The content of the file.
+        known_paths (frozenset): The relative paths of the project files.
+
+    Returns:
+        list: The errors found, empty if the file is valid.
+    """
+    try:
+        if rel_path.endswith('.py'):
+            with _ast_parse_lock:
+                tree = compile(content, rel_path, 'exec', ast.PyCF_ONLY_AST)
+                compile(tree, rel_path, 'exec')
+            return check_python_imports(rel_path, tree, known_paths)
+        if rel_path.endswith('.json'):
+            json.loads(content)
+        elif rel_path.endswith('.toml') and tomllib is not None:
+            tomllib.loads(content)
+        elif rel_path.endswith(('.yaml', '.yml')) and yaml is not None:
+            list(yaml.safe_load_all(content))
+    except SyntaxError as e:
+        return [f"line {e.lineno}: {e.msg}"]
+    except Exception as e:
+        return [str(e)]
+    return []
+
+def check_python_imports(rel_path, tree, known_paths):
+    """
+    Checks that the imports of a Python file that refer to project modules resolve to files of the project.
+
+    An absolute import refers to the project if its first name is a module or package at the
+    project root, in src/ or next to the file; imports of anything else are left alone. Names
+    imported from a module (from module import name) are not checked.
+
+    Parameters:
+        rel_path (str): The path of the file relative to the project folder.
+        tree (ast.Module): The parsed file.
+        known_paths (frozenset): The relative paths of the project files.
+
+    Returns:
+        list: One error per import that does not resolve.
+    """
+    directories = set()
+    for path in known_paths:
+        directory = os.path.dirname(path)
+        while directory and directory not in directories:
+            directories.add(directory)
+            directory = os.path.dirname(directory)
+
+    def exists(parts):
+        path = os.path.join(*parts)
+        return path in directories or path + '.py' in known_paths
+
+    errors = []
+    roots = [[], ['src'], [part for part in os.path.dirname(rel_path).split(os.sep) if part]]
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules = [(alias.name, 0) for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            modules = [(node.module or '', node.level)]
+        else:
+            continue
+        for module, level in modules:
+            parts = [part for part in module.split('.') if part]
+            if level:
+                base = [part for part in os.path.dirname(rel_path).split(os.sep) if part]
+                if level - 1 > len(base):
+                    errors.append(f"line {node.lineno}: relative import beyond the top-level directory of the project")
+                    continue
+                base = base[:len(base) - (level - 1)]
+                if parts and not exists(base + parts):
+                    errors.append(f"line {node.lineno}: cannot resolve import of '{'.' * level}{module}', "
+                                  f"there is no {os.path.join(*base, *parts)}.py in the project")
+                continue
+            for root in roots:
+                if exists(root + parts[:1]):
+                    if not exists(root + parts):
+                        errors.append(f"line {node.lineno}: cannot resolve import of '{module}', "
+                                      f"there is no {os.path.join(*root, *parts)}.py in the project")
+                    break
+    return errors
+
+def build_repair_messages(step, project_folder, goal, target_path, content, errors):
+    """
+    Builds the messages asking the AI to correct a generated file that does not validate.
+
+    Parameters:
+        step (str): The step description.
+        project_folder (str): The path to the project folder.
+        goal (str): The user's overall goal.
+        target_path (str): The path of the file, relative to the project folder.
+        content (str): The current content of the file.
+        errors (list): The errors found by validate_file.
+
+    Returns:
+        list: A list of message dictionaries for the API.
+    """
+    shared, context = project_context(project_folder, step, target_path, exclude={os.path.normpath(target_path)})
+
+    system_message = {
+        'role': 'system',
+        'content': (
+            'You are an AI assistant specializing in software development. '
+            'Your task is to correct a file of the project that does not pass validation. '
+            'Do not include any explanations or specify filenames. '
+            'Only provide the complete corrected content enclosed in triple backticks.'
+        )
+    }
+    user_message = {
+        'role': 'user',
+        'content': (
+            f'Project Goal:\n"{goal}"\n\n'
+            f'{shared}\n'
+            f'{context}\n'
+            f'Current content of {target_path}:\n```\n{content}\n```\n\n'
+            f'The file {target_path} was written for the following step:\n\n"{step}"\n\n'
+            'Validating it reported these errors:\n' + ''.join(f'- {error}\n' for error in errors) + '\n'
+            'Only provide the complete corrected content enclosed in triple backticks.'
+        )
+    }
+    return [system_message, user_message]
+
+def get_repaired_content_from_ai(step, project_folder, goal, target_path, content, errors):
+    """
+    Gets a corrected version of a generated file that does not validate from the AI.
+
+    Parameters:
+        step (str): The step description.
+        project_folder (str): The path to the project folder.
+        goal (str): The user's overall goal.
+        target_path (str): The path of the file, relative to the project folder.
+        content (str): The current content of the file.
+        errors (list): The errors found by validate_file.
+
+    Returns:
+        str: The corrected content.
+    """
+    response = call_grok_api(build_repair_messages(step, project_folder, goal, target_path, content, errors),
+                             route=route_for_files([target_path]))
+    with METRICS.stage('parsing'):
+        content = parse_content_from_response(response)
+    return content
+
+def validate_step_files(step, outputs, project_folder, goal, filename_to_path, verbose=True):
+    """
+    Validates the files a step wrote with validate_file in the validation process pool, so that
+    the checks never hold up the event loop or other steps. A file that fails is regenerated with
+    the errors in the prompt, up to VALIDATION_MAX_REPAIRS times.
+
+    Parameters:
+        step (str): The step description.
+        outputs (dict): The files the step produced, as returned by run_step.
+        project_folder (str): The path to the project folder.
+        goal (str): The user's overall goal.
+        filename_to_path (dict): A mapping from filenames to their paths.
+        verbose (bool): Print the log lines as well.
+
+    Returns:
+        tuple: The log lines (list), whether every file is valid in the end (bool) and the outputs
+            with the hashes of regenerated files updated (dict).
+    """
+    logs = []
+    ok = True
+    outputs = dict(outputs)
+
+    def log(message):
+        logs.append(message)
+        if verbose:
+            print(message)
+
+    known_paths = None
+    for relative_path, digest in outputs.items():
+        if digest is None or not relative_path.endswith(VALIDATED_EXTENSIONS):
+            continue
+        if known_paths is None:
+            known_paths = frozenset(get_path_index(filename_to_path).paths) | frozenset(outputs)
+        full_path = os.path.join(project_folder, relative_path)
+        try:
+            with open(full_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            for attempt in range(VALIDATION_MAX_REPAIRS + 1):
+                with METRICS.stage('validation'):
+                    try:
+                        errors = get_validation_pool().submit(validate_file, relative_path, content, known_paths).result()
+                    except Exception:
+                        # validate_file reports every problem in its result, so this is the pool failing:
+                        # no worker processes in a restricted sandbox, or a main module that cannot be
+                        # imported by them. Validate in this process instead.
+                        errors = validate_file(relative_path, content, known_paths)
+                if not errors or attempt == VALIDATION_MAX_REPAIRS:
+                    break
+                log(f"Validation of {relative_path} failed, regenerating it: {'; '.join(errors)}")
+                content = get_repaired_content_from_ai(step, project_folder, goal, relative_path, content, errors)
+                write_file_atomic(full_path, content)
+                get_context_index(project_folder).record(relative_path, content)
+                outputs[relative_path] = file_sha256(full_path)
+        except Exception as e:
+            errors = [str(e) or type(e).__name__]
+        if errors:
+            ok = False
+            log(f"Failed to execute step: {relative_path} does not validate: {'; '.join(errors)}")
+        elif attempt:
+            log(f"Validated {relative_path} after regenerating it")
+    return logs, ok, outputs
+
+def file_sha256(path):
+    """
+    Computes the sha256 of a file.
+
+    Parameters:
+        path (str): The path of the file.
+
+    Returns:
+        str: The hex digest, or None if the file does not exist.
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+def journal_path(project_folder):
+    """
+    Returns the path of the run journal that belongs to a project folder.
+
+    Parameters:
+        project_folder (str): The path to the project folder.
+
+    Returns:
+        str: The journal path, next to the project folder.
+    """
+    return os.path.normpath(project_folder) + '.journal.json'
+
+class RunJournal:
+    """
+    A record of a run that allows it to be resumed: the goal, the project structure, the plan
+    and the status and output hashes of every step. Saved atomically after every change.
+    """
+
+    def __init__(self, path, data):
+        """
+        Parameters:
+            path (str): The path of the journal file.
+            data (dict): The journal content.
+        """
+        self.path = path
+        self.data = data
+        self.lock = threading.Lock()
+        # Snapshots are numbered so that an older one is never written over a newer one
+        self.version = 0
+        self.written = 0
+        self.write_lock = threading.Lock()
+
+    @classmethod
+    def create(cls, project_folder, goal, project_structure):
+        """
+        Creates and saves the journal of a new run.
+
+        Parameters:
+            project_folder (str): The path to the project folder.
+            goal (str): The user's goal description.
+            project_structure (dict): The project directory structure, including the top-level directory.
+
+        Returns:
+            RunJournal: The new journal.
+        """
+        journal = cls(journal_path(project_folder), {
+            'goal': goal,
+            'project_folder': os.path.abspath(project_folder),
+            'structure': project_structure,
+            'plan': None,
+            'plan_complete': False,
+            'steps': []
+        })
+        journal.save()
+        return journal
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a journal.
+
+        Parameters:
+            path (str): The journal file, or the project folder it belongs to.
+
+        Returns:
+            RunJournal: The loaded journal.
+        """
+        if os.path.isdir(path):
+            path = journal_path(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(path, json.load(f))
+
+    def save(self):
+        with self.lock:
+            self.version += 1
+            version = self.version
+            content = json.dumps(self.data, indent=4)
+        with self.write_lock:
+            if version < self.written:
+                # A newer snapshot, which includes this change, is already on disk
+                return
+            write_file_atomic(self.path, content)
+            self.written = version
+
+    def set_plan(self, plan, approved=None):
+        """
+        Records the complete plan. Steps of an earlier, incomplete plan with the same description
+        keep their record; every other step starts as pending.
+
+        Parameters:
+            plan (list): The plan steps.
+            approved (list): Whether each new step is approved to run; all of them if not given.
+        """
+        with self.lock:
+            earlier = {}
+            for record in self.data['steps']:
+                earlier.setdefault(record['step'], record)
+            self.data['plan'] = list(plan)
+            self.data['steps'] = [earlier.pop(step, None) or
+                                  {'step': step, 'status': 'pending', 'outputs': {}, 'approved': approved[i] if approved else True}
+                                  for i, step in enumerate(plan)]
+            self.data['plan_complete'] = True
+        self.save()
+
+    def add_step(self, step, approved=True):
+        """
+        Appends a step to the plan as pending, for plans that are executed while they arrive.
+
+        Parameters:
+            step (str): The step description.
+            approved (bool): Whether the step is approved to run.
+        """
+        with self.lock:
+            if self.data['plan'] is None:
+                self.data['plan'] = []
+            self.data['plan'].append(step)
+            self.data['steps'].append({'step': step, 'status': 'pending', 'outputs': {}, 'approved': approved})
+        self.save()
+
+    def set_approval_policy(self, policy):
+        """
+        Records the auto-approve policy the steps of a streamed plan are checked with, which is
+        applied again to the steps of a new plan if the run is resumed.
+
+        Parameters:
+            policy (str): The auto-approve policy.
+        """
+        with self.lock:
+            self.data['approve'] = policy
+        self.save()
+
+    def complete_plan(self):
+        """
+        Marks a plan built with add_step as complete.
+        """
+        with self.lock:
+            self.data['plan_complete'] = True
+        self.save()
+
+    def plan_complete(self):
+        """
+        Returns:
+            bool: True if the whole plan is recorded, False if there is none or it was still arriving.
+        """
+        with self.lock:
+            # Journals written before the marker existed only recorded complete plans
+            return self.data.get('plan_complete', self.data['plan'] is not None)
+
+    def is_approved(self, index):
+        """
+        Parameters:
+            index (int): The index of the step in the plan.
+
+        Returns:
+            bool: False if the step was rejected by the auto-approve policy.
+        """
+        with self.lock:
+            return self.data['steps'][index].get('approved', True)
+
+    def is_finished(self, index):
+        """
+        Checks whether a step finished in an earlier run and its outputs are still on disk unchanged.
+
+        Parameters:
+            index (int): The index of the step in the plan.
+
+        Returns:
+            bool: True if the step can be skipped.
+        """
+        with self.lock:
+            record = self.data['steps'][index]
+            if record['status'] != 'done':
+                return False
+            outputs = dict(record['outputs'])
+        project_folder = self.data['project_folder']
+        return all(file_sha256(os.path.join(project_folder, rel_path)) == digest for rel_path, digest in outputs.items())
+
+    def record_step(self, index, ok, outputs):
+        """
+        Records the outcome of a step and saves the journal.
+
+        Parameters:
+            index (int): The index of the step in the plan.
+            ok (bool): Whether the step succeeded.
+            outputs (dict): The files the step produced, mapped to their sha256 (None for deleted files).
+        """
+        with self.lock:
+            record = self.data['steps'][index]
+            record['status'] = 'done' if ok else 'failed'
+            record['outputs'] = outputs
+        self.save()
+
+    def counts(self):
+        """
+        Counts the steps by status.
+
+        Returns:
+            dict: A mapping from status to number of steps.
+        """
+        counts = {}
+        with self.lock:
+            for record in self.data['steps']:
+                counts[record['status']] = counts.get(record['status'], 0) + 1
+        return counts
+
+def filecmp_equal(first, second):
+    """
+    Checks whether two files have the same content.
+
+    Parameters:
+        first (str): The path of the first file.
+        second (str): The path of the second file.
+
+    Returns:
+        bool: True if both files exist and are equal.
+    """
+    try:
+        return filecmp.cmp(first, second, shallow=False)
+    except OSError:
+        return False
+
+def file_has_content(path, data):
+    """
+    Checks whether a file already holds exactly the given bytes. The file is only read if its size matches.
+
+    Parameters:
+        path (str): The path of the file.
+        data (bytes): The expected content.
+
+    Returns:
+        bool: True if the file exists with that content.
+    """
+    try:
+        if os.path.getsize(path) != len(data):
+            return False
+        with open(path, 'rb') as f:
+            return f.read() == data
+    except OSError:
+        return False
+
+def replace_file(temp_path, path):
+    """
+    Moves a completely written temporary file into place, keeping the permissions of the file it
+    replaces (mkstemp creates files readable only by their owner).
+
+    Parameters:
+        temp_path (str): The temporary file, in the same directory as path.
+        path (str): The destination.
+    """
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except OSError:
+        mode = 0o644
+    os.chmod(temp_path, mode)
+    os.replace(temp_path, path)
+
+def write_file_atomic(path, content):
+    """
+    Writes a text file atomically by writing a temporary file next to it and renaming it.
+    Concurrent readers see either the old or the new content, never a partial file, and a crash
+    never leaves a half-written file. A file that already has the content is left untouched.
+
+    Parameters:
+        path (str): The path of the file to write.
+        content (str): The content to write.
+
+    Returns:
+        bool: True if the file was written, False if it already had the content.
+    """
+    # What text mode would write, so that unchanged files are recognized on every platform
+    data = (content.replace('\n', os.linesep) if os.linesep != '\n' else content).encode('utf-8')
+    with METRICS.stage('file_io'):
+        if file_has_content(path, data):
+            return False
+        fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=os.path.dirname(path) or '.')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            replace_file(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+    return True
+
+class ProjectContextIndex:
+    """
+    An in-process index of the project files used as prompt context: every text file, with
+    large files shortened to CONTEXT_MAX_FILE_BYTES (see read_context_text).
+
+    Files written by execute_step are recorded directly. refresh() only stats the files on
+    disk and re-reads those whose size or modification time changed, so unchanged files are
+    never read again and the shared context is rebuilt only when something changed.
+    """
+
+    def __init__(self, project_folder):
+        """
+        Parameters:
+            project_folder (str): The path to the project folder.
+        """
+        self.project_folder = project_folder
+        self.lock = threading.Lock()
+        # Relative path -> (mtime_ns, size, sha256, content)
+        self.entries = {}
+        # Relative path -> (sha256, FileAnalysis) of the last analyzed content
+        self.analyses = {}
+        # The relative paths of all files, including those that are not used as context
+        self.listed = set()
+        # The files with content, in the order they got their current content
+        self.order = {}
+        # Incremented on every change; the shared context is cached as (token_budget, version, text)
+        self.version = 0
+        self.shared = None
+
+    def record(self, rel_path, content):
+        """
+        Records a file that has just been written.
+
+        Parameters:
+            rel_path (str): The path of the file relative to the project folder.
+            content (str): The content that was written.
+        """
+        rel_path = os.path.normpath(rel_path)
+        try:
+            stat = os.stat(os.path.join(self.project_folder, rel_path))
+        except FileNotFoundError:
+            return
+        data = content.encode('utf-8')
+        if len(data) > CONTEXT_MAX_FILE_BYTES:
+            half = CONTEXT_MAX_FILE_BYTES // 2
+            content = context_text(data[:half], data[-half:], len(data) - 2 * half)
+        digest = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        with self.lock:
+            old = self.entries.get(rel_path)
+            self.entries[rel_path] = (stat.st_mtime_ns, stat.st_size, digest, content)
+            self.listed.add(rel_path)
+            if old is None or old[2] != digest:
+                self.changed(rel_path, content)
+
+    def forget(self, rel_path):
+        """
+        Removes a deleted file from the index.
+
+        Parameters:
+            rel_path (str): The path of the file relative to the project folder.
+        """
+        rel_path = os.path.normpath(rel_path)
+        with self.lock:
+            self.listed.discard(rel_path)
+            if self.entries.pop(rel_path, None) is not None:
+                self.changed(rel_path, '')
+
+    def refresh(self):
+        """
+        Picks up files created, changed or removed outside of execute_step.
+        Only files whose size or modification time changed are read.
+        """
+        seen = set()
+        listed = set()
+        pending = [(self.project_folder, '')]
+        while pending:
+            directory, prefix = pending.pop()
+            try:
+                scanner = os.scandir(directory)
+            except FileNotFoundError:
+                continue
+            with scanner:
+                for entry in scanner:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in CONTEXT_SKIP_DIRECTORIES:
+                            pending.append((entry.path, prefix + entry.name + os.sep))
+                        continue
+                    rel_path = prefix + entry.name
+                    listed.add(rel_path)
+                    # Placeholders of non-text files (see create_directories) are only listed
+                    if not entry.name.endswith('.replacement'):
+                        seen.add(rel_path)
+                        try:
+                            self.update(rel_path, entry.stat())
+                        except (OSError, ValueError):
+                            # Deleted or truncated by a concurrently running step
+                            seen.discard(rel_path)
+        with self.lock:
+            for rel_path in [path for path in self.entries if path not in seen]:
+                del self.entries[rel_path]
+                self.changed(rel_path, '')
+            if listed != self.listed:
+                self.listed = listed
+                self.version += 1
+
+    def update(self, rel_path, stat):
+        with self.lock:
+            old = self.entries.get(rel_path)
+        if old is not None and old[:2] == (stat.st_mtime_ns, stat.st_size):
+            return
+        # Binary files are kept with no content, so that they are not sniffed again until they change
+        content = read_context_text(os.path.join(self.project_folder, rel_path), CONTEXT_MAX_FILE_BYTES)
+        digest = hashlib.sha256(content.encode('utf-8')).hexdigest() if content is not None else None
+        with self.lock:
+            if old is not None and old[2] == digest:
+                # Touched but unchanged: keep the content, remember the new stat
+                self.entries[rel_path] = (stat.st_mtime_ns, stat.st_size, digest, old[3])
+            else:
+                self.entries[rel_path] = (stat.st_mtime_ns, stat.st_size, digest, content)
+                self.changed(rel_path, content or '')
+
+    def changed(self, rel_path, content):
+        # Called with the lock held. A file moves to the end of the order when its content changes,
+        # so that the shared context stays the same up to the first file that changed.
+        self.order.pop(rel_path, None)
+        if content.strip():
+            self.order[rel_path] = None
+        self.version += 1
+
+    def files(self):
+        """
+        Returns the indexed files.
+
+        Returns:
+            dict: A mapping from relative paths to file contents.
+        """
+        with self.lock:
+            return {rel_path: entry[3] for rel_path, entry in self.entries.items() if entry[3] is not None}
+
+    def analysis(self, rel_path):
+        """
+        Returns the summary, imports and word counts of an indexed file, cached per content hash.
+
+        Parameters:
+            rel_path (str): The path of the file relative to the project folder.
+
+        Returns:
+            FileAnalysis: The analysis, or None if the file is not indexed.
+        """
+        with self.lock:
+            entry = self.entries.get(rel_path)
+            cached = self.analyses.get(rel_path)
+        if entry is None:
+            return None
+        if cached is not None and cached[0] == entry[2]:
+            return cached[1]
+        result = analyze_file(rel_path, entry[3])
+        with self.lock:
+            self.analyses[rel_path] = (entry[2], result)
+        return result
+
+    def render_shared(self, token_budget=CONTEXT_TOKEN_BUDGET):
+        """
+        Returns the part of the prompt context that is the same for every step: the sorted paths
+        of all project files, then a summary of every file with content in the order the files got
+        their content. Since files are only appended to it, successive prompts start with the same
+        text, which providers can serve from their prompt cache. Cached until a file changes.
+
+        Parameters:
+            token_budget (int): Approximate maximum number of tokens of the summaries; 0 includes
+                every file in full instead.
+
+        Returns:
+            str: The context text, or an empty string if the project has no files yet.
+        """
+        with self.lock:
+            if self.shared is not None and self.shared[:2] == (token_budget, self.version):
+                return self.shared[2]
+            version = self.version
+            paths = sorted(self.listed | set(self.entries))
+            ordered = [(rel_path, self.entries[rel_path][3]) for rel_path in self.order]
+        parts = []
+        if paths:
+            parts.append("Project files:\n" + ''.join(f"{rel_path}\n" for rel_path in paths))
+        if ordered:
+            parts.append("\nHere are the current files in the project:\n")
+        used = 0
+        for rel_path, content in ordered:
+            if token_budget <= 0:
+                parts.append(f"\nFilename: {rel_path}\nContent:\n```\n{content}\n```\n")
+                continue
+            analysis = self.analysis(rel_path)
+            if analysis is None:
+                continue
+            summary = f"\nFilename: {rel_path}\nSummary:\n```\n{analysis.summary}\n```\n"
+            used += estimate_tokens(summary)
+            if used > token_budget:
+                # Stop rather than skip, so that files added later never end up in between
+                break
+            parts.append(summary)
+        text = ''.join(parts)
+        with self.lock:
+            if self.version == version:
+                self.shared = (token_budget, version, text)
+        return text
+
+_context_indexes = {}
+_context_indexes_lock = threading.Lock()
+
+# ast.parse is not thread-safe on some CPython 3.11 releases ("AST constructor recursion depth
+# mismatch"), and files are analyzed from several plan steps at once.
+_ast_parse_lock = threading.Lock()
+
+def get_context_index(project_folder):
+    """
+    Returns the context index of a project folder, creating it on first use.
+
+    Parameters:
+        project_folder (str): The path to the project folder.
+
+    Returns:
+        ProjectContextIndex: The index shared by every step of the project.
+    """
+    key = os.path.abspath(project_folder)
+    with _context_indexes_lock:
+        if key not in _context_indexes:
+            _context_indexes[key] = ProjectContextIndex(key)
+        return _context_indexes[key]
+
+def forget_context_index(project_folder):
+    """
+    Drops the context index of a project folder once no more steps of the project will run.
+
+    Parameters:
+        project_folder (str): The path to the project folder.
+    """
+    with _context_indexes_lock:
+        _context_indexes.pop(os.path.abspath(project_folder), None)
+
+def read_context_text(path, limit=CONTEXT_MAX_FILE_BYTES):
+    """
+    Reads a project file for use as context without holding much more than limit bytes of it:
+    smaller files are read whole, larger ones are mapped into memory and only their head and tail
+    are copied out.
+
+    Parameters:
+        path (str): The path of the file.
+        limit (int): Maximum number of bytes used.
+
+    Returns:
+        str: The text of the file, shortened in the middle if it is larger than limit, or None for a binary file.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= limit:
+            return context_text(f.read())
+        half = limit // 2
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return context_text(mapped[:half], mapped[len(mapped) - half:], len(mapped) - 2 * half)
+
+def context_text(head, tail=b'', omitted=0):
+    """
+    Decodes the content of a file, or its head and tail, as context text.
+
+    Parameters:
+        head (bytes): The content of the file, or its first bytes.
+        tail (bytes): The last bytes of the file, if omitted bytes were left out before them.
+        omitted (int): The number of bytes left out between head and tail.
+
+    Returns:
+        str: The text, or None if the file is binary.
+    """
+    if is_binary_data(head[:BINARY_SNIFF_BYTES]):
+        return None
+    if not omitted:
+        try:
+            return head.decode('utf-8').replace('\r\n', '\n')
+        except UnicodeDecodeError:
+            return None
+    # Characters cut in half at the edges are dropped
+    text = head.decode('utf-8', 'ignore') + f"\n[... {omitted} bytes omitted ...]\n" + tail.decode('utf-8', 'ignore')
+    return text.replace('\r\n', '\n')
+
+def is_binary_data(sample):
+    """
+    Sniffs whether data is binary: it contains a NUL byte or is not valid UTF-8.
+
+    Parameters:
+        sample (bytes): The first bytes of a file.
+
+    Returns:
+        bool: True if the data is binary.
+    """
+    if b'\0' in sample:
+        return True
+    try:
+        sample.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off at the end of the sample does not count
+        return e.start < len(sample) - 3 or e.reason != 'unexpected end of data'
+    return False
+
+class FileAnalysis:
+    """
+    What the context selector needs to know about a project file.
+    """
+    __slots__ = ('summary', 'imports', 'words')
+
+    def __init__(self, summary, imports, words):
+        """
+        Parameters:
+            summary (str): Signatures and docstrings (or headings) of the file.
+            imports (list): (module, level, names) tuples of the Python imports in the file.
+            words (dict): Counts of the identifiers and words in the file.
+        """
+        self.summary = summary
+        self.imports = imports
+        self.words = words
+
+def estimate_tokens(text):
+    """
+    Roughly estimates the number of tokens in a text (about four characters per token).
+
+    Parameters:
+        text (str): The text.
+
+    Returns:
+        int: The estimated token count.
+    """
+    return len(text) // 4 + 1
+
+@functools.lru_cache(maxsize=8192)
+def filename_pattern(name):
+    """
+    Compiles the pattern matching a file name mentioned as a whole word, e.g. in a step description.
+
+    Parameters:
+        name (str): The lower-case file name.
+
+    Returns:
+        re.Pattern: The compiled pattern.
+    """
+    return re.compile(r'(?<![\w.])' + re.escape(name) + r'(?![\w])')
+
+def split_words(text):
+    """
+    Splits text into lower-case words, breaking up snake_case and CamelCase identifiers.
+
+    Parameters:
+        text (str): The text.
+
+    Returns:
+        list: The words, without stop words and single characters.
+    """
+    words = []
+    for identifier in re.findall(r'[A-Za-z][A-Za-z0-9]*', text):
+        for word in re.findall(r'[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])', identifier):
+            word = word.lower()
+            if len(word) > 1 and word not in STOP_WORDS:
+                words.append(word)
+    return words
+
+def summarize_python(tree):
+    """
+    Builds a compact outline of a Python module: docstrings and class/function signatures.
+
+    Parameters:
+        tree (ast.Module): The parsed module.
+
+    Returns:
+        list: The outline lines.
+    """
+    lines = []
+    docstring = ast.get_docstring(tree)
+    if docstring:
+        lines.append(f'"""{docstring.splitlines()[0]}"""')
+    pending = [(node, 0) for node in reversed(tree.body)]
+    while pending:
+        node, depth = pending.pop()
+        indent = '    ' * depth
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            prefix = 'async def' if isinstance(node, ast.AsyncFunctionDef) else 'def'
+            returns = f' -> {ast.unparse(node.returns)}' if node.returns else ''
+            lines.append(f'{indent}{prefix} {node.name}({ast.unparse(node.args)}){returns}: ...')
+        elif isinstance(node, ast.ClassDef):
+            bases = ', '.join(ast.unparse(base) for base in node.bases)
+            lines.append(f'{indent}class {node.name}' + (f'({bases})' if bases else '') + ':')
+            pending.extend((child, depth + 1) for child in reversed(node.body))
+        else:
+            continue
+        docstring = ast.get_docstring(node)
+        if docstring:
+            lines.append(f'{indent}    """{docstring.splitlines()[0]}"""')
+    return lines
+
+def analyze_file(rel_path, content):
     """
-    Calls the Grok-2 API with the given messages.
+    Analyzes a project file for context selection.
 
     Parameters:
-        messages (list): A list of message dictionaries for the API.
+        rel_path (str): The path of the file relative to the project folder.
+        content (str): The content of the file.
 
     Returns:
-        str: The content of the response from the Grok-2 model.
+        FileAnalysis: The summary, imports and word counts of the file.
     """
-    api_key = 'YOUR_API_KEY'  # Replace with your actual API key
-    url = 'https://api.x.ai/v1/chat/completions'
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': f'Bearer {api_key}'
-    }
-    data = {
-        'messages': messages,
-        'model': 'grok-beta',
-        'stream': False,
-        'temperature': 0
-    }
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code == 200:
-        result = response.json()
-        return result['choices'][0]['message']['content']
+    imports = []
+    if rel_path.endswith('.py'):
+        try:
+            with _ast_parse_lock:
+                tree = ast.parse(content)
+        except (SyntaxError, ValueError):
+            summary_lines = [line.rstrip() for line in content.splitlines() if re.match(r'\s*(?:async\s+def|def|class)\s', line)]
+            for match in re.finditer(r'^\s*(?:from\s+(\.*)([\w.]*)\s+import\s+([\w, ]+)|import\s+([\w.]+))', content, re.MULTILINE):
+                if match.group(4):
+                    imports.append((match.group(4), 0, []))
+                else:
+                    imports.append((match.group(2), len(match.group(1)), [name.strip() for name in match.group(3).split(',')]))
+        else:
+            summary_lines = summarize_python(tree)
+            for node in ast.walk(tree):
+                if isinstance(node, ast.Import):
+                    imports.extend((alias.name, 0, []) for alias in node.names)
+                elif isinstance(node, ast.ImportFrom):
+                    imports.append((node.module or '', node.level, [alias.name for alias in node.names]))
+    elif rel_path.endswith('.md'):
+        summary_lines = [line for line in content.splitlines() if line.startswith('#')]
     else:
-        raise Exception(f"Error: {response.status_code} - {response.text}")
+        summary_lines = content.splitlines()[:10]
+    words = {}
+    for word in split_words(content):
+        words[word] = words.get(word, 0) + 1
+    return FileAnalysis('\n'.join(summary_lines[:40]), imports, words)
 
-def determine_project_structure(goal):
+def resolve_imports(rel_path, imports, known_paths):
     """
-    Determines the project directory structure based on the user's goal.
+    Resolves the imports of a Python file to files of the project.
 
     Parameters:
-        goal (str): The user's goal description.
+        rel_path (str): The path of the importing file relative to the project folder.
+        imports (list): (module, level, names) tuples from analyze_file.
+        known_paths (set): The relative paths of the project files.
 
     Returns:
-        dict: A dictionary representing the project structure.
+        set: The relative paths of the imported project files.
     """
-    example_structure = {
-        "snake_game": {
-            "README.md": {},
-            "requirements.txt": {},
-            "main.py": {},
-            "game": {
-                "__init__.py": {},
-                "snake.py": {},
-                "food.py": {},
-                "game_manager.py": {}
-            },
-            "assets": {
-                "images": {
-                    "snake.png": {},
-                    "food.png": {}
-                },
-                "sounds": {
-                    "eat.wav": {},
-                    "game_over.wav": {}
-                }
-            },
-            "save_system": {
-                "__init__.py": {},
-                "save_manager.py": {}
-            },
-            "utils": {
-                "__init__.py": {},
-                "helpers.py": {}
-            }
-        }
-    }
+    resolved = set()
+    for module, level, names in imports:
+        if level:
+            base = os.path.dirname(rel_path)
+            for _ in range(level - 1):
+                base = os.path.dirname(base)
+            parts = [part for part in base.split(os.sep) if part] + [part for part in module.split('.') if part]
+        else:
+            parts = module.split('.')
+        for candidate_parts in [parts] + [parts + [name] for name in names]:
+            if not candidate_parts:
+                continue
+            module_path = os.path.join(*candidate_parts)
+            for candidate in (module_path + '.py', os.path.join(module_path, '__init__.py')):
+                if candidate in known_paths and candidate != rel_path:
+                    resolved.add(candidate)
+    return resolved
 
-    system_message = {
-        'role': 'system',
-        'content': (
-            'You are an AI assistant specializing in software development. '
-            'Your task is to provide the project directory structure based on the user\'s goal. '
-            'Please return the directory structure in JSON format, where folders are represented as objects, and files are empty objects. '
-            'Do not include any explanations or additional text before or after the JSON. '
-            'Only output the pure JSON content. '
-            'Here is an example:\n\n'
-            '```\n' + json.dumps(example_structure, indent=4) + '\n```'
-        )
-    }
-    user_message = {
-        'role': 'user',
-        'content': (
-            f'Based on the following goal, please provide the project directory structure. '
-            f'Please return the structure in JSON format similar to the example. '
-            f'Only output the JSON structure without any additional explanations or text.\n\n'
-            f'Goal:\n"{goal}"\n\n'
-            'Please enclose the JSON content within triple backticks (```).'
-        )
-    }
-    messages = [system_message, user_message]
-    response = call_grok_api(messages)
-    print("AI's response:")
-    print(response)
-    project_structure = parse_project_structure(response)
-    return project_structure
+def select_context(index, step, target_path=None, token_budget=CONTEXT_TOKEN_BUDGET, exclude=()):
+    """
+    Selects the project files most relevant to a step and renders them in full within a token budget.
+    This part of the context comes after the shared context (see ProjectContextIndex.render_shared),
+    which already names and summarizes the files.
 
-def parse_project_structure(response):
+    Files are ranked by: being the target file, being named in the step, import edges to or
+    from those files, sharing the target's directory, and a local BM25 score of the step's
+    words against the file contents. Files scoring at least FULL_CONTEXT_MIN_SCORE are included
+    in full, the most relevant first, while the budget allows.
+
+    Parameters:
+        index (ProjectContextIndex): The context index of the project.
+        step (str): The step description.
+        target_path (str): The path of the file the step writes, relative to the project folder.
+        token_budget (int): Approximate maximum number of tokens; 0 selects nothing, since the
+            shared context then contains every file in full.
+        exclude (set): Relative paths of files to leave out, e.g. because the prompt contains them anyway.
+
+    Returns:
+        str: The context text, or an empty string if no file is relevant.
     """
-    Parses the project directory structure from the AI's response.
+    if token_budget <= 0:
+        return ''
+    files = {rel_path: content for rel_path, content in index.files().items() if rel_path not in exclude and content.strip()}
+    if not files:
+        return ''
+    analyses = {rel_path: index.analysis(rel_path) for rel_path in files}
+    analyses = {rel_path: analysis for rel_path, analysis in analyses.items() if analysis is not None}
+    known_paths = set(analyses)
+    imported = {rel_path: resolve_imports(rel_path, analysis.imports, known_paths) for rel_path, analysis in analyses.items()}
+    scores = dict.fromkeys(analyses, 0.0)
+
+    target = os.path.normpath(target_path) if target_path else None
+    target_dir = os.path.dirname(target) if target else None
+    step_lower = step.lower()
+    anchors = set()
+    for rel_path in analyses:
+        if rel_path == target:
+            scores[rel_path] += 10
+            anchors.add(rel_path)
+        elif filename_pattern(os.path.basename(rel_path).lower()).search(step_lower):
+            scores[rel_path] += 6
+            anchors.add(rel_path)
+    for rel_path in analyses:
+        if imported[rel_path] & anchors:
+            scores[rel_path] += 3
+        if target and rel_path != target and os.path.dirname(rel_path) == target_dir:
+            scores[rel_path] += 2
+    for anchor in anchors:
+        for rel_path in imported[anchor]:
+            scores[rel_path] += 4
+
+    # BM25 of the step's words over the file contents, scaled to at most 3 points
+    query = set(split_words(step))
+    if query:
+        lengths = {rel_path: sum(analysis.words.values()) for rel_path, analysis in analyses.items()}
+        average_length = (sum(lengths.values()) / len(lengths)) or 1
+        documents = {word: sum(1 for analysis in analyses.values() if word in analysis.words) for word in query}
+        idf = {word: math.log(1 + (len(analyses) - documents[word] + 0.5) / (documents[word] + 0.5)) for word in query}
+        lexical = {}
+        for rel_path, analysis in analyses.items():
+            score = 0.0
+            for word in query:
+                count = analysis.words.get(word, 0)
+                if count:
+                    score += idf[word] * count * 2.2 / (count + 1.2 * (0.25 + 0.75 * lengths[rel_path] / average_length))
+            lexical[rel_path] = score
+        best = max(lexical.values())
+        if best > 0:
+            for rel_path, score in lexical.items():
+                scores[rel_path] += 3 * score / best
+
+    parts = ["Here are the files most relevant to this step:\n"]
+    used = estimate_tokens(parts[0])
+    for rel_path in sorted(analyses, key=lambda path: (-scores[path], path)):
+        if scores[rel_path] < FULL_CONTEXT_MIN_SCORE:
+            break
+        full = f"\nFilename: {rel_path}\nContent:\n```\n{files[rel_path]}\n```\n"
+        if used + estimate_tokens(full) <= token_budget:
+            parts.append(full)
+            used += estimate_tokens(full)
+    return ''.join(parts) if len(parts) > 1 else ''
+
+def project_context(project_folder, step, target_path=None, exclude=()):
+    """
+    Builds the prompt context of a step: the shared context that every prompt of the project
+    starts with, and the files most relevant to the step. Each gets half of CONTEXT_TOKEN_BUDGET.
 
     Parameters:
-        response (str): The response from the AI.
+        project_folder (str): The path to the project folder.
+        step (str): The step description.
+        target_path (str): The path of the file the step writes, relative to the project folder.
+        exclude (set): Relative paths of files to leave out of the step's context.
 
     Returns:
-        dict: A dictionary representing the project structure.
+        tuple: The shared context (str) and the context of the step (str).
     """
-    try:
-        # Extract JSON content between triple backticks
-        json_matches = re.findall(r'```(.*?)```', response, re.DOTALL)
-        if json_matches:
-            json_content = json_matches[0].strip()
-            structure = json.loads(json_content)
-            return structure
-        else:
-            print("No JSON content found in AI's response.")
-            print("AI's response:")
-            print(response)
-            return {}
-    except json.JSONDecodeError as e:
-        print(f"Error parsing project structure: {e}")
-        print("AI's response:")
-        print(response)
-        return {}
+    with METRICS.stage('context'):
+        index = get_context_index(project_folder)
+        index.refresh()
+        shared_budget = CONTEXT_TOKEN_BUDGET // 2
+        shared = index.render_shared(shared_budget)
+        context = select_context(index, step, target_path, CONTEXT_TOKEN_BUDGET - shared_budget, exclude)
+    set_call_tag('context_bytes', len(shared.encode('utf-8')) + len(context.encode('utf-8')))
+    return shared, context
 
-def format_structure(structure, indent=0):
+def build_content_messages(step, project_folder, goal, target_path=None):
     """
-    Formats the project structure dictionary into a string.
+    Builds the messages asking the AI for the content of a step, including the most relevant project files.
 
     Parameters:
-        structure (dict): The project directory structure.
-        indent (int): Current indentation level.
+        step (str): The step description.
+        project_folder (str): The path to the project folder.
+        goal (str): The user's overall goal.
+        target_path (str): The path of the file the step writes, relative to the project folder.
 
     Returns:
-        str: A formatted string representing the structure.
+        list: A list of message dictionaries for the API.
     """
-    lines = []
-    for key, value in structure.items():
-        lines.append('    ' * indent + key + ('/' if value else ''))
-        if isinstance(value, dict) and value:
-            lines.extend(format_structure(value, indent + 1))
-    return '\n'.join(lines)
+    shared, context = project_context(project_folder, step, target_path)
 
-def provide_example_subtasks(goal):
+    system_message = {
+        'role': 'system',
+        'content': (
+            'You are an AI assistant specializing in software development. '
+            'Your task is to provide the code or content for the requested step in the project. '
+            'Do not include any explanations or specify filenames. '
+            'Only provide the code or content enclosed in triple backticks.'
+        )
+    }
+    user_message = {
+        'role': 'user',
+        'content': (
+            f'Project Goal:\n"{goal}"\n\n'
+            f'{shared}\n'
+            f'{context}\n'
+            f'Please provide the content for the following step:\n\n"{step}"\n\n'
+            'Only provide the code or content enclosed in triple backticks.'
+        )
+    }
+    return [system_message, user_message]
+
+def get_content_from_ai(step, project_folder, goal, target_path=None):
     """
-    Provides an example list of reasonable subtasks based on the goal.
+    Gets content from the AI for the given step.
 
     Parameters:
-        goal (str): The user's goal description.
+        step (str): The step description.
+        project_folder (str): The path to the project folder.
+        goal (str): The user's overall goal.
+        target_path (str): The path of the file the step writes, relative to the project folder.
 
     Returns:
-        str: An example of reasonable subtasks.
+        str: The content to be written to the file.
     """
-    example_subtasks = (
-        "Example of a full list of subtasks for a snake game with a save system:\n\n"
-        "1. Set up the project directory structure.\n"
-        "2. Initialize a Git repository.\n"
-        "3. Create a virtual environment and install necessary packages.\n"
-        "4. Write the main game loop in main.py.\n"
-        "5. Implement the Snake class in snake.py.\n"
-        "6. Implement the Food class in food.py.\n"
-        "7. Implement the GameManager class in game_manager.py to handle game states.\n"
-        "8. Implement the SaveManager class in save_manager.py for saving and loading game states.\n"
-        "9. Write helper functions in helpers.py.\n"
-        "10. Add sound effects and images to the assets folder.\n"
-        "11. Update README.md with installation and usage instructions.\n"
-        "12. Write unit tests for the key components.\n"
-        "13. Clean up code and remove any unnecessary files.\n\n"
-        "Please ensure each subtask is concise and fits on a single line."
-    )
-    return example_subtasks
+    response = call_grok_api(build_content_messages(step, project_folder, goal, target_path), route=route_for_files([target_path]))
+    with METRICS.stage('parsing'):
+        content = parse_content_from_response(response)
+    return content
 
-def decompose_goal(goal, project_structure):
+def build_files_messages(steps, project_folder, goal, target_paths):
     """
-    Decomposes the user's goal into a detailed plan using the AI model.
+    Builds the messages asking the AI for the content of several files at once.
 
     Parameters:
-        goal (str): The user's goal description.
-        project_structure (dict): The project directory structure.
+        steps (list): The step descriptions.
+        project_folder (str): The path to the project folder.
+        goal (str): The user's overall goal.
+        target_paths (list): The path of the file each step writes, relative to the project folder.
 
     Returns:
-        list: A list of plan steps extracted from the model's response.
+        list: A list of message dictionaries for the API.
     """
-    example_subtasks = provide_example_subtasks(goal)
+    shared, context = project_context(project_folder, '\n'.join(steps), target_paths[0])
+
+    envelope = 'For every file, write a line "### FILE: <path>" followed by its content enclosed in triple backticks.'
     system_message = {
         'role': 'system',
         'content': (
             'You are an AI assistant specializing in software development. '
-            'Your task is to provide a detailed plan for the software project, including all operations in the project folder, such as file and folder operations. '
-            'When providing the plan, ensure that each subtask is concise and fits on a single line. '
-            'Do not split a single subtask into multiple lines.\n\n'
-            'Here is an example of the expected format for a snake game with a save system:\n\n' +
-            example_subtasks +
-            'Please follow this format closely when providing the plan.'
+            'Your task is to provide the code or content of several files of the project at once. '
+            'Do not include any explanations. '
+            f'{envelope}'
         )
     }
+    files = ''.join(f'{number}. File "{path}": {step}\n' for number, (step, path) in enumerate(zip(steps, target_paths), 1))
     user_message = {
         'role': 'user',
         'content': (
-            f'Based on the following goal and project directory structure, please provide a detailed plan, including all operations in the project folder. '
-            f'Ensure that the plan is as detailed as possible and includes only necessary files and steps relevant to the goal.\n\n'
-            f'Goal:\n"{goal}"\n\n'
-            f'Project Directory Structure:\n{json.dumps(project_structure, indent=4)}\n\n'
-            'Please ensure each subtask is concise and fits on a single line. '
-            'Do not split a single subtask into multiple lines.\n\n'
-            'Provide the detailed plan in a numbered list.'
+            f'Project Goal:\n"{goal}"\n\n'
+            f'{shared}\n'
+            f'{context}\n'
+            f'Please provide the content of the files for the following steps:\n\n{files}\n'
+            f'{envelope}'
         )
     }
-    messages = [system_message, user_message]
-    response = call_grok_api(messages)
-    plan = parse_subtasks(response)
-    return plan
+    return [system_message, user_message]
 
-def parse_subtasks(response):
+def get_files_from_ai(steps, project_folder, goal, target_paths):
     """
-    Parses the subtasks or plan steps from the AI's response.
+    Gets the content of several files from the AI with a single call.
 
     Parameters:
-        response (str): The response from the AI.
+        steps (list): The step descriptions.
+        project_folder (str): The path to the project folder.
+        goal (str): The user's overall goal.
+        target_paths (list): The path of the file each step writes, relative to the project folder.
 
     Returns:
-        list: A list of parsed steps.
+        dict: A mapping from the target paths found in the response to their content.
     """
-    steps = []
-    lines = response.strip().split('\n')
-    for line in lines:
-        if line.strip():
-            # Remove numbering if present
-            task = line.strip()
-            match = re.match(r'^\d+(\.\d+)*\.?\s*(.*)', task)
-            if match:
-                task = match.group(2).strip()
-            steps.append(task)
-    return steps
+    response = call_grok_api(build_files_messages(steps, project_folder, goal, target_paths), route=route_for_files(target_paths))
+    with METRICS.stage('parsing'):
+        contents = parse_files_from_response(response, target_paths)
+    return contents
 
-def build_filename_to_path_mapping(structure, current_path=''):
+def read_patch_target(step, full_path):
     """
-    Recursively builds a mapping from filenames to their paths in the project structure.
+    Reads the file a step updates, if the step should be applied as edits instead of a full rewrite.
 
     Parameters:
-        structure (dict): The project directory structure.
-        current_path (str): The current path in the recursion.
+        step (str): The step description.
+        full_path (str): The path of the file the step writes.
 
     Returns:
-        dict: A mapping from filenames to their paths.
+        str: The current content of the file, or None if the file should be generated in full.
     """
-    mapping = {}
-    for name, sub_structure in structure.items():
-        sanitized_name = sanitize_filename(name)
-        if '.' in name:
-            # It's a file
-            path = os.path.join(current_path, sanitized_name)
-            mapping[sanitized_name] = path
-        else:
-            # It's a directory
-            new_path = os.path.join(current_path, sanitized_name)
-            mapping.update(build_filename_to_path_mapping(sub_structure, new_path))
-    return mapping
-
-def execute_plan(plan, project_folder, project_structure, filename_to_path, goal):
-    logs = []
-    for step in plan:
-        logs.extend(execute_step(step, project_folder, project_structure, filename_to_path, goal))
-    return logs
+    if not PATCH_UPDATES or not PATCH_STEP_PATTERN.search(step):
+        return None
+    try:
+        if os.path.getsize(full_path) < PATCH_MIN_BYTES:
+            return None
+        with open(full_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
 
-def execute_step(step, project_folder, project_structure, filename_to_path, goal):
+def build_edit_messages(step, project_folder, goal, target_path, original):
     """
-    Executes a single step.
+    Builds the messages asking the AI for search/replace edits of an existing file.
 
     Parameters:
         step (str): The step description.
         project_folder (str): The path to the project folder.
-        project_structure (dict): The project directory structure.
-        filename_to_path (dict): A mapping from filenames to their paths.
+        goal (str): The user's overall goal.
+        target_path (str): The path of the file the step changes, relative to the project folder.
+        original (str): The current content of the file.
 
     Returns:
-        list: A log of execution details for this step.
+        list: A list of message dictionaries for the API.
     """
-    logs = []
-    print(f"\nExecuting step: {step}")
-    logs.append(f"Executing step: {step}")
+    shared, context = project_context(project_folder, step, target_path, exclude={os.path.normpath(target_path)})
 
-    # Determine if we need to get content from AI
-    if any(keyword in step.lower() for keyword in ['write', 'implement', 'add', 'update', 'create']):
-        filename_from_step = extract_filename(step)
-        if filename_from_step and is_non_text_file(filename_from_step):
-            # Handle non-text files
-            filename = filename_from_step
-            # Get the correct relative path
-            sanitized_filename = sanitize_filename(filename)
-            if sanitized_filename in filename_to_path:
-                relative_path = filename_to_path[sanitized_filename]
-            else:
-                relative_path = sanitized_filename
-            placeholder_filename = f"{os.path.basename(relative_path)}.replacement"
-            full_path = os.path.normpath(os.path.join(project_folder, os.path.dirname(relative_path), placeholder_filename))
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
-            with open(full_path, 'w', encoding='utf-8') as f:
-                f.write(f"Placeholder for {filename_from_step}")
-            print(f"Created placeholder file for non-text file: {full_path}")
-            logs.append(f"Created placeholder for non-text file: {full_path}")
-        else:
-            # We need to get content from the AI
-            try:
-                if filename_from_step:
-                    filename = filename_from_step
-                else:
-                    logs.append("No filename specified in step.")
-                    print("No filename specified in step.")
-                    return logs
-                # Get the correct relative path
-                sanitized_filename = sanitize_filename(filename)
-                if sanitized_filename in filename_to_path:
-                    relative_path = filename_to_path[sanitized_filename]
-                else:
-                    relative_path = sanitized_filename
-                content = get_content_from_ai(step, project_folder, goal)
-                full_path = os.path.normpath(os.path.join(project_folder, relative_path))
-                os.makedirs(os.path.dirname(full_path), exist_ok=True)
-                with open(full_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                print(f"Wrote content to {full_path}")
-                logs.append(f"Wrote content to {full_path}")
-            except Exception as e:
-                logs.append(f"Failed to execute step: {e}")
-                print(f"Failed to execute step: {e}")
-    elif 'delete' in step.lower():
-        # Handle delete operations
-        filename_from_step = extract_filename(step)
-        if filename_from_step:
-            filename = filename_from_step
-            # Get the correct relative path
-            sanitized_filename = sanitize_filename(filename)
-            if sanitized_filename in filename_to_path:
-                relative_path = filename_to_path[sanitized_filename]
-            else:
-                relative_path = sanitized_filename
-            full_path = os.path.normpath(os.path.join(project_folder, relative_path))
-            if os.path.exists(full_path):
-                os.remove(full_path)
-                print(f"Deleted file: {full_path}")
-                logs.append(f"Deleted file: {full_path}")
-            else:
-                logs.append(f"File {full_path} does not exist.")
-                print(f"File {full_path} does not exist.")
-        else:
-            logs.append("No filename specified in step.")
-            print("No filename specified in step.")
-    else:
-        # Other steps
-        print(f"Directly executing step: {step}")
-        logs.append(f"Executed step directly: {step}")
-    return logs
+    system_message = {
+        'role': 'system',
+        'content': (
+            'You are an AI assistant specializing in software development. '
+            'Your task is to change an existing file of the project for the requested step. '
+            'Do not include any explanations and do not repeat the whole file. '
+            'Reply only with one or more search/replace blocks in this format:\n'
+            '<<<<<<< SEARCH\n'
+            'lines copied exactly from the current file\n'
+            '=======\n'
+            'the lines replacing them\n'
+            '>>>>>>> REPLACE\n'
+            'Keep every SEARCH part short but unique within the file. An empty SEARCH part appends to the end of the file.'
+        )
+    }
+    user_message = {
+        'role': 'user',
+        'content': (
+            f'Project Goal:\n"{goal}"\n\n'
+            f'{shared}\n'
+            f'{context}\n'
+            f'Current content of {target_path}:\n```\n{original}\n```\n\n'
+            f'Please change the file {target_path} for the following step:\n\n"{step}"\n\n'
+            'Reply only with search/replace blocks.'
+        )
+    }
+    return [system_message, user_message]
+
+def get_edited_content_from_ai(step, project_folder, goal, target_path, original):
+    """
+    Gets edits of an existing file from the AI and applies them.
+
+    Parameters:
+        step (str): The step description.
+        project_folder (str): The path to the project folder.
+        goal (str): The user's overall goal.
+        target_path (str): The path of the file the step changes, relative to the project folder.
+        original (str): The current content of the file.
 
-def get_content_from_ai(step, project_folder, goal):
+    Returns:
+        str: The new content of the file, or None if the response contains no edits or one of them does not apply.
     """
-    Gets content from the AI for the given step.
+    response = call_grok_api(build_edit_messages(step, project_folder, goal, target_path, original),
+                             route=route_for_files([target_path]))
+    with METRICS.stage('parsing'):
+        edits = parse_edits(response)
+        content = original if edits else None
+        for search, replace in edits:
+            content = apply_edit(content, search, replace)
+            if content is None:
+                break
+    return content
+
+async def async_get_content_from_ai(step, project_folder, goal, target_path=None):
+    """
+    Asynchronous version of get_content_from_ai.
 
     Parameters:
         step (str): The step description.
         project_folder (str): The path to the project folder.
         goal (str): The user's overall goal.
+        target_path (str): The path of the file the step writes, relative to the project folder.
 
     Returns:
         str: The content to be written to the file.
     """
-    existing_files = {}
-    for root, dirs, files in os.walk(project_folder):
-        for filename in files:
-            if filename.endswith('.py') or filename.endswith('.txt') or filename.endswith('.md'):
-                file_path = os.path.join(root, filename)
-                rel_path = os.path.relpath(file_path, project_folder)
-                if os.path.isfile(file_path):
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        existing_files[rel_path] = f.read()
-
-    context = ""
-    if existing_files:
-        context = "Here are the current files in the project:\n"
-        for filename, content in existing_files.items():
-            context += f"\nFilename: {filename}\nContent:\n```\n{content}\n```\n"
-
-    system_message = {
-        'role': 'system',
-        'content': (
-            'You are an AI assistant specializing in software development. '
-            'Your task is to provide the code or content for the requested step in the project. '
-            'Do not include any explanations or specify filenames. '
-            'Only provide the code or content enclosed in triple backticks.'
-        )
-    }
-    user_message = {
-        'role': 'user',
-        'content': (
-            f'Project Goal:\n"{goal}"\n\n'
-            f'Please provide the content for the following step:\n\n"{step}"\n\n'
-            f'{context}\n'
-            'Only provide the code or content enclosed in triple backticks.'
-        )
-    }
-    messages = [system_message, user_message]
-    response = call_grok_api(messages)
-    content = parse_content_from_response(response)
+    # Building the prompt reads the project files; keep that off the event loop
+    messages = await asyncio.to_thread(build_content_messages, step, project_folder, goal, target_path)
+    response = await async_call_grok_api(messages, route=route_for_files([target_path]))
+    with METRICS.stage('parsing'):
+        content = parse_content_from_response(response)
     return content
 
+async def async_stream_content_to_file(step, project_folder, goal, target_path, full_path, on_progress=None):
+    """
+    Streams the content for a step from the AI straight into a file.
+
+    Parameters:
+        step (str): The step description.
+        project_folder (str): The path to the project folder.
+        goal (str): The user's overall goal.
+        target_path (str): The path of the file the step writes, relative to the project folder.
+        full_path (str): The path of the file to write.
+        on_progress (callable): Called with the number of bytes written so far, at most once
+            every STREAM_PROGRESS_INTERVAL seconds.
+
+    Returns:
+        int: The size of the written file in bytes.
+    """
+    messages = await asyncio.to_thread(build_content_messages, step, project_folder, goal, target_path)
+    writer = StreamingContentWriter(full_path)
+    last_report = time.monotonic()
+    try:
+        async for piece in async_stream_grok_api(messages, route_for_files([target_path])):
+            writer.feed(piece)
+            if on_progress is not None and time.monotonic() - last_report >= STREAM_PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                on_progress(writer.written)
+        return writer.finish()
+    except BaseException:
+        writer.abort()
+        raise
+
+def stream_content_to_file(step, project_folder, goal, target_path, full_path, on_progress=None):
+    """
+    Synchronous version of async_stream_content_to_file.
+    """
+    return run_sync(async_stream_content_to_file(step, project_folder, goal, target_path, full_path, on_progress))
+
 def parse_content_from_response(response):
     """
     Parses the content from the AI's response.
@@ -432,6 +4459,271 @@ def parse_content_from_response(response):
         content = response.strip()
     return content
 
+def parse_files_from_response(response, target_paths):
+    """
+    Parses the content of several files from a response using "### FILE: <path>" headers.
+
+    Parameters:
+        response (str): The response from the AI.
+        target_paths (list): The requested paths, relative to the project folder.
+
+    Returns:
+        dict: A mapping from the requested paths found in the response to their content.
+            A header naming the path with a leading directory, or only the file name when it
+            is unique among the requested files, also counts.
+    """
+    wanted = [os.path.normpath(path) for path in target_paths]
+    by_name = collections.Counter(os.path.basename(path) for path in wanted)
+    sections = re.split(r'^#{1,6}\s*FILE:\s*(.+?)\s*$', response.replace('\r\n', '\n'), flags=re.MULTILINE)
+    contents = {}
+    for header, body in zip(sections[1::2], sections[2::2]):
+        path = os.path.normpath(header.strip('`*"\' '))
+        match = next((candidate for candidate in wanted if path == candidate or path.endswith(os.sep + candidate)), None)
+        if match is None and by_name[os.path.basename(path)] == 1:
+            match = next(candidate for candidate in wanted if os.path.basename(candidate) == os.path.basename(path))
+        if match is not None and match not in contents:
+            contents[match] = parse_content_from_response(body)
+    return contents
+
+def parse_edits(response):
+    """
+    Parses search/replace blocks, or the hunks of a unified diff, from a response.
+
+    Parameters:
+        response (str): The response from the AI.
+
+    Returns:
+        list: (search, replace) pairs of text, in order. An empty search text appends to the file.
+    """
+    edits = []
+    lines = response.replace('\r\n', '\n').split('\n')
+    i = 0
+    while i < len(lines):
+        if re.match(r'<{5,}\s*SEARCH\s*$', lines[i].strip()):
+            search, replace = [], []
+            part = search
+            i += 1
+            while i < len(lines) and not re.match(r'>{5,}\s*REPLACE\s*$', lines[i].strip()):
+                if part is search and re.match(r'={5,}$', lines[i].strip()):
+                    part = replace
+                else:
+                    part.append(lines[i])
+                i += 1
+            edits.append(('\n'.join(search), '\n'.join(replace)))
+        elif lines[i].startswith('@@'):
+            search, replace = [], []
+            i += 1
+            while i < len(lines) and not lines[i].startswith(('@@', '--- ', '+++ ', '```')):
+                line = lines[i]
+                if line.startswith('+'):
+                    replace.append(line[1:])
+                elif line.startswith('-'):
+                    search.append(line[1:])
+                elif not line.startswith('\\'):
+                    # Context line; models often drop the leading space of empty ones
+                    search.append(line[1:] if line.startswith(' ') else line)
+                    replace.append(search[-1])
+                i += 1
+            while search and replace and search[-1] == replace[-1] == '':
+                search.pop()
+                replace.pop()
+            edits.append(('\n'.join(search), '\n'.join(replace)))
+            continue
+        i += 1
+    return edits
+
+def apply_edit(content, search, replace):
+    """
+    Applies a search/replace edit: to an exact match of the search text, then to lines that match
+    it apart from whitespace, then to the most similar lines.
+
+    Parameters:
+        content (str): The content of the file.
+        search (str): The text to replace; empty to append the replacement to the file.
+        replace (str): The replacement text.
+
+    Returns:
+        str: The changed content, or None if no lines are similar enough to the search text.
+    """
+    if not search.strip():
+        return content + ('\n' if content and not content.endswith('\n') else '') + replace + '\n'
+    if search in content:
+        if not replace and search + '\n' in content:
+            return content.replace(search + '\n', '', 1)
+        return content.replace(search, replace, 1)
+
+    lines = content.split('\n')
+    search_lines = search.strip('\n').split('\n')
+    replace_lines = replace.split('\n') if replace else []
+    size = len(search_lines)
+    wanted = [line.strip() for line in search_lines]
+    stripped = [line.strip() for line in lines]
+    start = next((start for start in range(len(lines) - size + 1) if stripped[start:start + size] == wanted), None)
+    if start is None:
+        best = PATCH_FUZZY_THRESHOLD
+        matcher = difflib.SequenceMatcher(autojunk=False)
+        matcher.set_seq2('\n'.join(wanted))
+        for candidate in range(len(lines) - size + 1):
+            matcher.set_seq1('\n'.join(stripped[candidate:candidate + size]))
+            if matcher.real_quick_ratio() < best or matcher.quick_ratio() < best:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= best:
+                best, start = ratio, candidate
+        if start is None:
+            return None
+
+    # Re-indent the replacement if the model changed the indentation of the matched lines
+    first = next((i for i, line in enumerate(search_lines) if line.strip()), 0)
+    found_indent = lines[start + first][:len(lines[start + first]) - len(lines[start + first].lstrip())]
+    search_indent = search_lines[first][:len(search_lines[first]) - len(search_lines[first].lstrip())]
+    if found_indent != search_indent:
+        if found_indent.startswith(search_indent):
+            replace_lines = [found_indent[len(search_indent):] + line if line.strip() else line for line in replace_lines]
+        elif search_indent.startswith(found_indent):
+            extra = len(search_indent) - len(found_indent)
+            replace_lines = [line[extra:] if line[:extra].strip() == '' else line for line in replace_lines]
+    return '\n'.join(lines[:start] + replace_lines + lines[start + size:])
+
+class StreamingContentWriter:
+    """
+    Writes the code blocks of a streamed response to a file while the response arrives.
+
+    The result is exactly what parse_content_from_response returns for the complete response:
+    code blocks joined by newlines, or the whole stripped response if it has no complete code
+    block. Only text outside code blocks before the first block is kept in memory. The file is
+    written to a temporary path and renamed into place by finish().
+    """
+
+    def __init__(self, path):
+        """
+        Parameters:
+            path (str): The path of the file to write.
+        """
+        self.path = path
+        fd, self.temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=os.path.dirname(path) or '.')
+        self.file = os.fdopen(fd, 'wb+')
+        self.state = 'outside'
+        # Text not yet processed: a trailing '\r' or up to two backticks that may start a fence
+        self.carry = ''
+        self.pending = ''
+        self.language = ''
+        self.blocks = 0
+        # Bytes written so far and the size of the file after the last complete block
+        self.written = 0
+        self.committed = 0
+        # For the no-code-block fallback: text before the first fence and the fence line itself
+        self.prefix = []
+
+    def emit(self, text):
+        if text:
+            data = text.encode('utf-8')
+            self.file.write(data)
+            self.written += len(data)
+
+    def feed(self, text):
+        """
+        Processes the next piece of the response.
+
+        Parameters:
+            text (str): The piece of the response.
+        """
+        text = self.carry + text
+        self.carry = ''
+        if text.endswith('\r'):
+            text, self.carry = text[:-1], '\r'
+        self.process(self.pending + text.replace('\r\n', '\n'))
+
+    def process(self, buffer):
+        self.pending = ''
+        i = 0
+        while i < len(buffer):
+            if self.state == 'outside':
+                j = buffer.find('```', i)
+                if j < 0:
+                    # Hold back trailing backticks that may be the start of a fence
+                    k = max(len(buffer.rstrip('`')), i)
+                    if self.blocks == 0:
+                        self.prefix.append(buffer[i:k])
+                    self.pending = buffer[k:]
+                    return
+                if self.blocks == 0:
+                    self.prefix.append(buffer[i:j])
+                self.state = 'language'
+                self.language = ''
+                i = j + 3
+            elif self.state == 'language':
+                # An opening fence may be followed by a language name on its own line
+                run = re.match(r'\w*', buffer[i:]).group(0)
+                self.language += run
+                i += len(run)
+                if i == len(buffer):
+                    return
+                if self.blocks > 0:
+                    self.emit('\n')
+                if buffer[i] == '\n':
+                    if self.blocks == 0:
+                        self.prefix.append(f'```{self.language}\n')
+                    i += 1
+                else:
+                    if self.blocks == 0:
+                        self.prefix.append('```')
+                    self.emit(self.language)
+                self.state = 'inside'
+            else:
+                j = buffer.find('```', i)
+                if j < 0:
+                    k = max(len(buffer.rstrip('`')), i)
+                    self.emit(buffer[i:k])
+                    self.pending = buffer[k:]
+                    return
+                self.emit(buffer[i:j])
+                self.blocks += 1
+                self.committed = self.written
+                self.prefix = []
+                self.state = 'outside'
+                i = j + 3
+
+    def finish(self):
+        """
+        Completes the file and moves it into place.
+
+        Returns:
+            int: The size of the written file in bytes.
+        """
+        if self.carry:
+            self.process(self.pending + self.carry)
+            self.carry = ''
+        if self.blocks > 0:
+            # Drop an unterminated last block, as the regular expression would
+            self.file.truncate(self.committed)
+        else:
+            # No complete code block: the content is the whole stripped response
+            self.file.seek(0)
+            streamed = self.file.read().decode('utf-8')
+            if self.state == 'language':
+                self.prefix.append(f'```{self.language}')
+            content = (''.join(self.prefix) + streamed + self.pending).strip().encode('utf-8')
+            self.file.seek(0)
+            self.file.truncate()
+            self.file.write(content)
+            self.committed = len(content)
+        self.file.close()
+        if filecmp_equal(self.temp_path, self.path):
+            # Unchanged: keep the existing file and its modification time
+            os.remove(self.temp_path)
+        else:
+            replace_file(self.temp_path, self.path)
+        return self.committed
+
+    def abort(self):
+        """
+        Discards the partially written file.
+        """
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
 def extract_filename(step):
     """
     Extracts the filename from the step description.
@@ -442,22 +4734,10 @@ def extract_filename(step):
     Returns:
         str: The extracted filename, or None if not found.
     """
-    # Remove any markdown or formatting characters
-    step_clean = re.sub(r'[`*"]', '', step)
-    # Try to match patterns like 'in filename'
-    match = re.search(r'\b(?:in|to|into)\s+([\w./\\]+)', step_clean.lower())
-    if match:
-        filename = match.group(1)
-        # Remove any trailing punctuation
-        filename = filename.strip('.,;:')
-        return filename
-    # Try to match 'filename' directly
-    match = re.search(r'\b([\w./\\]+\.\w+)', step_clean.lower())
-    if match:
-        filename = match.group(1)
-        filename = filename.strip('.,;:')
-        return filename
-    return None
+    return parse_step(step).filename
+
+# Characters removed from file names by sanitize_filename.
+INVALID_FILENAME_CHARACTERS = re.compile(r'[^-_.() /\\a-zA-Z0-9]')
 
 def sanitize_filename(filename):
     """
@@ -469,9 +4749,8 @@ def sanitize_filename(filename):
     Returns:
         str: The sanitized filename.
     """
-    # Define a whitelist of allowed characters (alphanumeric and some special characters)
-    valid_chars = '-_.() /\\abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
-    sanitized = ''.join(c for c in filename if c in valid_chars)
+    # Keep a whitelist of allowed characters (alphanumeric and some special characters)
+    sanitized = INVALID_FILENAME_CHARACTERS.sub('', filename)
     # Replace spaces with underscores
     sanitized = sanitized.replace(' ', '_')
     return sanitized
@@ -490,63 +4769,806 @@ def is_non_text_file(filename):
     extension = filename.split('.')[-1].lower()
     return extension in non_text_extensions
 
-def create_project_folder(project_structure):
+def create_project_folder(project_structure, base_path=None):
     """
     Creates the project folder using the top-level directory from the project structure.
 
     Parameters:
         project_structure (dict): The project directory structure.
+        base_path (str): The directory to create the project folder in; defaults to the current directory.
 
     Returns:
-        tuple: The path to the created project folder and adjusted structure.
+        tuple: The path to the created project folder and the structure below it (ProjectTree).
     """
     # Get the top-level directory name from the project structure
     if len(project_structure) != 1:
         raise Exception("Project structure must have exactly one top-level directory.")
     top_level_dir = list(project_structure.keys())[0]
     sanitized_name = sanitize_filename(top_level_dir)
-    project_folder = os.path.join(os.getcwd(), sanitized_name)
+    project_folder = os.path.join(base_path or os.getcwd(), sanitized_name)
     os.makedirs(project_folder, exist_ok=True)
     print(f"Created project folder at: {project_folder}")
     # Return the project folder path and the adjusted project structure without the top-level directory
-    return project_folder, project_structure[top_level_dir]
+    return project_folder, ProjectTree(project_structure[top_level_dir])
 
-def create_directories(base_path, structure):
+def create_directories(base_path, structure, parallel=None, verbose=True):
     """
-    Recursively creates directories and placeholder files based on the given structure.
+    Creates the directories and placeholder files of the given structure.
+
+    The directories and files are computed first and then created in bulk: one makedirs call per
+    innermost directory, and the files from a thread pool for structures with more than
+    MATERIALIZE_PARALLEL_FILES files. Existing files are never overwritten, so running this
+    again on a project folder only adds what is missing.
 
     Parameters:
         base_path (str): The base path where directories should be created.
-        structure (dict): The nested dictionary representing directory structure.
-    """
-    for name, sub_structure in structure.items():
-        sanitized_name = sanitize_filename(name)
-        dir_path = os.path.join(base_path, sanitized_name)
-        if '.' in sanitized_name:
-            # It's a file
-            if is_non_text_file(sanitized_name):
-                # Create placeholder for non-text file
-                placeholder_filename = f"{sanitized_name}.replacement"
-                full_path = os.path.join(base_path, placeholder_filename)
-                with open(full_path, 'w', encoding='utf-8') as f:
-                    f.write(f"Placeholder for {sanitized_name}")
-                print(f"Created placeholder file for non-text file: {full_path}")
-            else:
-                # Create empty text file
-                with open(dir_path, 'w', encoding='utf-8') as f:
-                    f.write('')
-                print(f"Created file: {dir_path}")
+        structure (dict or ProjectTree): The project directory structure.
+        parallel (bool): Create the files from a thread pool; by default only for large structures.
+        verbose (bool): Print a summary of what was created.
+
+    Returns:
+        tuple: The numbers of directories, of created files and of files that already existed.
+    """
+    tree = as_tree(structure)
+    directories = tree.directories()
+    parents = {os.path.dirname(path) for path in directories}
+    files = []
+    for path in tree.files():
+        name = os.path.basename(path)
+        if is_non_text_file(name):
+            # Placeholder for non-text file
+            files.append((os.path.join(base_path, f"{path}.replacement"), f"Placeholder for {name}"))
+        else:
+            files.append((os.path.join(base_path, path), ''))
+    if parallel is None:
+        parallel = len(files) > MATERIALIZE_PARALLEL_FILES
+
+    with METRICS.stage('file_io'):
+        os.makedirs(base_path, exist_ok=True)
+        for path in directories:
+            if path not in parents:
+                os.makedirs(os.path.join(base_path, path), exist_ok=True)
+        if parallel:
+            with ThreadPoolExecutor() as executor:
+                created = sum(executor.map(lambda entry: create_file(*entry), files))
+        else:
+            created = sum(create_file(path, content) for path, content in files)
+    if verbose:
+        kept = f", kept {len(files) - created} existing files" if created < len(files) else ''
+        print(f"Created {len(directories)} directories and {created} files in {base_path}{kept}")
+    return len(directories), created, len(files) - created
+
+def create_file(path, content):
+    """
+    Creates a file with the given content unless the file already exists.
+
+    Parameters:
+        path (str): The path of the file.
+        content (str): The content of a new file.
+
+    Returns:
+        bool: True if the file was created.
+    """
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    except FileExistsError:
+        return False
+    try:
+        if content:
+            os.write(fd, content.encode('utf-8'))
+    finally:
+        os.close(fd)
+    return True
+
+def validate_structure(project_structure, max_files=BATCH_MAX_FILES):
+    """
+    Checks a project structure in place of the interactive confirmation.
+
+    Parameters:
+        project_structure (dict): The project directory structure.
+        max_files (int): Maximum number of files.
+
+    Returns:
+        list: The problems found; empty if the structure is acceptable.
+    """
+    if not project_structure:
+        return ["No project structure was returned."]
+    if len(project_structure) != 1:
+        return ["Project structure must have exactly one top-level directory."]
+    adjusted_structure = list(project_structure.values())[0]
+    if not isinstance(adjusted_structure, (dict, list)):
+        return ["The top-level entry of the project structure is not a directory."]
+    problems = []
+    paths = ProjectTree(adjusted_structure).files()
+    if not paths:
+        problems.append("Project structure contains no files.")
+    if len(paths) > max_files:
+        problems.append(f"Project structure has {len(paths)} files, more than the limit of {max_files}.")
+    for path in sorted(paths):
+        normalized = os.path.normpath(path)
+        if os.path.isabs(normalized) or normalized.split(os.sep)[0] == '..':
+            problems.append(f"Path escapes the project folder: {path}")
+    return problems
+
+def validate_plan(plan, max_steps=BATCH_MAX_STEPS):
+    """
+    Checks a plan in place of the interactive confirmation.
+
+    Parameters:
+        plan (list): The plan steps.
+        max_steps (int): Maximum number of steps.
+
+    Returns:
+        list: The problems found; empty if the plan is acceptable.
+    """
+    if not plan:
+        return ["The plan has no steps."]
+    if len(plan) > max_steps:
+        return [f"The plan has {len(plan)} steps, more than the limit of {max_steps}."]
+    return []
+
+def run_goal(goal, base_path, max_workers=MAX_WORKERS, max_files=BATCH_MAX_FILES, max_steps=BATCH_MAX_STEPS, progress=None):
+    """
+    Runs the whole pipeline for one goal without prompting, applying validation rules instead.
+
+    Parameters:
+        goal (str): The user's goal description.
+        base_path (str): The directory to create the project folder in.
+        max_workers (int): Maximum number of plan steps executed at the same time.
+        max_files (int): Maximum number of files in the project structure.
+        max_steps (int): Maximum number of plan steps.
+        progress (dict): If given, updated while the goal runs with its 'stage' ('structure', 'plan'
+            or 'steps') and its 'journal' once the journal exists.
+
+    Returns:
+        dict: The result record: status ('completed', 'rejected' or 'failed'), project folder,
+            journal, step counts, problems, error and elapsed seconds.
+    """
+    start = time.time()
+    record = {'goal': goal, 'status': 'failed', 'project_folder': None, 'journal': None,
+              'steps': 0, 'failed_steps': 0, 'problems': [], 'error': None}
+    progress = {} if progress is None else progress
+    try:
+        progress['stage'] = 'structure'
+        project_structure = determine_project_structure(goal)
+        record['problems'] = validate_structure(project_structure, max_files)
+        if record['problems']:
+            record['status'] = 'rejected'
+            return record
+        os.makedirs(base_path, exist_ok=True)
+        project_folder, adjusted_structure = create_project_folder(project_structure, base_path)
+        create_directories(project_folder, adjusted_structure)
+        journal = RunJournal.create(project_folder, goal, project_structure)
+        record['project_folder'] = project_folder
+        record['journal'] = journal.path
+        progress['journal'] = journal
+        filename_to_path = build_filename_to_path_mapping(adjusted_structure)
+        progress['stage'] = 'plan'
+        plan = decompose_goal(goal, project_structure)
+        record['problems'] = validate_plan(plan, max_steps)
+        if record['problems']:
+            record['status'] = 'rejected'
+            return record
+        journal.set_plan(plan)
+        progress['stage'] = 'steps'
+        execute_plan(plan, project_folder, adjusted_structure, filename_to_path, goal, max_workers=max_workers, journal=journal)
+        counts = journal.counts()
+        record['steps'] = len(plan)
+        record['failed_steps'] = counts.get('failed', 0) + counts.get('pending', 0)
+        record['status'] = 'completed'
+    except Exception as e:
+        record['error'] = str(e)
+    finally:
+        record['elapsed'] = round(time.time() - start, 3)
+        if record['project_folder'] is not None:
+            # Batch runs and the service run many goals in one process
+            forget_context_index(record['project_folder'])
+    return record
+
+def read_goals(path):
+    """
+    Reads a JSONL goals file. Each line is either a JSON string or an object with a "goal" key
+    and an optional "id". A goal without an id gets its line number, e.g. "0002". The ids name
+    the project directories, so they must be unique and safe as a single path component.
+
+    Parameters:
+        path (str): The path of the goals file.
+
+    Returns:
+        list: (id, goal) tuples in file order.
+    """
+    goals = []
+    seen = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if isinstance(entry, str):
+                entry = {'goal': entry}
+            goal_id = str(entry.get('id', f'{number:04d}'))
+            if not GOAL_ID_PATTERN.fullmatch(goal_id):
+                raise ValueError(f"Invalid goal id on line {number} of {path}: {goal_id!r} "
+                                 "(use letters, digits, '_', '-' and '.', not starting with '.' or '-')")
+            if goal_id in seen:
+                raise ValueError(f"Duplicate goal id on line {number} of {path}: {goal_id!r} is also the id of line {seen[goal_id]}")
+            seen[goal_id] = number
+            goals.append((goal_id, entry['goal']))
+    return goals
+
+def run_batch(goals_path, results_path, output_dir, jobs=2, max_workers=MAX_WORKERS, max_files=BATCH_MAX_FILES, max_steps=BATCH_MAX_STEPS):
+    """
+    Generates one project per goal of a goals file, several goals at a time.
+
+    All goals share the connection pool, the response cache and the global rate limit. Every
+    project is created in its own subdirectory of output_dir named after the goal's id, and a
+    result record is appended to results_path as soon as its goal finishes.
+
+    Parameters:
+        goals_path (str): The JSONL goals file.
+        results_path (str): The JSONL file the result records are written to.
+        output_dir (str): The directory the projects are created in.
+        jobs (int): Number of goals processed at the same time.
+        max_workers (int): Maximum number of plan steps of one goal executed at the same time.
+        max_files (int): Maximum number of files in a project structure.
+        max_steps (int): Maximum number of plan steps.
+
+    Returns:
+        list: The result records in goals file order.
+    """
+    goals = read_goals(goals_path)
+    output_dir = os.path.abspath(output_dir)
+    lock = threading.Lock()
+    results = {}
+
+    def run(goal_id, goal):
+        with call_tags(run=goal_id):
+            record = run_goal(goal, os.path.join(output_dir, goal_id), max_workers, max_files, max_steps)
+        record = dict(id=goal_id, **record)
+        with lock:
+            results[goal_id] = record
+            with open(results_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+        print(f"Goal {goal_id}: {record['status']}")
+        return record
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = [executor.submit(run, goal_id, goal) for goal_id, goal in goals]
+        for future in futures:
+            future.result()
+    return [results[goal_id] for goal_id, _ in goals]
+
+def report_run(logs, project_folder, journal=None):
+    """
+    Prints the execution logs and where the results are.
+
+    Parameters:
+        logs (list): The execution logs.
+        project_folder (str): The path to the project folder.
+        journal (RunJournal): The journal of the run, if any.
+    """
+    print("\nAll steps executed.")
+    print("\nExecution logs:")
+    for log in logs:
+        print(log)
+    if journal is not None:
+        failed = journal.counts().get('failed', 0)
+        if failed:
+            print(f"\n{failed} step(s) failed. Run again with --resume {journal.path} to retry them.")
+    summary = METRICS.summary()
+    if summary:
+        print("\nRun metrics:")
+        for line in summary:
+            print(line)
+    print(f"\nYour project files are located in: {project_folder}")
+
+def resume_run(path, max_workers=MAX_WORKERS):
+    """
+    Resumes a run from its journal, re-running only the steps that are pending or failed. Steps
+    the auto-approve policy rejected stay skipped. If the run was interrupted while its plan was
+    still arriving, the plan is requested again; steps of the interrupted run with the same
+    description keep their record, and new steps are checked with the policy of the run.
+
+    Parameters:
+        path (str): The journal file, or the project folder it belongs to.
+        max_workers (int): Maximum number of steps executed at the same time.
+    """
+    journal = RunJournal.load(path)
+    goal = journal.data['goal']
+    project_structure = journal.data['structure']
+    project_folder = journal.data['project_folder']
+    adjusted_structure = ProjectTree(project_structure[list(project_structure.keys())[0]])
+    # Recreates whatever is missing; existing files are kept
+    create_directories(project_folder, adjusted_structure)
+    filename_to_path = build_filename_to_path_mapping(adjusted_structure)
+    plan = journal.data['plan']
+    if not journal.plan_complete():
+        print("\nCreating a detailed plan..." if not plan else "\nThe plan of the run is incomplete; creating it again...")
+        plan = decompose_goal(goal, project_structure)
+        policy = journal.data.get('approve')
+        approved = [auto_approve_step(step, filename_to_path, policy) for step in plan] if policy else None
+        journal.set_plan(plan, approved)
+    counts = journal.counts()
+    print(f"\nResuming run for goal: {goal}")
+    print(f"{counts.get('done', 0)} of {len(plan)} steps already finished.")
+    rejected = sum(1 for index in range(len(plan)) if not journal.is_approved(index))
+    if rejected:
+        print(f"{rejected} step(s) not approved by the auto-approve policy are skipped.")
+    logs = execute_plan(plan, project_folder, adjusted_structure, filename_to_path, goal, max_workers=max_workers, journal=journal)
+    report_run(logs, project_folder, journal)
+
+class GenerationJob:
+    """
+    A goal submitted to the service, with its status, progress and log.
+    """
+
+    def __init__(self, job_id, goal, options):
+        """
+        Parameters:
+            job_id (str): The job id, also used as the 'run' call tag of its API calls.
+            goal (str): The user's goal description.
+            options (dict): The run_goal settings of the job: 'workers', 'max_files' and 'max_steps'.
+        """
+        self.id = job_id
+        self.goal = goal
+        self.options = options
+        self.status = 'queued'
+        self.record = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        # Filled in by run_goal: the current stage and the journal once it exists
+        self.progress = {}
+        self.output = []
+        self.condition = threading.Condition()
+
+    def write(self, text):
+        with self.condition:
+            self.output.append(text)
+            self.condition.notify_all()
+
+    def finish(self, status, record=None):
+        """
+        Marks the job as finished and wakes the readers of its log.
+
+        Parameters:
+            status (str): 'completed', 'rejected', 'failed' or 'cancelled'.
+            record (dict): The result record of run_goal, if the job ran.
+        """
+        with self.condition:
+            self.status = status
+            self.record = record
+            self.finished = time.time()
+            self.condition.notify_all()
+
+    def read_log(self, position, timeout=None):
+        """
+        Returns the output of the job after a position, waiting for more if there is none yet.
+
+        Parameters:
+            position (int): The number of output pieces already read.
+            timeout (float): Seconds to wait for new output; None returns at once.
+
+        Returns:
+            tuple: The new pieces of output, the new position and whether the job has finished.
+        """
+        with self.condition:
+            if timeout and position == len(self.output) and self.finished is None:
+                self.condition.wait(timeout)
+            return self.output[position:], len(self.output), self.finished is not None
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: The job as sent by the API: id, goal, options, status, times, progress and result.
+        """
+        progress = {'stage': self.progress.get('stage')}
+        journal = self.progress.get('journal')
+        if journal is not None:
+            counts = journal.counts()
+            progress.update(steps=sum(counts.values()), done=counts.get('done', 0), failed=counts.get('failed', 0))
+        return {'id': self.id, 'goal': self.goal, 'options': self.options, 'status': self.status,
+                'created': self.created, 'started': self.started, 'finished': self.finished,
+                'progress': progress, 'result': self.record}
+
+class GenerationService:
+    """
+    Runs the generation jobs of the service mode, SERVICE_JOBS at a time on a shared thread pool.
+
+    All jobs share the process: the connection pools, the response cache, the rate limits and
+    the validation pool stay warm between jobs. Every job creates its project in its own
+    subdirectory of the output directory named after the job id.
+    """
+
+    def __init__(self, output_dir, jobs=SERVICE_JOBS, max_workers=MAX_WORKERS, max_files=BATCH_MAX_FILES, max_steps=BATCH_MAX_STEPS):
+        """
+        Parameters:
+            output_dir (str): The directory the projects are created in.
+            jobs (int): Number of jobs run at the same time.
+            max_workers (int): Default maximum number of plan steps of one job executed at the same time.
+            max_files (int): Default maximum number of files in a project structure.
+            max_steps (int): Default maximum number of plan steps.
+        """
+        self.output_dir = os.path.abspath(output_dir)
+        self.defaults = {'workers': max_workers, 'max_files': max_files, 'max_steps': max_steps}
+        self.executor = ThreadPoolExecutor(max_workers=max(1, jobs), thread_name_prefix='x-engineer-job')
+        self.jobs = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, request):
+        """
+        Queues a job.
+
+        Parameters:
+            request (dict): The 'goal' and optionally 'workers', 'max_files' and 'max_steps'.
+
+        Returns:
+            GenerationJob: The queued job.
+        """
+        goal = request.get('goal')
+        if not isinstance(goal, str) or not goal.strip():
+            raise ValueError("The job has no goal.")
+        options = dict(self.defaults)
+        for name in options:
+            value = request.get(name, options[name])
+            if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+                raise ValueError(f"Invalid {name}: {value!r}")
+            options[name] = value
+        job = GenerationJob(uuid.uuid4().hex[:12], goal.strip(), options)
+        with self.lock:
+            self.jobs[job.id] = job
+        self.executor.submit(self.run, job)
+        return job
+
+    def run(self, job):
+        with self.lock:
+            if job.status != 'queued':
+                return
+            job.status = 'running'
+            job.started = time.time()
+        print(f"Job {job.id}: running")
+        try:
+            with call_tags(run=job.id):
+                record = run_goal(job.goal, os.path.join(self.output_dir, job.id), job.options['workers'],
+                                  job.options['max_files'], job.options['max_steps'], progress=job.progress)
+        except BaseException as e:
+            job.finish('failed', {'error': str(e)})
+            raise
+        job.finish(record['status'], record)
+        print(f"Job {job.id}: {record['status']}")
+        self.forget_finished()
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def cancel(self, job_id):
+        """
+        Cancels a queued job. Running jobs cannot be interrupted.
+
+        Parameters:
+            job_id (str): The job id.
+
+        Returns:
+            bool: True if the job was cancelled, False if it is already running or finished.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status != 'queued':
+                return False
+            job.status = 'cancelled'
+        job.finish('cancelled')
+        return True
+
+    def forget_finished(self, keep=SERVICE_MAX_FINISHED_JOBS):
+        """
+        Forgets the oldest finished jobs, and their metrics, beyond the given number.
+
+        Parameters:
+            keep (int): Number of finished jobs kept.
+        """
+        with self.lock:
+            finished = [job_id for job_id, job in self.jobs.items() if job.finished is not None]
+            forgotten = finished[:max(0, len(finished) - keep)]
+            for job_id in forgotten:
+                del self.jobs[job_id]
+        if forgotten:
+            METRICS.forget(set(forgotten))
+
+    def close(self):
+        """
+        Cancels the queued jobs and waits for the running ones.
+        """
+        for job in self.list():
+            self.cancel(job.id)
+        self.executor.shutdown(wait=True)
+
+class JobOutput:
+    """
+    Replaces sys.stdout in service mode. Text printed on behalf of a job, recognized by the 'run'
+    call tag, goes to the log of the job; everything else goes to the original stream.
+    """
+
+    def __init__(self, service, stream):
+        self.service = service
+        self.stream = stream
+
+    def write(self, text):
+        job_id = CALL_TAGS.get().get('run')
+        job = self.service.get(job_id) if job_id is not None else None
+        if job is None:
+            return self.stream.write(text)
+        job.write(text)
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    """
+    The JSON API of the service mode:
+
+        POST   /jobs           queue a job: {"goal": ..., "workers": ..., "max_files": ..., "max_steps": ...}
+        GET    /jobs           all jobs
+        GET    /jobs/<id>      status, progress and result of a job
+        GET    /jobs/<id>/log  the log of a job, streamed until it finishes (?follow=0 for the current log)
+        DELETE /jobs/<id>      cancel a queued job
+        GET    /metrics        the METRICS summary
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, data):
+        body = json.dumps(data, indent=4).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def find_job(self, parts):
+        job = self.server.service.get(parts[1]) if len(parts) > 1 else None
+        if job is None:
+            self.send_json(404, {'error': 'No such job.'})
+        return job
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split('/') if part]
+        if parts == ['metrics']:
+            self.send_json(200, {'summary': METRICS.summary()})
+        elif parts == ['jobs']:
+            self.send_json(200, [job.snapshot() for job in self.server.service.list()])
+        elif parts[:1] == ['jobs'] and len(parts) == 2:
+            job = self.find_job(parts)
+            if job is not None:
+                self.send_json(200, job.snapshot())
+        elif parts[:1] == ['jobs'] and len(parts) == 3 and parts[2] == 'log':
+            job = self.find_job(parts)
+            if job is not None:
+                self.stream_log(job, 'follow=0' not in url.query.split('&'))
         else:
-            # It's a directory
-            os.makedirs(dir_path, exist_ok=True)
-            print(f"Created directory: {dir_path}")
-            if sub_structure:
-                create_directories(dir_path, sub_structure)
+            self.send_json(404, {'error': 'Not found.'})
+
+    def do_POST(self):
+        parts = [part for part in urlsplit(self.path).path.split('/') if part]
+        if parts != ['jobs']:
+            self.send_json(404, {'error': 'Not found.'})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+            if not isinstance(request, dict):
+                raise ValueError("The request must be a JSON object.")
+            job = self.server.service.submit(request)
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        self.send_json(202, job.snapshot())
+
+    def do_DELETE(self):
+        parts = [part for part in urlsplit(self.path).path.split('/') if part]
+        if parts[:1] != ['jobs'] or len(parts) != 2:
+            self.send_json(404, {'error': 'Not found.'})
+            return
+        job = self.find_job(parts)
+        if job is None:
+            return
+        if self.server.service.cancel(job.id):
+            self.send_json(200, job.snapshot())
+        else:
+            self.send_json(409, {'error': f"The job is {job.status} and cannot be cancelled."})
+
+    def stream_log(self, job, follow):
+        """
+        Sends the log of a job as a chunked response, following it until the job finishes.
+
+        Parameters:
+            job (GenerationJob): The job.
+            follow (bool): Keep the response open until the job finishes.
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        position = 0
+        try:
+            while True:
+                pieces, position, finished = job.read_log(position, SERVICE_LOG_POLL if follow else None)
+                if pieces:
+                    self.write_chunk(''.join(pieces).encode('utf-8'))
+                elif finished or not follow:
+                    break
+            self.write_chunk(b'')
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading
+            self.close_connection = True
+
+    def write_chunk(self, data):
+        self.wfile.write(b'%x\r\n' % len(data) + data + b'\r\n')
+        self.wfile.flush()
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    An HTTP server on a Unix socket, for the service mode.
+    """
+    daemon_threads = True
+
+def create_service_server(address, service):
+    """
+    Creates the HTTP server of the service mode.
+
+    Parameters:
+        address (str): 'HOST:PORT', or 'unix:PATH' for a Unix socket.
+        service (GenerationService): The service answering the requests.
+
+    Returns:
+        socketserver.BaseServer: The server, bound but not yet serving.
+    """
+    if address.startswith('unix:'):
+        path = address[len('unix:'):]
+        if os.path.exists(path):
+            # Remove the socket of a service that is no longer running, but never a live one
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except OSError:
+                os.unlink(path)
+            else:
+                raise Exception(f"Error: a service is already listening on {path}")
+            finally:
+                probe.close()
+        server = UnixHTTPServer(path, ServiceRequestHandler)
+    else:
+        host, _, port = address.rpartition(':')
+        server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), ServiceRequestHandler)
+        server.daemon_threads = True
+    server.service = service
+    return server
+
+def serve(address, output_dir, jobs=SERVICE_JOBS, max_workers=MAX_WORKERS, max_files=BATCH_MAX_FILES, max_steps=BATCH_MAX_STEPS):
+    """
+    Runs the service mode: generation jobs are accepted over a local HTTP API until interrupted.
+
+    Parameters:
+        address (str): 'HOST:PORT', or 'unix:PATH' for a Unix socket.
+        output_dir (str): The directory the projects are created in.
+        jobs (int): Number of jobs run at the same time.
+        max_workers (int): Default maximum number of plan steps of one job executed at the same time.
+        max_files (int): Default maximum number of files in a project structure.
+        max_steps (int): Default maximum number of plan steps.
+    """
+    service = GenerationService(output_dir, jobs, max_workers, max_files, max_steps)
+    server = create_service_server(address, service)
+    stdout = sys.stdout
+    sys.stdout = JobOutput(service, stdout)
+    print(f"Serving generation jobs on {address}, projects are created in {service.output_dir}")
 
-def main():
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    # Stopping the service with SIGTERM shuts it down like Ctrl-C
+    previous_handler = signal.signal(signal.SIGTERM, stop)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down; waiting for the running jobs...")
+    finally:
+        server.server_close()
+        if address.startswith('unix:'):
+            with contextlib.suppress(OSError):
+                os.unlink(address[len('unix:'):])
+        try:
+            service.close()
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
+            sys.stdout = stdout
+
+def main(argv=None):
     """
     Main function to run the autonomous AI agent.
+
+    Parameters:
+        argv (list): Command line arguments; defaults to sys.argv[1:].
+    """
+    parser = argparse.ArgumentParser(description="Autonomous AI agent that generates a software project from a goal.")
+    parser.add_argument('--resume', metavar='JOURNAL', help="resume an interrupted run from its journal file or project folder")
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help="maximum number of plan steps executed at the same time")
+    parser.add_argument('--stream', action='store_true', help="stream responses and write files as they are generated")
+    parser.add_argument('--pipeline', action='store_true', help="stream the plan and execute each step as soon as it arrives, without the plan confirmation")
+    parser.add_argument('--approve', choices=('safe', 'all'), default='safe', help="which streamed steps run in --pipeline mode: 'safe' skips deletions and files outside the structure (default), 'all' runs every step")
+    parser.add_argument('--no-patch', action='store_true', help="regenerate updated files in full instead of asking for edits")
+    parser.add_argument('--no-validate', action='store_true', help="do not check the written files and regenerate those that do not compile or parse")
+    parser.add_argument('--prefetch', action='store_true', help="generate the plan and the first files while waiting for the confirmations")
+    parser.add_argument('--batch-files', type=int, default=GENERATION_BATCH_FILES, help="generate up to this many files of the same directory with one API call (default: 1)")
+    parser.add_argument('--goals', metavar='FILE', help="run headless: generate one project per goal of a JSONL file")
+    parser.add_argument('--results', metavar='FILE', default='results.jsonl', help="JSONL file for the batch result records (default: results.jsonl)")
+    parser.add_argument('--output-dir', default=os.getcwd(), help="directory the batch and service projects are created in")
+    parser.add_argument('--jobs', type=int, default=SERVICE_JOBS, help="number of goals processed at the same time in batch and service mode")
+    parser.add_argument('--serve', metavar='ADDRESS', nargs='?', const=SERVICE_ADDRESS, help=f"run as a service accepting generation jobs over a local HTTP API on HOST:PORT or unix:PATH (default: {SERVICE_ADDRESS})")
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default=BACKEND, help="where the API calls are sent: 'openai' for the OpenAI-compatible endpoint, 'local' for offline placeholder answers")
+    parser.add_argument('--model-route', metavar='ROUTE=MODEL', action='append', default=[], help=f"send the calls of a route ({', '.join(MODEL_ROUTE_NAMES)}) to another model; can be repeated")
+    parser.add_argument('--rpm', type=int, default=API_REQUESTS_PER_MINUTE, help="maximum API requests per minute across all goals (0: unlimited)")
+    parser.add_argument('--tpm', type=int, default=API_TOKENS_PER_MINUTE, help="maximum API tokens per minute across all goals (0: unlimited)")
+    parser.add_argument('--max-files', type=int, default=BATCH_MAX_FILES, help="reject project structures with more files in batch mode")
+    parser.add_argument('--max-steps', type=int, default=BATCH_MAX_STEPS, help="reject plans with more steps in batch mode")
+    parser.add_argument('--cache', choices=('on', 'off', 'replay'), help=f"use of the response cache in {CACHE_DIR}: 'on' reads and writes it, 'off' bypasses it, 'replay' answers only from it without calling the API (default: {CACHE_MODE})")
+    parser.add_argument('--metrics', metavar='FILE', help="write per-call latency and token metrics to a .json or .csv file")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    try:
+        run_main(args)
+    finally:
+        if args.metrics:
+            METRICS.export(args.metrics)
+            print(f"Metrics written to {args.metrics}")
+
+def run_main(args):
     """
+    Runs the mode selected on the command line.
+
+    Parameters:
+        args (argparse.Namespace): The parsed command line arguments.
+    """
+    global STREAMING, GENERATION_BATCH_FILES, PATCH_UPDATES, PREFETCH, VALIDATION, API_REQUESTS_PER_MINUTE, API_TOKENS_PER_MINUTE
+    if args.stream:
+        STREAMING = True
+    if args.no_patch:
+        PATCH_UPDATES = False
+    if args.prefetch:
+        PREFETCH = True
+    if args.no_validate:
+        VALIDATION = False
+    GENERATION_BATCH_FILES = args.batch_files
+    if args.cache:
+        configure_cache(args.cache)
+    configure_backend(args.backend, {**MODEL_ROUTES, **parse_model_routes(args.model_route)})
+    API_REQUESTS_PER_MINUTE = args.rpm
+    API_TOKENS_PER_MINUTE = args.tpm
+    if args.serve:
+        serve(args.serve, args.output_dir, args.jobs, args.workers, args.max_files, args.max_steps)
+        return
+    if args.goals:
+        try:
+            records = run_batch(args.goals, args.results, args.output_dir, args.jobs, args.workers, args.max_files, args.max_steps)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        completed = sum(1 for record in records if record['status'] == 'completed')
+        print(f"\n{completed} of {len(records)} goals completed. Results written to {args.results}")
+        for line in METRICS.summary():
+            print(line)
+        return
+    if args.resume:
+        resume_run(args.resume, args.workers)
+        return
     # Receive user goal
     goal = input("Please enter your software development goal:\n")
     # Determine project structure
@@ -558,6 +5580,27 @@ def main():
     # Output project structure for user confirmation
     print("\nProject Directory Structure:")
     print(json.dumps(project_structure, indent=4))
+    # Generate the plan and the first files while the user reads the structure and the plan.
+    # Pipelined runs stream the plan instead, and sequential runs give every step the files of all earlier steps.
+    prefetch = None
+    if PREFETCH and not args.pipeline and args.workers > 1 and len(project_structure) == 1:
+        prefetch = SpeculativePrefetch(goal, project_structure)
+    try:
+        run_confirmed(args, goal, project_structure, prefetch)
+    finally:
+        if prefetch is not None:
+            prefetch.discard()
+
+def run_confirmed(args, goal, project_structure, prefetch=None):
+    """
+    Asks the user to confirm the project structure and the plan, then executes the plan.
+
+    Parameters:
+        args (argparse.Namespace): The parsed command line arguments.
+        goal (str): The user's goal description.
+        project_structure (dict): The project directory structure.
+        prefetch (SpeculativePrefetch): The plan and files generated in the background, if any.
+    """
     # Ask user to confirm
     proceed = input("\nPlease confirm the above project directory structure is correct. Proceed? (y/n): ")
     if proceed.lower() != 'y':
@@ -568,11 +5611,20 @@ def main():
     # Create directories as per the project structure
     create_directories(project_folder, adjusted_structure)
     print("\nCreated project directories and placeholder files.")
+    # Record the run so that it can be resumed if it is interrupted
+    journal = RunJournal.create(project_folder, goal, project_structure)
     # Build filename to path mapping
     filename_to_path = build_filename_to_path_mapping(adjusted_structure)
+    if args.pipeline:
+        # Execute the steps while the plan is streamed, checked by the auto-approve policy
+        print(f"\nCreating a detailed plan and executing its steps as they arrive (approving {args.approve} steps)...")
+        plan, logs = execute_plan_pipelined(goal, project_structure, project_folder, adjusted_structure, filename_to_path,
+                                            max_workers=args.workers, journal=journal, policy=args.approve)
+        report_run(logs, project_folder, journal)
+        return
     # Decompose goal into a detailed plan
     print("\nCreating a detailed plan...")
-    plan = decompose_goal(goal, project_structure)
+    plan = prefetch.plan() if prefetch is not None else decompose_goal(goal, project_structure)
     # Output the detailed plan for user confirmation
     print("\nDetailed Plan:")
     for i, step in enumerate(plan):
@@ -581,16 +5633,17 @@ def main():
     if proceed.lower() != 'y':
         print("Operation cancelled.")
         return
+    journal.set_plan(plan)
+    prefetched = prefetch.commit(project_folder) if prefetch is not None else None
+    if prefetched:
+        print(f"\nUsing {len(prefetched)} file(s) generated while the plan was being confirmed.")
     # Execute plan
-    logs = execute_plan(plan, project_folder, adjusted_structure, filename_to_path, goal)
+    logs = execute_plan(plan, project_folder, adjusted_structure, filename_to_path, goal, max_workers=args.workers,
+                        journal=journal, prefetched=prefetched)
     # Provide final result
-    print("\nAll steps executed.")
-    print("\nExecution logs:")
-    for log in logs:
-        print(log)
+    report_run(logs, project_folder, journal)
     # Clean up temporary files if any
     # Implement cleanup logic here if needed
-    print(f"\nYour project files are located in: {project_folder}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,344 @@
+import os
+import sys
+import io
+import json
+import time
+import shutil
+import argparse
+import collections
+import tempfile
+import threading
+import contextlib
+import tracemalloc
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import X_Engineer
+
+# Offline benchmark of the X_Engineer pipeline. A local mock server answers the structure, plan and
+# file prompts with synthetic projects, so the numbers measure X_Engineer's own overhead (context
+# building, parsing, file I/O, scheduling) plus a configurable simulated model latency.
+# Usage: python benchmark.py --sizes 10 100 1000 --json results.json [--baseline old.json]
+
+# Files per package in the synthetic projects.
+FILES_PER_PACKAGE = 10
+
+# The mock server reports the longest prompt prefix shared with one of this many earlier requests
+# (with the same system message) as cached tokens, like a provider-side prompt cache.
+PREFIX_CACHE_ENTRIES = 64
+
+def synthetic_structure(num_files):
+    """
+    Builds a synthetic project structure with the given number of Python files.
+
+    Parameters:
+        num_files (int): The number of module files.
+
+    Returns:
+        dict: The project structure, with a top-level directory.
+    """
+    project = {"README.md": {}, "requirements.txt": {}, "main.py": {}}
+    for i in range(num_files):
+        package = f"pkg{i // FILES_PER_PACKAGE}"
+        project.setdefault(package, {"__init__.py": {}})[f"module_{i}.py"] = {}
+    return {"bench_project": project}
+
+def synthetic_plan(num_files):
+    """
+    Builds the plan text for a synthetic project: one step per module, then main.py and the README.
+
+    Parameters:
+        num_files (int): The number of module files.
+
+    Returns:
+        str: A numbered plan.
+    """
+    lines = []
+    for i in range(num_files):
+        package = f"pkg{i // FILES_PER_PACKAGE}"
+        lines.append(f"Implement the Component{i} class in {package}/module_{i}.py")
+    lines.append("Write the entry point in main.py")
+    lines.append("Update README.md with usage instructions")
+    return '\n'.join(f"{number}. {line}" for number, line in enumerate(lines, 1))
+
+def synthetic_module(step, lines):
+    """
+    Builds synthetic Python code for a step.
+
+    Parameters:
+        step (str): The step description.
+        lines (int): The approximate number of lines of code.
+
+    Returns:
+        str: The code.
+    """
+    name = ''.join(c for c in step.split(' class ')[0].split()[-1] if c.isalnum()) or 'Component'
+    body = [f'"""Generated for: {step}"""', '', f'class {name}:', f'    """{name} of the benchmark project."""', '']
+    for i in range(max(1, lines // 3)):
+        body.append(f'    def method_{i}(self, value):')
+        body.append(f'        return value * {i} + len(str(value))')
+        body.append('')
+    return '\n'.join(body)
+
+class SyntheticBackend(X_Engineer.LocalBackend):
+    """
+    Answers the prompts of X_Engineer with a synthetic project of the given size; the prompts are
+    recognized by X_Engineer.LocalBackend.
+    """
+
+    def __init__(self, files, lines):
+        """
+        Parameters:
+            files (int): The number of module files in the synthetic project.
+            lines (int): The approximate number of lines of each generated file.
+        """
+        super().__init__(latency=0)
+        self.files = files
+        self.lines = lines
+
+    def structure(self, goal):
+        return synthetic_structure(self.files)
+
+    def plan(self, structure):
+        return synthetic_plan(self.files)
+
+    def content(self, path, step):
+        return synthetic_module(step, self.lines) + '\n'
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    """
+    Answers OpenAI-compatible chat completion requests with synthetic content, after a delay.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        config = self.server.config
+        system = request['messages'][0]['content']
+        text = self.server.backend.answer(request['messages'])
+        prompt = json.dumps(request['messages'])
+        prompt_tokens = len(prompt) // 4
+        with self.server.lock:
+            earlier = self.server.prompts.setdefault(system, collections.deque(maxlen=PREFIX_CACHE_ENTRIES))
+            cached_tokens = max((X_Engineer.common_prefix_length(prompt, other) for other in earlier), default=0) // 4
+            earlier.append(prompt)
+            config['cached_tokens'] += cached_tokens
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': len(text) // 4,
+                 'total_tokens': prompt_tokens + len(text) // 4, 'prompt_tokens_details': {'cached_tokens': cached_tokens}}
+        latency = config['model_latency'].get(request['model'], config['latency'])
+        if not request.get('stream'):
+            time.sleep(latency)
+            body = json.dumps({'choices': [{'message': {'role': 'assistant', 'content': text}}], 'usage': usage}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        events = [{'choices': [{'delta': {'content': text[i:i + 64]}}]} for i in range(0, len(text), 64)]
+        events.append({'choices': [], 'usage': usage})
+        # Half of the latency before the first token, the rest spread over the response
+        time.sleep(latency / 2)
+        for event in events:
+            time.sleep(latency / 2 / len(events))
+            self.write_chunk(b'data: ' + json.dumps(event).encode('utf-8') + b'\n\n')
+        self.write_chunk(b'data: [DONE]\n\n')
+        self.write_chunk(b'')
+
+    def write_chunk(self, data):
+        self.wfile.write(b'%x\r\n' % len(data) + data + b'\r\n')
+        self.wfile.flush()
+
+class MockLLMServer:
+    """
+    A local mock of the chat completions API, run on a background thread.
+    """
+
+    def __init__(self, files=10, lines=60, latency=0.0, model_latency=None):
+        """
+        Parameters:
+            files (int): The number of module files in the synthetic project.
+            lines (int): The approximate number of lines of each generated file.
+            latency (float): Seconds each response is delayed by, to simulate the model.
+            model_latency (dict): Latency of the responses of particular models, overriding latency.
+        """
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), MockLLMHandler)
+        self.server.daemon_threads = True
+        self.server.config = {'latency': latency, 'model_latency': model_latency or {}, 'cached_tokens': 0}
+        self.server.backend = SyntheticBackend(files, lines)
+        self.server.prompts = {}
+        self.server.lock = threading.Lock()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/v1/chat/completions'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+def write_data_file(path, megabytes):
+    """
+    Writes a large log-like text file, as generated projects sometimes contain.
+
+    Parameters:
+        path (str): The path of the file.
+        megabytes (int): The size of the file in MiB.
+    """
+    line = 'INFO request handled in 12ms path=/api/items status=200\n' * 1024
+    with open(path, 'w', encoding='utf-8') as f:
+        for _ in range(megabytes * 1024 * 1024 // len(line)):
+            f.write(line)
+
+def run_benchmark(files, lines=60, latency=0.0, workers=X_Engineer.MAX_WORKERS, stream=False, batch_files=1, pipeline=False, data_mb=0,
+                  routes=None, model_latency=None):
+    """
+    Runs the full pipeline against the mock server on a synthetic project.
+
+    Parameters:
+        files (int): The number of module files in the synthetic project.
+        lines (int): The approximate number of lines of each generated file.
+        latency (float): Simulated model latency per request in seconds.
+        workers (int): Maximum number of plan steps executed at the same time.
+        stream (bool): Use streaming responses.
+        batch_files (int): Maximum number of files generated by one API call.
+        pipeline (bool): Stream the plan and execute steps as they arrive.
+        data_mb (int): Size in MiB of a data file placed in the project before the plan runs.
+        routes (dict): Models of the routes, see X_Engineer.MODEL_ROUTES.
+        model_latency (dict): Simulated latency of particular models, overriding latency.
+
+    Returns:
+        dict: The measurements.
+    """
+    work_dir = tempfile.mkdtemp(prefix='x_engineer_bench_')
+    goal = f"A benchmark project with {files} modules"
+    with MockLLMServer(files, lines, latency, model_latency) as server:
+        X_Engineer.configure_client(url=server.url, max_connections=max(8, workers))
+        X_Engineer.configure_backend('openai', routes or {})
+        X_Engineer.configure_cache(mode='off')
+        X_Engineer.STREAMING = stream
+        X_Engineer.GENERATION_BATCH_FILES = batch_files
+        X_Engineer.METRICS.reset()
+        tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                project_structure = X_Engineer.determine_project_structure(goal)
+                project_folder, adjusted_structure = X_Engineer.create_project_folder(project_structure, work_dir)
+                X_Engineer.create_directories(project_folder, adjusted_structure)
+                if data_mb:
+                    write_data_file(os.path.join(project_folder, 'data.txt'), data_mb)
+                filename_to_path = X_Engineer.build_filename_to_path_mapping(adjusted_structure)
+                if pipeline:
+                    plan, logs = X_Engineer.execute_plan_pipelined(goal, project_structure, project_folder, adjusted_structure,
+                                                                   filename_to_path, max_workers=workers)
+                else:
+                    plan = X_Engineer.decompose_goal(goal, project_structure)
+                    logs = X_Engineer.execute_plan(plan, project_folder, adjusted_structure, filename_to_path, goal, max_workers=workers)
+            elapsed = time.perf_counter() - start
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            cached_tokens = server.server.config['cached_tokens']
+        finally:
+            tracemalloc.stop()
+            shutil.rmtree(work_dir, ignore_errors=True)
+    records = X_Engineer.METRICS.snapshot()
+    stages = X_Engineer.METRICS.stage_times()
+    return {
+        'files': files,
+        'steps': len(plan),
+        'failed_steps': sum(1 for log in logs if log.startswith('Failed to execute step')),
+        'workers': workers,
+        'latency': latency,
+        'stream': stream,
+        'batch_files': batch_files,
+        'pipeline': pipeline,
+        'routes': routes or {},
+        'end_to_end': round(elapsed, 4),
+        'api_calls': len(records),
+        'api_time': round(sum(record['wall_time'] or 0 for record in records), 4),
+        'prompt_tokens': sum(record['prompt_tokens'] or 0 for record in records),
+        'cached_tokens': cached_tokens,
+        'context_time': round(stages.get('context', (0, 0.0))[1], 4),
+        'parsing_time': round(stages.get('parsing', (0, 0.0))[1], 4),
+        'file_io_time': round(stages.get('file_io', (0, 0.0))[1], 4),
+        'validation_time': round(stages.get('validation', (0, 0.0))[1], 4),
+        'peak_memory_mb': round(peak_memory / (1024 * 1024), 2)
+    }
+
+def compare(results, baseline, tolerance):
+    """
+    Compares benchmark results with a baseline.
+
+    Parameters:
+        results (list): The current results.
+        baseline (list): The baseline results.
+        tolerance (float): Allowed relative slowdown, e.g. 0.2 for 20%.
+
+    Returns:
+        list: Descriptions of the regressions found.
+    """
+    regressions = []
+    baseline_by_size = {entry['files']: entry for entry in baseline}
+    for result in results:
+        reference = baseline_by_size.get(result['files'])
+        if reference is None:
+            continue
+        for metric in ('end_to_end', 'context_time', 'parsing_time', 'file_io_time', 'validation_time', 'peak_memory_mb', 'prompt_tokens'):
+            old, new = reference.get(metric), result[metric]
+            if old and new > old * (1 + tolerance):
+                regressions.append(f"{result['files']} files: {metric} {old} -> {new} (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+def main(argv=None):
+    """
+    Runs the benchmark for each project size and prints a table of the results.
+
+    Parameters:
+        argv (list): Command line arguments; defaults to sys.argv[1:].
+    """
+    parser = argparse.ArgumentParser(description="Offline benchmark of the X_Engineer pipeline against a mock LLM server.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help="numbers of files of the synthetic projects")
+    parser.add_argument('--lines', type=int, default=60, help="approximate lines of code per generated file")
+    parser.add_argument('--latency', type=float, default=0.0, help="simulated model latency per request in seconds")
+    parser.add_argument('--workers', type=int, default=X_Engineer.MAX_WORKERS, help="maximum number of plan steps executed at the same time")
+    parser.add_argument('--stream', action='store_true', help="use streaming responses")
+    parser.add_argument('--batch-files', type=int, default=1, help="maximum number of files generated by one API call")
+    parser.add_argument('--pipeline', action='store_true', help="stream the plan and execute steps as they arrive")
+    parser.add_argument('--data-mb', type=int, default=0, help="size in MiB of a large text file placed in each project")
+    parser.add_argument('--model-route', metavar='ROUTE=MODEL', action='append', default=[], help="send a route of calls to another model, see X_Engineer --model-route")
+    parser.add_argument('--model-latency', metavar='MODEL=SECONDS', action='append', default=[], help="simulated latency of a model, overriding --latency")
+    parser.add_argument('--json', metavar='FILE', help="write the results to a JSON file")
+    parser.add_argument('--baseline', metavar='FILE', help="compare with the results of an earlier run and fail on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed relative slowdown against the baseline (default: 0.2)")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    routes = X_Engineer.parse_model_routes(args.model_route)
+    model_latency = {model: float(seconds) for model, seconds in X_Engineer.parse_model_routes(args.model_latency).items()}
+
+    columns = ('files', 'steps', 'failed_steps', 'api_calls', 'end_to_end', 'api_time', 'context_time', 'parsing_time', 'file_io_time', 'validation_time', 'prompt_tokens', 'cached_tokens', 'peak_memory_mb')
+    print(' '.join(f"{column:>14}" for column in columns))
+    results = []
+    for size in args.sizes:
+        result = run_benchmark(size, args.lines, args.latency, args.workers, args.stream, args.batch_files, args.pipeline, args.data_mb,
+                               routes, model_latency)
+        results.append(result)
+        print(' '.join(f"{result[column]:>14}" for column in columns))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
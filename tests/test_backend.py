@@ -0,0 +1,42 @@
+import pytest
+
+from X_Engineer import (
+    LocalBackend, ModelBackend, build_plan_messages, build_structure_messages, parse_project_structure, parse_subtasks,
+)
+
+
+def test_model_backend_is_abstract():
+    with pytest.raises(TypeError):
+        ModelBackend()
+
+    class Partial(ModelBackend):
+        async def complete(self, data, stats):
+            return {}
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_local_backend_answers_structure_and_plan():
+    backend = LocalBackend(latency=0)
+    structure = parse_project_structure(backend.answer(build_structure_messages("a todo app")))
+    assert list(structure) == ['a_todo_app']
+    plan = parse_subtasks(backend.answer(build_plan_messages("a todo app", structure)))
+    assert plan[0] == "Write the content of README.md"
+    assert len(plan) == 5
+
+
+def test_local_backend_subclass_overrides_answers():
+    class Custom(LocalBackend):
+        def structure(self, goal):
+            return {'demo': {'main.py': {}}}
+
+        def plan(self, structure):
+            return "1. Write the entry point in main.py"
+
+    backend = Custom(latency=0)
+    structure = parse_project_structure(backend.answer(build_structure_messages("anything")))
+    assert structure == {'demo': {'main.py': {}}}
+    assert parse_subtasks(backend.answer(build_plan_messages("anything", structure))) == [
+        "Write the entry point in main.py"
+    ]
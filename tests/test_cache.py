@@ -0,0 +1,58 @@
+import json
+import os
+import time
+
+import pytest
+
+from X_Engineer import ResponseCache
+
+
+RESPONSE = {'choices': [{'message': {'role': 'assistant', 'content': 'hello'}}], 'usage': {'total_tokens': 3}}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path), max_bytes=1024 * 1024, max_age=60)
+
+
+def write_entry(cache, key, text):
+    path = cache.path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return path
+
+
+def test_put_and_get(cache):
+    key = ResponseCache.key({'model': 'm', 'messages': [], 'stream': False})
+    assert cache.get(key) is None
+    cache.put(key, RESPONSE)
+    assert cache.get(key) == RESPONSE
+    assert key == ResponseCache.key({'model': 'm', 'messages': [], 'stream': True})
+
+
+@pytest.mark.parametrize('text', [
+    '',
+    '{"created": 1',
+    '[]',
+    '"response"',
+    json.dumps({'created': time.time()}),
+    json.dumps({'response': RESPONSE}),
+    json.dumps({'created': 'yesterday', 'response': RESPONSE}),
+    json.dumps({'created': time.time(), 'response': None}),
+    json.dumps({'created': time.time(), 'response': {'choices': []}}),
+    json.dumps({'created': time.time(), 'response': {'choices': [{'message': {'content': None}}]}}),
+])
+def test_malformed_entries_are_misses(cache, text):
+    key = 'ab' + '0' * 62
+    write_entry(cache, key, text)
+    assert cache.get(key) is None
+    cache.put(key, RESPONSE)
+    assert cache.get(key) == RESPONSE
+
+
+def test_expired_entries_are_removed(cache):
+    key = 'cd' + '0' * 62
+    path = write_entry(cache, key, json.dumps({'created': time.time() - 120, 'response': RESPONSE}))
+    assert cache.get(key) is None
+    assert not os.path.exists(path)
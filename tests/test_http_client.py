@@ -0,0 +1,199 @@
+import json
+import time
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import X_Engineer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answers by path: /json with a JSON body, /sse with chunked server-sent events, /limited with
+    429 and Retry-After for the first request, /close with a body after which the connection is
+    closed without notice, as servers do with idle connections.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        with self.server.lock:
+            self.server.requests.append((self.path, self.headers.get('Host')))
+            hits = len(self.server.requests)
+        if self.path.endswith('/sse'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            events = b''.join(b'data: ' + json.dumps({'choices': [{'delta': {'content': piece}}]}).encode() + b'\n\n'
+                              for piece in ('Hel', 'lo', ' world'))
+            # Chunk boundaries in the middle of events
+            for i in range(0, len(events), 7):
+                self.write_chunk(events[i:i + 7])
+            self.write_chunk(b'data: [DONE]\n\n')
+            self.write_chunk(b'')
+            return
+        if self.path.endswith('/limited') and hits == 1:
+            self.send_json(429, {'error': 'rate limited'}, {'Retry-After': '0.3'})
+            return
+        if self.path.endswith('/limited'):
+            self.send_json(200, {'choices': [{'message': {'role': 'assistant', 'content': 'done'}}], 'usage': {}})
+            return
+        self.send_json(200, {'path': self.path})
+        if self.path.endswith('/close'):
+            self.close_connection = True
+
+    do_GET = do_POST
+
+    def do_CONNECT(self):
+        self.send_response(403)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def write_chunk(self, data):
+        self.wfile.write(b'%x\r\n' % len(data) + data + b'\r\n')
+        self.wfile.flush()
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f'http://127.0.0.1:{server.server_port}'
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_proxy(monkeypatch):
+    for name in ('http_proxy', 'HTTP_PROXY', 'https_proxy', 'HTTPS_PROXY', 'no_proxy', 'NO_PROXY'):
+        monkeypatch.delenv(name, raising=False)
+
+
+async def fetch(client, path):
+    response = client.stream('POST', path, b'{}', {'Content-Type': 'application/json'})
+    status, headers = await response.__anext__()
+    body = b''.join([chunk async for chunk in response])
+    return status, body
+
+
+def test_connections_are_pooled(server):
+    async def run():
+        client = X_Engineer.AsyncHTTPClient(server.url, max_connections=2)
+        for _ in range(5):
+            assert (await fetch(client, '/json'))[0] == 200
+        results = await asyncio.gather(*(fetch(client, '/json') for _ in range(8)))
+        await client.close()
+        return results
+
+    results = asyncio.run(run())
+    assert all(status == 200 for status, _ in results)
+    assert server.connections <= 2
+
+
+def test_chunked_server_sent_events(server):
+    async def run():
+        client = X_Engineer.AsyncHTTPClient(server.url)
+        response = client.stream('POST', '/sse', b'{}')
+        status, headers = await response.__anext__()
+        events = [event async for event in X_Engineer.iter_sse_events(response)]
+        await response.aclose()
+        await client.close()
+        return status, events
+
+    status, events = asyncio.run(run())
+    assert status == 200
+    assert ''.join(event['choices'][0]['delta']['content'] for event in events) == 'Hello world'
+
+
+def test_reconnects_after_idle_connection_is_closed(server):
+    async def run():
+        client = X_Engineer.AsyncHTTPClient(server.url)
+        first = await fetch(client, '/close')
+        # Let the server close the pooled connection
+        await asyncio.sleep(0.1)
+        second = await fetch(client, '/json')
+        await client.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first[0] == second[0] == 200
+    assert server.connections == 2
+
+
+def test_retries_rate_limited_request_after_retry_after(server, monkeypatch):
+    url, cache_mode = X_Engineer.API_URL, X_Engineer.CACHE_MODE
+    monkeypatch.setattr(X_Engineer, 'API_BACKOFF_BASE', 0.001)
+    X_Engineer.configure_client(url=server.url + '/v1/limited')
+    X_Engineer.configure_cache(mode='off')
+    X_Engineer.configure_backend('openai')
+    try:
+        start = time.perf_counter()
+        assert X_Engineer.call_grok_api([{'role': 'user', 'content': 'hi'}]) == 'done'
+        elapsed = time.perf_counter() - start
+    finally:
+        X_Engineer.configure_client(url=url)
+        X_Engineer.configure_cache(mode=cache_mode)
+    assert len(server.requests) == 2
+    assert elapsed >= 0.3
+    assert X_Engineer.METRICS.snapshot()[-1]['retries'] == 1
+
+
+def test_host_header():
+    assert X_Engineer.AsyncHTTPClient('https://api.x.ai/v1/chat/completions').host_header == 'api.x.ai'
+    assert X_Engineer.AsyncHTTPClient('http://localhost:8080/v1').host_header == 'localhost:8080'
+    assert X_Engineer.AsyncHTTPClient('http://[::1]:8080/v1').host_header == '[::1]:8080'
+    assert X_Engineer.AsyncHTTPClient('http://[::1]/v1').host_header == '[::1]'
+
+
+def test_sends_host_header_with_port(server):
+    asyncio.run(fetch(X_Engineer.AsyncHTTPClient(server.url), '/json'))
+    assert server.requests == [('/json', f'127.0.0.1:{server.server_port}')]
+
+
+def test_http_proxy_from_environment(server, monkeypatch):
+    monkeypatch.setenv('HTTP_PROXY', server.url)
+    client = X_Engineer.AsyncHTTPClient('http://api.example.invalid:8081/v1/chat')
+    assert asyncio.run(fetch(client, '/v1/chat'))[0] == 200
+    assert server.requests == [('http://api.example.invalid:8081/v1/chat', 'api.example.invalid:8081')]
+
+
+def test_no_proxy_bypasses_proxy(monkeypatch):
+    monkeypatch.setenv('HTTPS_PROXY', 'http://proxy.invalid:3128')
+    monkeypatch.setenv('NO_PROXY', 'api.x.ai')
+    assert X_Engineer.AsyncHTTPClient('https://api.x.ai/v1').proxy is None
+    assert X_Engineer.AsyncHTTPClient('https://other.example/v1').proxy.hostname == 'proxy.invalid'
+
+
+def test_https_through_proxy_reports_refused_tunnel(server, monkeypatch):
+    monkeypatch.setenv('HTTPS_PROXY', server.url)
+    client = X_Engineer.AsyncHTTPClient('https://api.example.invalid/v1')
+    with pytest.raises(X_Engineer.GrokAPIError) as error:
+        asyncio.run(fetch(client, '/v1'))
+    assert error.value.status == 403
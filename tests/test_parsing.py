@@ -0,0 +1,180 @@
+import ast
+import os
+import random
+
+import pytest
+
+from X_Engineer import (
+    PathIndex, StreamingContentWriter, apply_edit, build_filename_to_path_mapping, check_python_imports,
+    find_explicit_dependencies, parse_content_from_response, parse_edits, parse_step, read_patch_target,
+)
+
+
+def test_parse_search_replace_blocks():
+    response = (
+        "Here is the change:\n"
+        "<<<<<<< SEARCH\n"
+        "def f():\n"
+        "    return 1\n"
+        "=======\n"
+        "def f():\n"
+        "    return 2\n"
+        ">>>>>>> REPLACE\n"
+        "<<<<<<< SEARCH\n"
+        "=======\n"
+        "print(f())\n"
+        ">>>>>>> REPLACE\n"
+    )
+    assert parse_edits(response) == [
+        ("def f():\n    return 1", "def f():\n    return 2"),
+        ("", "print(f())"),
+    ]
+
+
+def test_parse_unified_diff_hunks():
+    response = (
+        "--- a/app.py\n"
+        "+++ b/app.py\n"
+        "@@ -1,3 +1,3 @@\n"
+        " import os\n"
+        "-x = 1\n"
+        "+x = 2\n"
+        "\n"
+        "@@ -10,2 +10,2 @@\n"
+        "-y = 1\n"
+        "+y = 3\n"
+    )
+    assert parse_edits(response) == [("import os\nx = 1", "import os\nx = 2"), ("y = 1", "y = 3")]
+
+
+@pytest.mark.parametrize('step, patched', [
+    ("Update app.py with the new routes", True),
+    ("Add logging to app.py", True),
+    ("Fixed the parser in app.py", True),
+    ("Modifying app.py to use the cache", True),
+    ("Refactors app.py", True),
+    ("Write app.py to address the login flow", False),
+    ("Write additional helpers in app.py", False),
+    ("Write the changelog parser in app.py", False),
+    ("Write the editor widget in app.py", False),
+    ("Write the test fixtures in app.py", False),
+])
+def test_read_patch_target_verbs(tmp_path, step, patched):
+    path = tmp_path / 'app.py'
+    path.write_text('x = 1\n' * 500)
+    assert (read_patch_target(step, str(path)) is not None) == patched
+
+
+def test_apply_edit_exact_match():
+    assert apply_edit("a = 1\nb = 2\n", "b = 2", "b = 3") == "a = 1\nb = 3\n"
+
+
+def test_apply_edit_removes_whole_lines():
+    assert apply_edit("a = 1\nb = 2\nc = 3\n", "b = 2", "") == "a = 1\nc = 3\n"
+
+
+def test_apply_edit_appends_on_empty_search():
+    assert apply_edit("a = 1", "", "b = 2") == "a = 1\nb = 2\n"
+
+
+def test_apply_edit_reindents_whitespace_match():
+    content = "class A:\n    def f(self):\n        return 1\n"
+    assert apply_edit(content, "def f(self):\n    return 1", "def f(self):\n    return 2") == \
+        "class A:\n    def f(self):\n        return 2\n"
+
+
+def test_apply_edit_fuzzy_match():
+    content = "def total(items):\n    return sum(item.price for item in items)\n"
+    search = "def total(items):\n    return sum(item.price for item in item)"
+    assert apply_edit(content, search, "def total(items):\n    return 0") == "def total(items):\n    return 0\n"
+
+
+def test_apply_edit_rejects_unrelated_text():
+    assert apply_edit("a = 1\nb = 2\n", "completely different\ntext here", "x") is None
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_streaming_writer_matches_parser(tmp_path, seed):
+    # Random responses made of fences, language names, line endings and text, fed in random pieces
+    pieces = ['```', '``', '`', 'py', 'python\n', '\n', '\r\n', '\r', ' ', 'x = 1', 'é', '\t']
+    rng = random.Random(seed)
+    path = str(tmp_path / 'out.py')
+    for _ in range(500):
+        response = ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 30)))
+        writer = StreamingContentWriter(path)
+        position = 0
+        while position < len(response):
+            size = rng.randint(1, 6)
+            writer.feed(response[position:position + size])
+            position += size
+        writer.finish()
+        with open(path, 'rb') as file:
+            assert file.read().decode('utf-8') == parse_content_from_response(response), repr(response)
+
+
+def test_streaming_writer_abort_leaves_no_file(tmp_path):
+    path = str(tmp_path / 'out.py')
+    writer = StreamingContentWriter(path)
+    writer.feed("```python\nx = 1\n")
+    writer.abort()
+    assert os.listdir(tmp_path) == []
+
+
+def test_path_index_resolves_suffixes_and_case():
+    index = PathIndex(['src/app.py', 'README.md'])
+    assert index.resolve('app.py') == os.path.join('src', 'app.py')
+    assert index.resolve('SRC/App.py') == os.path.join('src', 'app.py')
+    assert index.resolve('project/src/app.py') == os.path.join('src', 'app.py')
+    assert index.resolve('missing.py') is None
+
+
+def test_path_index_uses_step_words_for_shared_names():
+    index = PathIndex(['pkg1/config.py', 'pkg2/config.py'])
+    assert index.resolve('config.py', {'pkg2'}) == os.path.join('pkg2', 'config.py')
+    assert index.resolve('pkg1/config.py') == os.path.join('pkg1', 'config.py')
+
+
+def test_parse_step_kind_and_target():
+    filename_to_path = build_filename_to_path_mapping({'pkg1': {'config.py': None}, 'pkg2': {'config.py': None},
+                                                      'main.py': None})
+    intent = parse_step("Add config.py to pkg2 and import it in main.py", filename_to_path)
+    assert intent.kind == 'write'
+    assert intent.target == 'main.py'
+    assert os.path.join('pkg2', 'config.py') in intent.references
+
+    intent = parse_step("Update `pkg1/config.py` with the defaults", filename_to_path)
+    assert (intent.kind, intent.target) == ('write', os.path.join('pkg1', 'config.py'))
+
+    assert parse_step("Delete main.py", filename_to_path).kind == 'delete'
+    assert parse_step("Run the tests, e.g. with pytest", filename_to_path).target is None
+
+
+def test_parse_step_new_files_and_dotfiles():
+    intent = parse_step("Create a .gitignore for the project")
+    assert (intent.kind, intent.filename) == ('write', '.gitignore')
+    assert parse_step("Write the models in app/models.py").filename == 'app/models.py'
+
+
+def test_find_explicit_dependencies():
+    assert find_explicit_dependencies("Run the app after step 3") == {2}
+    assert find_explicit_dependencies("Deploy once steps 4 and 5 are done") == {3, 4}
+    assert find_explicit_dependencies("Write main.py") == set()
+
+
+def check(rel_path, source, paths):
+    return check_python_imports(rel_path, ast.parse(source), frozenset(paths))
+
+
+def test_check_python_imports_resolves_project_modules():
+    paths = ['app/__init__.py', 'app/models.py', 'app/views.py', 'src/lib/util.py', 'main.py']
+    assert check('main.py', "import os\nimport requests\nfrom app import models\nimport app.views\n", paths) == []
+    assert check('main.py', "from lib.util import helper\n", paths) == []
+    assert check(os.path.join('app', 'views.py'), "from .models import User\nfrom . import models\nimport models\n", paths) == []
+
+
+def test_check_python_imports_reports_missing_modules():
+    paths = ['app/__init__.py', 'app/models.py', 'main.py']
+    errors = check('main.py', "import os\nfrom app.forms import Form\n", paths)
+    assert len(errors) == 1 and errors[0].startswith("line 2: cannot resolve import of 'app.forms'")
+    errors = check(os.path.join('app', 'models.py'), "from .db import Base\nfrom ... import x\n", paths)
+    assert [error.split(':')[0] for error in errors] == ['line 1', 'line 2']
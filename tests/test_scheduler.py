@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pytest
+
+from X_Engineer import StepScheduler, build_filename_to_path_mapping
+
+
+STRUCTURE = {'a.py': None, 'b.py': None, 'c.py': None}
+
+
+class Recorder:
+    """
+    A run_step for StepScheduler that records when each step starts and ends.
+    """
+
+    def __init__(self, delays=None):
+        self.delays = delays or {}
+        self.lock = threading.Lock()
+        self.events = []
+
+    def __call__(self, indices, steps):
+        with self.lock:
+            self.events.append(('start', indices[0]))
+        time.sleep(self.delays.get(indices[0], 0.05))
+        with self.lock:
+            self.events.append(('end', indices[0]))
+        return [f"Executing step: {step}" for step in steps]
+
+    def position(self, event, index):
+        return self.events.index((event, index))
+
+    def ran_after(self, later, earlier):
+        return self.position('start', later) > self.position('end', earlier)
+
+
+def run(steps, delays=None, max_workers=4):
+    recorder = Recorder(delays)
+    scheduler = StepScheduler(recorder, build_filename_to_path_mapping(STRUCTURE), max_workers=max_workers)
+    for step in steps:
+        scheduler.add(step)
+    return recorder, scheduler.close()
+
+
+def test_independent_steps_run_concurrently():
+    recorder, _ = run(["Write a.py", "Write b.py"], delays={0: 0.2, 1: 0.2})
+    assert recorder.position('start', 1) < recorder.position('end', 0)
+
+
+def test_write_after_write():
+    recorder, _ = run(["Write a.py", "Update a.py"], delays={0: 0.2})
+    assert recorder.ran_after(1, 0)
+
+
+def test_read_after_write():
+    recorder, _ = run(["Write a.py", "Write b.py that imports a.py"], delays={0: 0.2})
+    assert recorder.ran_after(1, 0)
+
+
+def test_write_after_read():
+    recorder, _ = run(["Write b.py that imports a.py", "Update a.py"], delays={0: 0.2})
+    assert recorder.ran_after(1, 0)
+
+
+def test_explicit_dependency():
+    recorder, _ = run(["Write a.py", "Run the tests after step 1"], delays={0: 0.2})
+    assert recorder.ran_after(1, 0)
+
+
+def test_logs_in_plan_order(capsys):
+    _, logs = run(["Write a.py", "Write b.py", "Write c.py"], delays={0: 0.3, 1: 0.1, 2: 0.01})
+    assert logs == ["Executing step: Write a.py", "Executing step: Write b.py", "Executing step: Write c.py"]
+    printed = [line for line in capsys.readouterr().out.splitlines() if line]
+    assert printed == logs
+
+
+def test_failed_step_is_logged_and_releases_dependents():
+    def run_step(indices, steps):
+        if indices[0] == 0:
+            raise RuntimeError("boom")
+        return [f"Executing step: {steps[0]}"]
+
+    scheduler = StepScheduler(run_step, build_filename_to_path_mapping(STRUCTURE))
+    scheduler.add("Write a.py")
+    scheduler.add("Update a.py")
+    assert scheduler.close() == ["Executing step: Write a.py", "Failed to execute step: boom",
+                                 "Executing step: Update a.py"]
+
+
+def test_interrupt_cancels_steps_not_started(monkeypatch):
+    recorder = Recorder({0: 0.2, 1: 0.2, 2: 0.2})
+    scheduler = StepScheduler(recorder, build_filename_to_path_mapping(STRUCTURE), max_workers=1)
+
+    class InterruptedCondition:
+        def wait(self):
+            raise KeyboardInterrupt
+
+        def notify_all(self):
+            pass
+
+    monkeypatch.setattr(scheduler, 'all_done', InterruptedCondition())
+    for step in ["Write a.py", "Write b.py", "Write c.py"]:
+        scheduler.add(step)
+    with pytest.raises(KeyboardInterrupt):
+        scheduler.close()
+    time.sleep(0.5)
+    assert ('start', 0) in recorder.events
+    assert ('start', 2) not in recorder.events
+
+
+def test_grouped_steps_form_one_unit():
+    recorder = Recorder()
+    scheduler = StepScheduler(recorder, build_filename_to_path_mapping(STRUCTURE))
+    scheduler.add(["Write a.py", "Write b.py"], [0, 1])
+    scheduler.add("Update b.py", [2])
+    scheduler.close()
+    assert recorder.ran_after(2, 0)
+    assert ('start', 1) not in recorder.events
+